@@ -0,0 +1,331 @@
+from poker import create_app
+from poker.model.poker_model import Game, new_player
+from poker.repo.poker_repo import get_game, get_players
+from poker.repo.schema import create_schema
+from poker.service.simulator import DatabaseSink, new_sim_game, next_to_act
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import dataset
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Each benchmark is a function that does its setup and returns the callable
+# to time. Results are written as JSON so a later run can be compared with
+# --compare to flag regressions.
+
+BENCHMARKS = {}
+# HTTP clients made by the current benchmark, closed when it finishes.
+CLIENTS = []
+
+
+def benchmark(group):
+    def register(f):
+        BENCHMARKS[f.__name__] = (group, f)
+        return f
+    return register
+
+
+def sim_game(num_players, seed=1) -> Game:
+    game = new_sim_game('bench', 50, num_players, random.Random(seed))
+    for i in range(num_players):
+        game.join(new_player('bench', str(i), i + 1, 10 ** 9))
+    game.save(None)
+    return game
+
+
+def db_game(num_players):
+    db = dataset.connect('sqlite://')
+    create_schema(db)
+    game = new_sim_game('bench', 50, num_players, random.Random(1))
+    sink = DatabaseSink(db)
+    sink.save(game)
+    for i in range(num_players):
+        game.join(new_player('bench', str(i), i + 1, 10 ** 9))
+        sink.save(game)
+    return db, game
+
+
+def play_check_call(game: Game, db=None):
+    player = next_to_act(game)
+    game.act(db, 'check_call', player.user_id)
+
+
+@benchmark('micro')
+def shuffle_deck():
+    game = sim_game(6)
+    return game.shuffle_deck
+
+
+@benchmark('micro')
+def deal_hands():
+    game = sim_game(6)
+
+    def run():
+        game.deck.reset()
+        game.deal_hands()
+    return run
+
+
+@benchmark('micro')
+def deal_board():
+    game = sim_game(6)
+
+    def run():
+        game.deck.reset()
+        game.board.clear()
+        game.deal_flop()
+        game.deal_turn_river()
+        game.deal_turn_river()
+    return run
+
+
+@benchmark('micro')
+def players_queries():
+    players = sim_game(9).players
+
+    def run():
+        players.get_sitting_players()
+        players.get_live_players()
+        players.highest_bet()
+        players.all_have_acted()
+        players.bets_are_equal()
+    return run
+
+
+@benchmark('micro')
+def game_act_in_memory():
+    game = sim_game(6)
+    return lambda: play_check_call(game)
+
+
+@benchmark('micro')
+def game_act_with_update_db():
+    db, game = db_game(6)
+    return lambda: play_check_call(game, db)
+
+
+@benchmark('micro')
+def update_db_one_player():
+    db, game = db_game(6)
+    player = game.players.players[0]
+
+    def run():
+        player.stack += 1
+        game.update_db(db)
+    return run
+
+
+class Client:
+    def __init__(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        url = 'sqlite:///{}'.format(os.path.join(self.dir, 'bench.db'))
+        self.app = create_app({'ENV': 'BENCH', 'DBCONN': url})
+        self.client = self.app.test_client()
+        self.count = 0
+        CLIENTS.append(self)
+
+    def close(self):
+        for name in ('table_executor', 'password_hasher'):
+            if name in self.app.extensions:
+                self.app.extensions[name].shutdown()
+        self.tmp.cleanup()
+
+    def register(self):
+        self.count += 1
+        name = 'user{}'.format(self.count)
+        rv = self.client.post('api/user/register',
+                              json={'username': name, 'password': name,
+                                    'email': name + '@bench.com'})
+        assert rv.status_code < 300, rv.data
+        return name
+
+    def login(self, name):
+        rv = self.client.post('api/user/login', json={'username': name, 'password': name})
+        assert rv.status_code == 200, rv.data
+        return {'x-access-token': rv.json['auth_token']}
+
+    def create_game(self, headers, num_seats=2):
+        rv = self.client.post('api/poker/', headers=headers,
+                              json={'game_type': 'texas_holdem', 'num_seats': num_seats,
+                                    'big_blind': 50, 'small_blind': 25,
+                                    'min_buyin': 100, 'max_buyin': 10 ** 9,
+                                    'table_name': 'bench'})
+        assert rv.status_code == 201, rv.data
+        return rv.json['game_id']
+
+    def join(self, game_id, headers, seat_num):
+        rv = self.client.post('api/poker/{}/player/'.format(game_id), headers=headers,
+                              json={'seat_num': seat_num, 'buyin': 10 ** 9})
+        assert rv.status_code == 200, rv.data
+        return rv.json
+
+
+@benchmark('http')
+def http_register():
+    return Client().register
+
+
+@benchmark('http')
+def http_login():
+    client = Client()
+    name = client.register()
+    return lambda: client.login(name)
+
+
+@benchmark('http')
+def http_login_concurrent():
+    # Time per batch of 16 logins from 16 threads; how this compares with
+    # 16 times http_login shows how much the hasher pool lets overlap.
+    client = Client()
+    names = [client.register() for _ in range(16)]
+    pool = ThreadPoolExecutor(len(names))
+    return lambda: list(pool.map(client.login, names))
+
+
+@benchmark('http')
+def http_join():
+    client = Client()
+    headers = client.login(client.register())
+
+    def run():
+        client.join(client.create_game(headers), headers, 1)
+    return run
+
+
+@benchmark('http')
+def http_lobby():
+    client = Client()
+    headers = client.login(client.register())
+    for _ in range(100):
+        client.create_game(headers)
+
+    def run():
+        rv = client.client.get('api/poker/?limit=50&min_free_seats=1')
+        assert rv.status_code == 200, rv.data
+    return run
+
+
+@benchmark('http')
+def http_check_call():
+    client = Client()
+    headers = [client.login(client.register()) for _ in range(2)]
+    game_id = client.create_game(headers[0])
+    user_ids = {}
+    for seat_num, h in enumerate(headers, 1):
+        user_ids[client.join(game_id, h, seat_num)['user_id']] = h
+    db = dataset.connect('sqlite:///{}'.format(os.path.join(client.dir, 'bench.db')))
+    # The engine doesn't track whose turn it is and the response has no body,
+    # so the simulator follows a copy of the table, read once here. Everyone
+    # only checks or calls with deep stacks, so the cards don't change the order.
+    game = Game(get_game(db, game_id), get_players(db, game_id))
+    db.close()
+
+    def run():
+        user_id = next_to_act(game).user_id
+        rv = client.client.get('api/poker/{}/player/check_call'.format(game_id),
+                               headers=user_ids[user_id])
+        assert rv.status_code == 200, rv.data
+        game.apply('check_call', user_id)
+        game.mark_saved()
+    return run
+
+
+def close_clients():
+    while CLIENTS:
+        CLIENTS.pop().close()
+
+
+def measure(fn, min_time, repeat) -> dict:
+    fn()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / repeat or number >= 10 ** 6:
+            break
+        number *= 2
+    runs = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        runs.append((time.perf_counter() - start) / number)
+    return {'median_us': statistics.median(runs) * 1e6,
+            'min_us': min(runs) * 1e6,
+            'ops_per_sec': 1 / statistics.median(runs),
+            'loops': number,
+            'repeat': repeat}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(names, min_time=1.0, repeat=5) -> dict:
+    results = {}
+    for name in names:
+        group, setup = BENCHMARKS[name]
+        try:
+            results[name] = dict(measure(setup(), min_time, repeat), group=group)
+        finally:
+            close_clients()
+        print('{:28} {:>12.1f} us {:>12.0f} ops/s'.format(
+            name, results[name]['median_us'], results[name]['ops_per_sec']),
+            file=sys.stderr)
+    return {'meta': {'commit': git_commit(),
+                     'python': platform.python_version(),
+                     'platform': platform.platform(),
+                     'created': datetime.datetime.now().isoformat()},
+            'results': results}
+
+
+def compare(old: dict, new: dict, threshold: float) -> list:
+    regressions = []
+    for name, result in new['results'].items():
+        if name not in old['results']:
+            continue
+        # The fastest run is the least noisy estimate of the cost.
+        before = old['results'][name]['min_us']
+        change = result['min_us'] / before - 1
+        flag = 'REGRESSION' if change > threshold else ''
+        print('{:28} {:>10.1f} -> {:>10.1f} us {:>+7.1%} {}'.format(
+            name, before, result['min_us'], change, flag))
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the engine and HTTP hot paths.')
+    parser.add_argument('names', nargs='*', help='benchmarks or groups to run (default all)')
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--compare', help='earlier results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='slowdown that counts as a regression')
+    parser.add_argument('--min-time', type=float, default=1.0)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    names = [n for n, (group, _) in BENCHMARKS.items()
+             if not args.names or n in args.names or group in args.names]
+    results = run(names, args.min_time, args.repeat)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(json.load(f), results, args.threshold):
+                sys.exit(1)
@@ -0,0 +1,137 @@
+"""initial schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2021-07-20 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import uuid
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# Databases created before this migration had tables made implicitly by
+# dataset, with an integer id primary key and whatever columns had been
+# inserted so far. Those tables are kept: the missing columns are added and
+# the natural keys get unique indexes instead of being made primary keys.
+TABLES = {
+    'users': ([sa.Column('user_id', sa.Text, primary_key=True),
+               sa.Column('username', sa.Text),
+               sa.Column('email', sa.Text),
+               sa.Column('password', sa.Text),
+               sa.Column('role', sa.Text),
+               sa.Column('auth_token', sa.Text)],
+              [('ux_users_username', ['username'], True),
+               ('ux_users_email', ['email'], True)]),
+    'tokens': ([sa.Column('auth_token', sa.Text, primary_key=True),
+                sa.Column('user_id', sa.Text),
+                sa.Column('token_expiry_dttm', sa.DateTime)],
+               [('ix_tokens_user_id', ['user_id'], False),
+                ('ix_tokens_token_expiry_dttm', ['token_expiry_dttm'], False)]),
+    'revoked_tokens': ([sa.Column('token_id', sa.Text, primary_key=True),
+                        sa.Column('token_expiry', sa.Integer)],
+                       [('ix_revoked_tokens_token_expiry', ['token_expiry'], False)]),
+    'games': ([sa.Column('game_id', sa.Text, primary_key=True),
+               sa.Column('game_type', sa.Text),
+               sa.Column('num_seats', sa.Integer),
+               sa.Column('big_blind', sa.Integer),
+               sa.Column('small_blind', sa.Integer),
+               sa.Column('min_buyin', sa.Integer),
+               sa.Column('max_buyin', sa.Integer),
+               sa.Column('table_name', sa.Text),
+               sa.Column('state_cd', sa.Text),
+               sa.Column('pot_amt', sa.Integer),
+               sa.Column('board', sa.Text),
+               sa.Column('deck', sa.Text),
+               sa.Column('deck_seed', sa.BigInteger),
+               sa.Column('action_seq', sa.Integer),
+               sa.Column('version', sa.Integer)],
+              []),
+    'players': ([sa.Column('game_id', sa.Text, primary_key=True),
+                 sa.Column('user_id', sa.Text, primary_key=True),
+                 sa.Column('seat_num', sa.Integer),
+                 sa.Column('buyin', sa.Integer),
+                 sa.Column('stack', sa.Integer),
+                 sa.Column('bet_amt', sa.Integer),
+                 sa.Column('amt_in_pot', sa.Integer),
+                 sa.Column('position', sa.Integer),
+                 sa.Column('is_active', sa.Boolean),
+                 sa.Column('sitting_out', sa.Boolean),
+                 sa.Column('has_folded', sa.Boolean),
+                 sa.Column('has_acted', sa.Boolean),
+                 sa.Column('hand', sa.Text)],
+                [('ix_players_user_id', ['user_id'], False)]),
+    'actions': ([sa.Column('game_id', sa.Text, primary_key=True),
+                 sa.Column('seq', sa.Integer, primary_key=True),
+                 sa.Column('user_id', sa.Text),
+                 sa.Column('action_cd', sa.Text),
+                 sa.Column('amount', sa.Integer),
+                 sa.Column('seat_num', sa.Integer),
+                 sa.Column('deck_seed', sa.BigInteger),
+                 sa.Column('created_dttm', sa.DateTime)],
+                []),
+    'snapshots': ([sa.Column('game_id', sa.Text, primary_key=True),
+                   sa.Column('seq', sa.Integer, primary_key=True),
+                   sa.Column('state', sa.Text)],
+                  []),
+}
+
+
+def backfill_user_ids(bind):
+    # Users from before user_id existed get one, or they could never be
+    # looked up or updated by it.
+    rows = bind.execute(sa.text('SELECT id FROM users WHERE user_id IS NULL')).fetchall()
+    for row in rows:
+        bind.execute(sa.text('UPDATE users SET user_id = :user_id WHERE id = :id'),
+                     {'user_id': str(uuid.uuid4()), 'id': row.id})
+
+
+def check_unique(bind, name, columns):
+    # Rows that would break a unique index can't be merged safely here, so
+    # the upgrade stops and says which ones to fix.
+    cols = ', '.join(columns)
+    dupes = bind.execute(sa.text(
+        'SELECT {cols}, COUNT(*) AS n FROM {name} WHERE {not_null} '
+        'GROUP BY {cols} HAVING COUNT(*) > 1 LIMIT 5'.format(
+            cols=cols, name=name,
+            not_null=' AND '.join('{} IS NOT NULL'.format(c) for c in columns)))).fetchall()
+    if dupes:
+        raise RuntimeError('{} has duplicate ({}) values, e.g. {}; remove or rename them '
+                           'and run the upgrade again'.format(
+                               name, cols, ', '.join(str(tuple(r)[:-1]) for r in dupes)))
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    existing = set(inspector.get_table_names())
+    for name, (columns, indexes) in TABLES.items():
+        if name not in existing:
+            op.create_table(name, *columns)
+        else:
+            present = {c['name'] for c in inspector.get_columns(name)}
+            for column in columns:
+                if column.name not in present:
+                    op.add_column(name, sa.Column(column.name, column.type))
+            if name == 'users':
+                backfill_user_ids(bind)
+            key = [c.name for c in columns if c.primary_key]
+            check_unique(bind, name, key)
+            op.create_index('ux_{}_key'.format(name), name, key, unique=True)
+            for index_name, index_columns, unique in indexes:
+                if unique:
+                    check_unique(bind, name, index_columns)
+        for index_name, index_columns, unique in indexes:
+            op.create_index(index_name, name, index_columns, unique=unique)
+
+
+def downgrade():
+    for name, (columns, indexes) in reversed(list(TABLES.items())):
+        op.drop_table(name)
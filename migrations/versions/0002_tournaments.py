@@ -0,0 +1,54 @@
+"""tournaments
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2021-08-02 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'tournament_id' not in {c['name'] for c in inspector.get_columns('games')}:
+        with op.batch_alter_table('games') as batch_op:
+            batch_op.add_column(sa.Column('tournament_id', sa.Text))
+        op.create_index('ix_games_tournament_id', 'games', ['tournament_id'])
+    if 'tournaments' in inspector.get_table_names():
+        return
+    op.create_table(
+        'tournaments',
+        sa.Column('tournament_id', sa.Text, primary_key=True),
+        sa.Column('name', sa.Text),
+        sa.Column('state_cd', sa.Text),
+        sa.Column('table_size', sa.Integer),
+        sa.Column('starting_stack', sa.Integer),
+        sa.Column('max_entrants', sa.Integer),
+        sa.Column('schedule', sa.Text),
+        sa.Column('level', sa.Integer),
+        sa.Column('start_at', sa.Float),
+        sa.Column('level_started_at', sa.Float))
+    op.create_table(
+        'tournament_entrants',
+        sa.Column('tournament_id', sa.Text, primary_key=True),
+        sa.Column('user_id', sa.Text, primary_key=True),
+        sa.Column('game_id', sa.Text),
+        sa.Column('seat_num', sa.Integer),
+        sa.Column('place', sa.Integer))
+    op.create_index('ix_tournament_entrants_user_id', 'tournament_entrants', ['user_id'])
+
+
+def downgrade():
+    op.drop_table('tournament_entrants')
+    op.drop_table('tournaments')
+    op.drop_index('ix_games_tournament_id', 'games')
+    with op.batch_alter_table('games') as batch_op:
+        batch_op.drop_column('tournament_id')
@@ -0,0 +1,38 @@
+"""lobby summary
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2021-08-09 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    columns = {c['name'] for c in inspector.get_columns('games')}
+    if 'seated' in columns:
+        return
+    with op.batch_alter_table('games') as batch_op:
+        batch_op.add_column(sa.Column('seated', sa.Integer))
+        batch_op.add_column(sa.Column('hands_played', sa.Integer))
+        batch_op.add_column(sa.Column('pot_total', sa.BigInteger))
+    if 'players' in inspector.get_table_names():
+        op.execute('UPDATE games SET seated = (SELECT COUNT(*) FROM players '
+                   'WHERE players.game_id = games.game_id)')
+    op.execute('UPDATE games SET hands_played = 0, pot_total = 0')
+
+
+def downgrade():
+    with op.batch_alter_table('games') as batch_op:
+        batch_op.drop_column('pot_total')
+        batch_op.drop_column('hands_played')
+        batch_op.drop_column('seated')
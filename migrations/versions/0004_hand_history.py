@@ -0,0 +1,56 @@
+"""hand history
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2021-08-16 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'hand_start_seq' not in {c['name'] for c in inspector.get_columns('games')}:
+        with op.batch_alter_table('games') as batch_op:
+            batch_op.add_column(sa.Column('hand_start_seq', sa.Integer))
+    if 'hands' in inspector.get_table_names():
+        return
+    op.create_table(
+        'hands',
+        sa.Column('game_id', sa.Text, primary_key=True),
+        sa.Column('hand_num', sa.Integer, primary_key=True),
+        sa.Column('ended_at', sa.DateTime),
+        sa.Column('table_name', sa.Text),
+        sa.Column('game_type', sa.Text),
+        sa.Column('small_blind', sa.Integer),
+        sa.Column('big_blind', sa.Integer),
+        sa.Column('deck_seed', sa.BigInteger),
+        sa.Column('board', sa.Text),
+        sa.Column('pot', sa.Integer),
+        sa.Column('start_seq', sa.Integer),
+        sa.Column('end_seq', sa.Integer),
+        sa.Column('players', sa.Text))
+    op.create_index('ix_hands_ended_at', 'hands', ['ended_at', 'game_id', 'hand_num'])
+    op.create_table(
+        'hand_players',
+        sa.Column('game_id', sa.Text, primary_key=True),
+        sa.Column('hand_num', sa.Integer, primary_key=True),
+        sa.Column('user_id', sa.Text, primary_key=True),
+        sa.Column('ended_at', sa.DateTime))
+    op.create_index('ix_hand_players_user_id', 'hand_players',
+                    ['user_id', 'ended_at', 'game_id', 'hand_num'])
+
+
+def downgrade():
+    op.drop_table('hand_players')
+    op.drop_table('hands')
+    with op.batch_alter_table('games') as batch_op:
+        batch_op.drop_column('hand_start_seq')
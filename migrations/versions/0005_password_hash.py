@@ -0,0 +1,32 @@
+"""password hash
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2021-08-23 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+# Existing plaintext passwords are left in place: each is replaced by a hash
+# the next time its user logs in, and `python -m poker.service.upgrade_passwords`
+# hashes the rest in batches.
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'password_hash' in {c['name'] for c in inspector.get_columns('users')}:
+        return
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.add_column(sa.Column('password_hash', sa.Text))
+
+
+def downgrade():
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('password_hash')
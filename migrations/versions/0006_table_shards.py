@@ -0,0 +1,29 @@
+"""table shards
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2021-08-30 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'table_shards' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'table_shards',
+        sa.Column('game_id', sa.Text, primary_key=True),
+        sa.Column('shard', sa.Integer))
+
+
+def downgrade():
+    op.drop_table('table_shards')
@@ -0,0 +1,39 @@
+"""game activity
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2021-09-06 12:00:00
+
+"""
+from alembic import op
+import datetime
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'active_at' in {c['name'] for c in inspector.get_columns('games')}:
+        return
+    with op.batch_alter_table('games') as batch_op:
+        batch_op.add_column(sa.Column('active_at', sa.DateTime))
+    op.create_index('ix_games_active_at', 'games', ['active_at'])
+    # Tables count as last active at their last action, or now if they
+    # have none, so nothing is archived straight after upgrading.
+    if 'actions' in inspector.get_table_names():
+        op.execute('UPDATE games SET active_at = (SELECT MAX(created_dttm) FROM actions '
+                   'WHERE actions.game_id = games.game_id)')
+    op.execute(sa.text('UPDATE games SET active_at = :now WHERE active_at IS NULL')
+               .bindparams(now=datetime.datetime.now()))
+
+
+def downgrade():
+    op.drop_index('ix_games_active_at', 'games')
+    with op.batch_alter_table('games') as batch_op:
+        batch_op.drop_column('active_at')
@@ -0,0 +1,31 @@
+"""tournament creator
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2021-09-13 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+# Tournaments created before this have no creator, so only admins can start
+# them by hand; scheduled ones still start on their own.
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'created_by' in {c['name'] for c in inspector.get_columns('tournaments')}:
+        return
+    with op.batch_alter_table('tournaments') as batch_op:
+        batch_op.add_column(sa.Column('created_by', sa.Text))
+
+
+def downgrade():
+    with op.batch_alter_table('tournaments') as batch_op:
+        batch_op.drop_column('created_by')
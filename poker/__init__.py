@@ -1,14 +1,31 @@
 from flask import Flask
 from flask_cors import CORS
 from poker.api import bp
+from poker.db import connect, init_app
+from poker.log import init_logging
+from poker.repo.schema import create_schema
+from poker.service.archive import get_table_archiver
+from poker.service.metrics import init_metrics
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 def create_app(config_dict):
     app = Flask(__name__)
     for k in config_dict.keys():
         app.config[k] = config_dict[k]
-    print(app.config)
+    init_logging(app)
+    logger.info('creating app', extra={'env': app.config.get('ENV')})
     CORS(app)
-    print('creating app')
+    # Registered before the db hooks so the request's commit is measured too.
+    if app.config.get('METRICS_ENABLED'):
+        init_metrics(app)
+    if 'DBCONN' in app.config:
+        create_schema(connect(app.config['DBCONN']))
+        init_app(app)
+        if app.config.get('ARCHIVE_DBCONN'):
+            with app.app_context():
+                get_table_archiver().start()
     app.register_blueprint(bp, url_prefix='/api')
-    return app
\ No newline at end of file
+    return app
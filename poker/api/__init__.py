@@ -2,6 +2,8 @@ from flask import Blueprint, request
 from flask_restx import Api
 from poker.api.user_api import api as user_api
 from poker.api.poker_api import api as poker_api
+from poker.api.metrics_api import api as metrics_api
+from poker.api.tournament_api import api as tournament_api
 
 
 bp = Blueprint("api", __name__)
@@ -21,5 +23,7 @@ api = Api(bp,
 
 api.add_namespace(user_api)
 api.add_namespace(poker_api)
+api.add_namespace(metrics_api)
+api.add_namespace(tournament_api)
 
 
@@ -0,0 +1,16 @@
+from flask import Response
+from flask_restx import Namespace, Resource
+from poker.service.metrics import get_metrics
+
+api = Namespace('metrics')
+
+
+@api.route('/')
+class MetricsList(Resource):
+    @api.doc(security=None)
+    def get(self):
+        metrics = get_metrics()
+        if metrics is None:
+            return {'message': 'Metrics are not enabled.'}, 404
+        return Response(metrics.render(),
+                        mimetype='text/plain; version=0.0.4')
@@ -1,10 +1,27 @@
 from typing import List
-from flask_restx import Namespace, Resource as BaseResource
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from functools import partial
+from flask import Response, current_app, stream_with_context
+from flask_restx import Namespace, Resource as BaseResource, inputs
+import contextvars
+import heapq
+import json
+import queue
 import uuid
-from poker.db import get_db
+from poker.db import get_app_db, get_db
 from poker.model.poker_model import *
+from poker.model.equity import equity, equity_str
 from poker.api.util import token_required
 from poker.repo.poker_repo import *
+from poker.service.archive import get_table_archiver
+from poker.service.game_cache import get_game_cache, run_with_game
+from poker.service.hand_history import FORMATS, gzip_chunks, iter_hands, merge_hands
+from poker.service.lobby_cache import get_lobby_cache
+from poker.service.metrics import attach_stats, current_stats
+from poker.service.pubsub import broker, message_for
+from poker.service.shards import LOCAL, ShardError, get_shard_router, watch_state
+from poker.service.table_executor import get_table_executor
+from poker.service.tournament_service import get_tournament_service
 from injector import inject
 from flask_injector import FlaskInjector
 import sqlite3
@@ -27,39 +44,191 @@ player_parser.add_argument('seat_num', type=int, required=True, location='json')
 player_parser.add_argument('buyin',    type=int, required=True, location='json')
 
 
+lobby_parser = api.parser()
+lobby_parser.add_argument('limit',          type=int, default=50, location='args')
+lobby_parser.add_argument('cursor',         type=str, location='args')
+lobby_parser.add_argument('game_type',      type=str, location='args')
+lobby_parser.add_argument('min_big_blind',  type=int, location='args')
+lobby_parser.add_argument('max_big_blind',  type=int, location='args')
+lobby_parser.add_argument('min_free_seats', type=int, location='args')
+
+
+history_parser = api.parser()
+history_parser.add_argument('start',   type=inputs.datetime_from_iso8601, location='args')
+history_parser.add_argument('end',     type=inputs.datetime_from_iso8601, location='args')
+history_parser.add_argument('user_id', type=str, location='args')
+history_parser.add_argument('format',  type=str, default='ndjson', choices=sorted(FORMATS),
+                            location='args')
+
+
+equity_parser = api.parser()
+equity_parser.add_argument('hands',   type=list, required=True, location='json')
+equity_parser.add_argument('board',   type=str, default='', location='json')
+equity_parser.add_argument('samples', type=int, location='json')
+
+
 GAME_TYPES = ['texas_holdem']
+LOBBY_MAX_LIMIT = 200
 
 
 class Resource(BaseResource):
     @inject
-    def __init__(self, db: sqlite3.Connection, **kwargs):
-        self.db = db
-        super().__init__(**kwargs)
+    def __init__(self, *args, db: sqlite3.Connection = None, **kwargs):
+        # Without an injector the pooled request db is used.
+        self.db = db if db is not None else get_db()
+        super().__init__(*args, **kwargs)
+
+
+def submit_to_table(game_id, fn) -> Future:
+    # Everything that reads and writes a game runs on the table's executor
+    # worker, so requests for one table never interleave.
+    cache = get_game_cache()
+    db = get_app_db()
+    stats = current_stats()
+    tournaments = get_tournament_service()
+
+    def run():
+        with attach_stats(stats):
+            return run_with_game(db, cache, game_id, fn, tournaments.attach)
+
+    context = contextvars.copy_context()
+    return get_table_executor().submit(game_id, lambda: context.run(run))
+
+
+def submit_to_owner(game_id, fn, remote=None, on_result=None) -> Future:
+    # With shards, fn (or remote, where fn only makes sense in this process)
+    # is pickled and sent to the table's shard, and on_result is called
+    # with the result here before the future completes.
+    router = get_shard_router()
+    if router is None:
+        return submit_to_table(game_id, fn)
+    return router.submit_table(game_id, remote or fn,
+                               lambda: submit_to_table(game_id, fn), on_result)
+
+
+def run_on_table(game_id, fn, remote=None, on_result=None):
+    # The worker commits on its own connection. Views don't write through
+    # get_db before handing off, and token bookkeeping is deferred to the
+    # request's commit, so the worker never waits on this request's lock.
+    timeout = current_app.config.get('ACTION_TIMEOUT_SECONDS', 10)
+    future = submit_to_owner(game_id, fn, remote, on_result)
+    try:
+        return future.result(timeout)
+    except GameNotFound as e:
+        api.abort(404, str(e))
+    except FutureTimeout:
+        api.abort(503, table_busy(game_id, future.cancel()))
+
+
+def table_busy(game_id, cancelled) -> str:
+    # A call still queued is cancelled; one already running will finish.
+    if cancelled:
+        return 'Table {} is busy, please retry.'.format(game_id)
+    return 'Table {} is busy; the request may still be applied, check before retrying.'.format(
+        game_id)
+
+
+def apply_action(db, game, action_cd, user_id, **kwargs):
+    game.act(db, action_cd, user_id, **kwargs)
+    return '', 200
+
+
+def act(game_id, action_cd, user_id, **kwargs):
+    return run_on_table(game_id, partial(apply_action, action_cd=action_cd, user_id=user_id,
+                                         **kwargs))
+
+
+def join_game(db, game, user_id, player):
+    if game.tournament_id is not None:
+        return {'message': 'Tournament tables are seated by the tournament.'}, 400
+    if player['seat_num'] > game.num_seats:
+        return {'message': 'Invalid seat num. Cannot be greater than the maximum seats at the table ({})'.format(game.num_seats)}, 400
+    if player['seat_num'] < 1:
+        return {'message': 'Invalid seat num. Cannot be less than 1'}, 400
+    for p in game.players.players:
+        if p.seat_num == player['seat_num']:
+            return {'message': 'Seat {} is taken.'.format(player['seat_num'])}, 400
+    if player['buyin'] < game.min_buyin:
+        return {'message': 'buyin is less than minimum buyin.'}, 400
+    if player['buyin'] > game.max_buyin:
+        return {'message': 'buyin is greater than maximum buyin.'}, 400
+    player = new_player(game.game_id, user_id, player['seat_num'], player['buyin'])
+    game.join(player)
+    game.update_db(db)
+    return player, 200
+
+
+def create_game(db, game):
+    if game['game_type'] not in GAME_TYPES:
+        return {'message': 'Invalid game type "{}".'.format(game['game_type'])}, 400
+    if game['num_seats'] < 2:
+        return {'message': 'num_seats must be greater than 2.'}, 400
+    if game['big_blind'] <= 0:
+        return {'message': 'big_blind must be greater than 0.'}, 400
+    if game['small_blind'] <= 0:
+        return {'message': 'small_blind must be greater than 0.'}, 400
+    if game['small_blind'] >= game['big_blind']:
+        return {'message': 'big blind must be greater than small blind.'}, 400
+    if game['min_buyin'] <= 0:
+        return {'message': 'min_buyin must be greater than 0'}, 400
+    if game['max_buyin'] < game['min_buyin']:
+        return {'message': 'max_buyin can not be less than min_buyin'}, 400
+    game['game_id'] = str(uuid.uuid4())
+    router = get_shard_router()
+    if router is None:
+        insert_game(db, game)
+    else:
+        game = router.create_game(dict(game))
+    get_lobby_cache().clear()
+    return game, 201
+
+
+def lobby_entry(row: dict) -> dict:
+    entry = dict(row)
+    entry['seated'] = row['seated'] or 0
+    entry['free_seats'] = row['num_seats'] - entry['seated']
+    entry['avg_pot'] = row['pot_total'] // row['hands_played'] if row['hands_played'] else 0
+    del entry['pot_total']
+    return entry
+
+
+def lobby_page(db, args) -> dict:
+    # One more row than asked for tells whether there is a next page.
+    limit = min(max(args['limit'], 1), LOBBY_MAX_LIMIT)
+    query = partial(get_games, limit=limit + 1, after=args['cursor'],
+                    game_type=args['game_type'], min_big_blind=args['min_big_blind'],
+                    max_big_blind=args['max_big_blind'], min_free_seats=args['min_free_seats'])
+    router = get_shard_router()
+    if router is None:
+        rows = query(db)
+    else:
+        # Every store returns its own first page; the merged page is the
+        # first limit + 1 of those.
+        rows = list(heapq.merge(*router.query_all(query),
+                                key=lambda row: row['game_id']))[:limit + 1]
+    games = [lobby_entry(row) for row in rows[:limit]]
+    return {'games': games,
+            'next_cursor': games[-1]['game_id'] if len(rows) > limit else None}
 
 
 @api.route('/')
 class GameList(Resource):
+    @api.expect(lobby_parser)
+    @api.doc(security=None)
+    def get(self):
+        args = lobby_parser.parse_args()
+        key = tuple(sorted(args.items()))
+        cache = get_lobby_cache()
+        page = cache.get(key)
+        if page is None:
+            page = lobby_page(self.db, args)
+            cache.put(key, page)
+        return page
+
     @api.expect(game_parser)
     @token_required
     def post(self, user_id):
-        game = game_parser.parse_args()
-        if game['game_type'] not in GAME_TYPES:
-            return {'message': 'Invalid game type "{}".'.format(game['game_type'])}, 400
-        if game['num_seats'] < 2:
-            return {'message': 'num_seats must be greater than 2.'}, 400
-        if game['big_blind'] <= 0:
-            return {'message': 'big_blind must be greater than 0.'}, 400
-        if game['small_blind'] <= 0:
-            return {'message': 'small_blind must be greater than 0.'}, 400
-        if game['small_blind'] >= game['big_blind']:
-            return {'message': 'big blind must be greater than small blind.'}, 400
-        if game['min_buyin'] <= 0:
-            return {'message': 'min_buyin must be greater than 0'}, 400
-        if game['max_buyin'] < game['min_buyin']:
-            return {'message': 'max_buyin can not be less than min_buyin'}, 400
-        game['game_id'] = str(uuid.uuid4())
-        insert_game(self.db, game)
-        return game, 201
+        return create_game(self.db, game_parser.parse_args())
 
 
 @api.route('/<string:game_id>/player/')
@@ -67,56 +236,172 @@ class PlayerList(Resource):
     @api.expect(player_parser)
     @token_required
     def post(self, game_id, user_id):
-        print(game_id)
-        game = get_game(self.db, game_id)
         player = player_parser.parse_args()
-        if player['seat_num'] > game['num_seats']:
-            return {'message': 'Invalid seat num. Cannot be greater than the maximum seats at the table ({})'.format(game['num_seats'])}, 400
-        if player['seat_num'] < 1:
-            return {'message': 'Invalid seat num. Cannot be less than 1'}, 400
-        for p in get_players(self.db, game_id):
-            if p['seat_num'] == player['seat_num']:
-                return {'message': 'Seat {} is taken.'.format(player['seat_num'])}, 400
-        if player['buyin'] < game['min_buyin']:
-            return {'message': 'buyin is less than minimum buyin.'}, 400
-        if player['buyin'] > game['max_buyin']:
-            return {'message': 'buyin is greater than maximum buyin.'}, 400
-        player['user_id'] = user_id
-        player['game_id'] = game_id
-        player['stack'] = player['buyin']
-        player['bet_amt'] = 0
-        player['sitting_out'] = False
-        player['is_active'] = False
-        player['has_acted'] = None
-        player['hand'] = ''
-        add_player(self.db, player)
-        game = Game(game, get_players(self.db, game_id))
-        game.update_state(self.db)
-        return player, 200
+        return run_on_table(game_id, partial(join_game, user_id=user_id, player=dict(player)))
 
 
 @api.route('/<string:game_id>/player/check_call')
 class CheckCall(Resource):
     @token_required
     def get(self, game_id, user_id):
-        game = Game(get_game(self.db, game_id), get_players(self.db, game_id))
-        game.act(self.db, 'check_call', user_id)
-        return '', 200
+        return act(game_id, 'check_call', user_id)
 
 
 @api.route('/<string:game_id>/player/check_fold')
 class CheckFold(Resource):
     @token_required
     def get(self, game_id, user_id):
-        game = Game(get_game(self.db, game_id), get_players(self.db, game_id))
-        game.act(self.db, 'check_fold', user_id)
-        return '', 200
+        return act(game_id, 'check_fold', user_id)
 
 
 @api.route('/<string:game_id>/player/bet/<int:bet_amt>')
 class Bet(Resource):
     @token_required
     def get(self, game_id, user_id, bet_amt):
-        game = Game(get_game(self.db, game_id), get_players(self.db, game_id))
-        game.act(self.db, 'bet', user_id, bet_amt=bet_amt)
-        return '', 200
+        return act(game_id, 'bet', user_id, bet_amt=bet_amt)
+
+
+def equity_samples(samples=None):
+    limit = current_app.config.get('EQUITY_MAX_SAMPLES', 1000000)
+    if samples is None:
+        samples = current_app.config.get('EQUITY_SAMPLES', 100000)
+    return max(1, min(samples, limit))
+
+
+@api.route('/equity')
+class Equity(Resource):
+    @api.expect(equity_parser)
+    @token_required
+    def post(self, user_id):
+        args = equity_parser.parse_args()
+        try:
+            return equity_str(args['hands'], args['board'] or '',
+                              samples=equity_samples(args['samples']))
+        except (KeyError, TypeError, ValueError) as e:
+            return {'message': 'Invalid cards: {}'.format(e)}, 400
+
+
+def shown_hands(db, game):
+    if not game.players.all_in():
+        return None
+    return ([(p.user_id, p.hand) for p in game.players.get_live_players()],
+            bytes(game.board))
+
+
+@api.route('/<string:game_id>/equity')
+class GameEquity(Resource):
+    @token_required
+    def get(self, game_id, user_id):
+        shown = run_on_table(game_id, shown_hands)
+        if shown is None:
+            return {'message': 'Hands are only shown once all players are all in.'}, 400
+        # Equity is computed off the table worker so it never delays actions.
+        players, board = shown
+        res = equity([hand for _, hand in players], board, samples=equity_samples())
+        res['board'] = cards_to_str(board)
+        res['players'] = {user_id: dict(r, hand=cards_to_str(hand))
+                          for (user_id, hand), r in zip(players, res['players'])}
+        return res
+
+
+def state_event(state) -> str:
+    return 'event: state\ndata: {}\n\n'.format(json.dumps(state, default=str))
+
+
+def message_event(message, user_id) -> str:
+    return 'data: {}\n\n'.format(json.dumps(message_for(message, user_id), default=str))
+
+
+def event_stream(game_id, user_id, q, state, keepalive):
+    try:
+        yield state_event(state)
+        while True:
+            try:
+                message = q.get(timeout=keepalive)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            if message is None:
+                return
+            yield message_event(message, user_id)
+    finally:
+        broker.unsubscribe(game_id, q)
+
+
+def subscribe_state(db, game, user_id, q):
+    broker.subscribe(game.game_id, q)
+    return game.get_state(user_id)
+
+
+@api.route('/<string:game_id>/stream')
+class GameStream(Resource):
+    @token_required
+    def get(self, game_id, user_id):
+        # Subscribing and reading the state happen on the table's worker, so
+        # no message is missed in between. A shard sends the table's messages
+        # back here, and the queue is subscribed as the state arrives, in
+        # order with them.
+        q = queue.Queue(broker.max_queue)
+        state = run_on_table(game_id, partial(subscribe_state, user_id=user_id, q=q),
+                             partial(watch_state, user_id=user_id),
+                             lambda state: broker.subscribe(game_id, q))
+        keepalive = current_app.config.get('SSE_KEEPALIVE_SECONDS', 15)
+        return Response(event_stream(game_id, user_id, q, state, keepalive),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache'})
+
+
+def all_hands(start, end, user_id):
+    # Hands from every shard and from the archive, merged into one order.
+    router = get_shard_router()
+    if router is None:
+        hands = iter_hands(get_app_db(), start, end, user_id)
+    else:
+        hands = router.iter_hands(start, end, user_id)
+    archiver = get_table_archiver()
+    if archiver is None:
+        return hands
+    return merge_hands(hands, archiver.iter_hands(start, end, user_id))
+
+
+@api.route('/history')
+class HandHistory(Resource):
+    @api.expect(history_parser)
+    @token_required
+    def get(self, user_id):
+        # Players can export the hands they played; admins can export any.
+        args = history_parser.parse_args()
+        user = self.db['users'].find_one(user_id=user_id)
+        if args['user_id'] != user_id and (user or {}).get('role') != 'ADMIN':
+            args['user_id'] = user_id
+        hands = all_hands(args['start'], args['end'], args['user_id'])
+        chunks = gzip_chunks(FORMATS[args['format']](hands))
+        return Response(stream_with_context(chunks),
+                        mimetype='application/gzip',
+                        headers={'Content-Disposition': 'attachment; filename=hands.{}.gz'.format(
+                            'txt' if args['format'] == 'text' else 'ndjson')})
+
+
+shard_parser = api.parser()
+shard_parser.add_argument('shard', type=int, location='json')
+
+
+@api.route('/<string:game_id>/shard')
+class GameShard(Resource):
+    @api.expect(shard_parser)
+    @token_required
+    def put(self, game_id, user_id):
+        # Admins move a table to another shard, or to the app's own db with
+        # a null shard.
+        user = self.db['users'].find_one(user_id=user_id)
+        if (user or {}).get('role') != 'ADMIN':
+            return {'message': 'Only admins can move tables.'}, 403
+        router = get_shard_router()
+        if router is None:
+            return {'message': 'Tables are not sharded.'}, 400
+        shard = shard_parser.parse_args()['shard']
+        try:
+            router.migrate(game_id, LOCAL if shard is None else shard)
+        except ShardError as e:
+            return {'message': str(e)}, 400
+        return {'game_id': game_id, 'shard': shard}, 200
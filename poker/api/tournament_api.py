@@ -0,0 +1,103 @@
+from flask_restx import Namespace
+from poker.api.poker_api import Resource
+from poker.api.util import token_required
+from poker.model.tournament_model import DEFAULT_SCHEDULE, TournamentError, new_tournament
+from poker.service.tournament_service import get_tournament_service
+import time
+
+api = Namespace('tournament')
+
+
+tournament_parser = api.parser()
+tournament_parser.add_argument('name',           type=str, required=True, location='json')
+tournament_parser.add_argument('table_size',     type=int, default=9, location='json')
+tournament_parser.add_argument('starting_stack', type=int, default=10000, location='json')
+tournament_parser.add_argument('max_entrants',   type=int, location='json')
+tournament_parser.add_argument('start_at',       type=float, location='json')
+tournament_parser.add_argument('level_seconds',  type=int, default=600, location='json')
+
+
+def tournament_status(tournament) -> dict:
+    status = tournament.to_row()
+    del status['schedule']
+    status.update({'small_blind': tournament.blinds.small_blind,
+                   'big_blind': tournament.blinds.big_blind,
+                   'next_level_at': tournament.next_level_at(),
+                   'entrants': len(tournament.entrants),
+                   'remaining': tournament.remaining,
+                   'tables': sorted(tournament.seats),
+                   'places': {e['user_id']: e['place'] for e in tournament.entrants.values()
+                              if e['place'] is not None}})
+    return status
+
+
+def find_tournament(tournament_id):
+    tournament = get_tournament_service().get(tournament_id)
+    if tournament is None:
+        api.abort(404, 'Tournament {} not found.'.format(tournament_id))
+    return tournament
+
+
+@api.route('/')
+class TournamentList(Resource):
+    @api.expect(tournament_parser)
+    @token_required
+    def post(self, user_id):
+        args = tournament_parser.parse_args()
+        if not 2 <= args['table_size'] <= 10:
+            return {'message': 'table_size must be between 2 and 10.'}, 400
+        if args['starting_stack'] <= 0:
+            return {'message': 'starting_stack must be greater than 0.'}, 400
+        if args['max_entrants'] is not None and args['max_entrants'] < 2:
+            return {'message': 'max_entrants must be at least 2.'}, 400
+        if args['level_seconds'] <= 0:
+            return {'message': 'level_seconds must be greater than 0.'}, 400
+        schedule = [level._replace(seconds=args['level_seconds']) for level in DEFAULT_SCHEDULE]
+        row = new_tournament(args['name'], args['table_size'], args['starting_stack'],
+                             args['max_entrants'], args['start_at'], schedule, user_id)
+        return tournament_status(get_tournament_service().create(row)), 201
+
+
+@api.route('/<string:tournament_id>')
+class TournamentStatus(Resource):
+    def get(self, tournament_id):
+        return tournament_status(find_tournament(tournament_id))
+
+
+@api.route('/<string:tournament_id>/entrant/')
+class EntrantList(Resource):
+    @token_required
+    def post(self, tournament_id, user_id):
+        tournament = find_tournament(tournament_id)
+        try:
+            tournament.register(user_id)
+        except TournamentError as e:
+            return {'message': str(e)}, 400
+        get_tournament_service().save(tournament)
+        return tournament_status(tournament), 200
+
+    @token_required
+    def delete(self, tournament_id, user_id):
+        tournament = find_tournament(tournament_id)
+        try:
+            tournament.unregister(user_id)
+        except TournamentError as e:
+            return {'message': str(e)}, 400
+        get_tournament_service().save(tournament)
+        return tournament_status(tournament), 200
+
+
+@api.route('/<string:tournament_id>/start')
+class StartTournament(Resource):
+    @token_required
+    def post(self, tournament_id, user_id):
+        tournament = find_tournament(tournament_id)
+        if tournament.created_by != user_id:
+            user = self.db['users'].find_one(user_id=user_id)
+            if (user or {}).get('role') != 'ADMIN':
+                return {'message': 'Only its creator or an admin can start a tournament.'}, 403
+        try:
+            get_tournament_service().start(tournament, time.time())
+        except TournamentError as e:
+            return {'message': str(e)}, 400
+        return tournament_status(tournament), 200
@@ -1,8 +1,12 @@
+from flask import current_app, request
 from flask_restx import Namespace, Resource
 import uuid
 import datetime
 from poker.db import get_db
 from poker.api.util import token_required
+from poker.service.credentials import PasswordHasherBusy, get_password_hasher
+from poker.service.signed_tokens import get_revocation_list, issue_signed_token, load_signed_token
+from poker.service.token_cache import get_token_cache
 
 api = Namespace('user')
 
@@ -13,19 +17,26 @@ user_parser.add_argument('password', type=str, location='json')
 
 
 def get_user(username, email, password):
+    # Look the user up by the indexed username or email, then check the
+    # password against its hash on the hasher's pool.
     user = None
     users = get_db()['users']
     if username:
-        user = users.find_one(username=username, password=password)
+        user = users.find_one(username=username)
     elif email:
-        user = users.find_one(email=email, password=password)
-    return user if user else None
+        user = users.find_one(email=email)
+    return user if get_password_hasher().check_user(user, password) else None
 
 
-def update_user(user):
+def public_user(user):
+    return {k: v for k, v in user.items() if k not in ('password', 'password_hash')}
+
 
+def update_user(user):
+    # By primary key: users tables made by dataset are keyed by id, and
+    # their oldest rows may have no user_id.
     users = get_db()['users']
-    users.update(user, ['user_id'])
+    users.update(user, [c.name for c in users.table.primary_key.columns])
 
 
 def insert_user(user):
@@ -33,6 +44,9 @@ def insert_user(user):
 
 
 def set_auth_token(user):
+    if current_app.config.get('AUTH_MODE') == 'signed':
+        user['auth_token'] = issue_signed_token(user)
+        return
     user['auth_token'] = str(uuid.uuid4())
     token = {'user_id': user['user_id'],
              'auth_token': user['auth_token'],
@@ -41,31 +55,73 @@ def set_auth_token(user):
     get_db()['tokens'].insert(token)
 
 
+def register_user(user):
+    users = get_db()['users']
+    if user['username'] and users.find_one(username=user['username']):
+        return {'message': 'Username is taken.'}, 400
+    if user['email'] and users.find_one(email=user['email']):
+        return {'message': 'Email is taken.'}, 400
+    if not user['password']:
+        return {'message': 'Password is required.'}, 400
+    try:
+        user['password_hash'] = get_password_hasher().hash(user.pop('password'))
+    except PasswordHasherBusy as e:
+        return {'message': str(e)}, 503
+    user['user_id'] = str(uuid.uuid4())
+    user['role'] = 'USER'
+    set_auth_token(user)
+    insert_user(user)
+    return public_user(user), 201
+
+
+def login_user(userdata):
+    try:
+        user = get_user(userdata['username'],
+                        userdata['email'], userdata['password'])
+    except PasswordHasherBusy as e:
+        return {'message': str(e)}, 503
+    if not user:
+        return 'User does not exist', 400
+    else:
+        if not user.get('user_id'):
+            user['user_id'] = str(uuid.uuid4())
+        set_auth_token(user)
+        update_user(user)
+    return public_user(user), 200
+
+
 @api.route('/register')
 class RegisterUser(Resource):
     @api.expect(user_parser)
     def post(self):
-        user = user_parser.parse_args()
-        user['user_id'] = str(uuid.uuid4())
-        user['role'] = 'USER'
-        set_auth_token(user)
-        insert_user(user)
-        return user, 201
+        return register_user(user_parser.parse_args())
 
 
 @api.route('/login')
 class LoginUser(Resource):
     @api.expect(user_parser)
     def post(self):
-        userdata = user_parser.parse_args()
-        user = get_user(userdata['username'],
-                        userdata['email'], userdata['password'])
-        if not user:
-            return 'User does not exist', 400
-        else:
-            set_auth_token(user)
-            update_user(user)
-        return user, 200
+        return login_user(user_parser.parse_args())
+
+
+def revoke_auth_token(auth_token):
+    if current_app.config.get('AUTH_MODE') == 'signed':
+        claims = load_signed_token(auth_token)
+        get_revocation_list().revoke(claims['jti'], claims['exp'])
+        get_db()['revoked_tokens'].insert({'token_id': claims['jti'],
+                                           'token_expiry': claims['exp']})
+    else:
+        get_token_cache().drop(auth_token)
+        get_db()['tokens'].delete(auth_token=auth_token)
+
+
+@api.route('/logout')
+class LogoutUser(Resource):
+    @api.doc(security='api_key')
+    @token_required
+    def post(self, user_id):
+        revoke_auth_token(request.headers['x-access-token'])
+        return '', 200
 
 
 @api.route('/testauth')
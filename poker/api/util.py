@@ -1,26 +1,78 @@
-from functools import wraps
-from flask import request
-from poker.db import get_db
+from functools import partial, wraps
+from flask import current_app, request
+from poker import log
+from poker.db import defer_write, get_db
+from poker.service.signed_tokens import get_revocation_list, load_signed_token
+from poker.service.token_cache import get_token_cache
 import datetime
+import time
+
+
+def purge_expired_tokens(db, now):
+    if 'tokens' in db:
+        tk_table = db['tokens']
+        tk_table.delete(tk_table.table.c.token_expiry_dttm <= now)
+
+
+def load_revoked_tokens(db, revocation_list, now):
+    if 'revoked_tokens' in db:
+        revocation_list.load(db['revoked_tokens'].all(), now)
+
+
+def check_signed_token(token):
+    res = load_signed_token(token)
+    if not res:
+        return None, ({'message': 'Invalid token.'}, 401)
+    now = time.time()
+    if res['exp'] <= now:
+        return None, ({'message': 'Token has expired.'}, 401)
+    revocation_list = get_revocation_list()
+    if revocation_list.refresh_due(now):
+        load_revoked_tokens(get_db(), revocation_list, now)
+    if revocation_list.is_revoked(res['jti']):
+        return None, ({'message': 'Token has been revoked.'}, 401)
+    return res['user_id'], None
+
+
+def check_db_token(token):
+    cache = get_token_cache()
+    now = datetime.datetime.now()
+    if cache.sweep_due(now):
+        cache.purge_expired(now)
+        defer_write(partial(purge_expired_tokens, now=now))
+    res = cache.get(token, now)
+    if not res:
+        res = get_db()['tokens'].find_one(auth_token=token)
+        if not res:
+            return None, ({'message': 'Invalid token.'}, 401)
+        res = cache.put(res, now)
+    if res['token_expiry_dttm'] <= now:
+        cache.drop(token)
+        return None, ({'message': 'Token has expired.'}, 401)
+    elif cache.refresh(res, now):
+        defer_write(lambda db: db['tokens'].update(
+            {'auth_token': token,
+             'token_expiry_dttm': res['token_expiry_dttm']},
+            ['auth_token']))
+    return res['user_id'], None
+
+
+def authenticate(token):
+    # Returns the token's user_id and None, or None and the error response.
+    if token is None:
+        return None, ({'message': 'Missing auth token.'}, 401)
+    if current_app.config.get('AUTH_MODE') == 'signed':
+        return check_signed_token(token)
+    return check_db_token(token)
 
 
 def token_required(f):
     @wraps(f)
     def inner(*args, **kwargs):
-        if 'x-access-token' in request.headers:
-            token = request.headers['x-access-token']
-            tk_table = get_db()['tokens']
-            res = tk_table.find_one(auth_token=token)
-            if not res:
-                return {'message': 'Invalid token.'}, 401
-            if res['token_expiry_dttm'] <= datetime.datetime.now():
-                tk_table.delete(auth_token=token)
-                return {'message': 'Token has expired.'}, 401
-            else:
-                res['token_expiry_dttm'] = res['token_expiry_dttm'] + datetime.timedelta(hours=1)
-                tk_table.update(res, ['auth_token'])
-        else:
-            return {'message': 'Missing auth token.'}, 401
-        kwargs['user_id'] = res['user_id']
+        user_id, error = authenticate(request.headers.get('x-access-token'))
+        if error:
+            return error
+        kwargs['user_id'] = user_id
+        log.user_id.set(user_id)
         return f(*args, **kwargs)
     return inner
@@ -0,0 +1,326 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from werkzeug.exceptions import HTTPException, NotFound, ServiceUnavailable
+from poker import create_app, log
+from poker.api.poker_api import (apply_action, create_game, game_parser, join_game,
+                                 message_event, player_parser, state_event, submit_to_owner,
+                                 subscribe_state, table_busy)
+from poker.api.user_api import login_user, register_user, user_parser
+from poker.api.util import authenticate
+from poker.db import commit_db, get_db
+from poker.repo.poker_repo import GameNotFound
+from poker.service.metrics import RequestStats, attach_stats
+from poker.service.pubsub import AsyncQueue, broker
+from poker.service.shards import watch_state
+import asyncio
+import contextvars
+import io
+import json
+import logging
+import re
+import sys
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# An ASGI front end for the same app. Table actions, streams and logins are
+# served from the event loop: their DB work is awaited on the table's
+# executor worker or on a small pool of DB threads, and a stream waits on
+# its subscriber queue without holding a thread, so idle connections cost
+# a coroutine each. Every other route is handed to the Flask app on the DB
+# pool, as a WSGI server would.
+
+ROUTES = [
+    ('POST', r'/api/poker/', 'create_game'),
+    ('POST', r'/api/poker/(?P<game_id>[^/]+)/player/', 'join'),
+    ('GET', r'/api/poker/(?P<game_id>[^/]+)/player/check_call', 'check_call'),
+    ('GET', r'/api/poker/(?P<game_id>[^/]+)/player/check_fold', 'check_fold'),
+    ('GET', r'/api/poker/(?P<game_id>[^/]+)/player/bet/(?P<bet_amt>\d+)', 'bet'),
+    ('GET', r'/api/poker/(?P<game_id>[^/]+)/stream', 'stream'),
+    ('POST', r'/api/user/register', 'register'),
+    ('POST', r'/api/user/login', 'login'),
+]
+
+
+class RequestTooLarge(Exception):
+    pass
+
+
+class Request:
+    def __init__(self, scope, body, params):
+        self.method = scope['method']
+        self.body = body
+        self.params = params
+        self.headers = {k.decode('latin-1').lower(): v.decode('latin-1')
+                        for k, v in scope['headers']}
+        self.stats = RequestStats()
+        self.started = False
+
+    @property
+    def json(self):
+        # Read by the reqparse parsers, like flask.Request.json.
+        if not self.headers.get('content-type', '').startswith('application/json'):
+            return None
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            return None
+
+
+async def read_body(receive, max_bytes) -> bytes:
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        body += message.get('body', b'')
+        if len(body) > max_bytes:
+            raise RequestTooLarge()
+        if not message.get('more_body'):
+            break
+    return bytes(body)
+
+
+async def send_json(send, body, status, headers=()):
+    data = json.dumps(body, default=str).encode() + b'\n'
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(data)).encode())] + list(headers)})
+    await send({'type': 'http.response.body', 'body': data})
+
+
+def wsgi_environ(scope, body) -> dict:
+    server = scope.get('server') or ('localhost', 80)
+    environ = {'REQUEST_METHOD': scope['method'],
+               'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+               'PATH_INFO': scope['path'].encode().decode('latin-1'),
+               'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+               'SERVER_NAME': server[0],
+               'SERVER_PORT': str(server[1]),
+               'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+               'CONTENT_LENGTH': str(len(body)),
+               'wsgi.version': (1, 0),
+               'wsgi.url_scheme': scope.get('scheme', 'http'),
+               'wsgi.input': io.BytesIO(body),
+               'wsgi.errors': sys.stderr,
+               'wsgi.multithread': True,
+               'wsgi.multiprocess': False,
+               'wsgi.run_once': False}
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = name if name == 'CONTENT_TYPE' else 'HTTP_' + name
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+class AsgiApp:
+    def __init__(self, app):
+        self.app = app
+        config = app.config
+        self.pool = ThreadPoolExecutor(config.get('ASGI_DB_THREADS', 8),
+                                       thread_name_prefix='asgi-db')
+        self.max_body = config.get('ASGI_MAX_BODY_BYTES', 1024 * 1024)
+        self.action_timeout = config.get('ACTION_TIMEOUT_SECONDS', 10)
+        self.keepalive = config.get('SSE_KEEPALIVE_SECONDS', 15)
+        self.routes = [(method, re.compile(pattern), getattr(self, name))
+                       for method, pattern, name in ROUTES]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+        try:
+            body = await read_body(receive, self.max_body)
+        except RequestTooLarge:
+            return await send_json(send, {'message': 'Request body is too large.'}, 413)
+        for method, pattern, handler in self.routes:
+            match = pattern.fullmatch(scope['path'])
+            if match and method == scope['method']:
+                break
+        else:
+            return await self.wsgi(scope, body, send)
+        request = Request(scope, body, match.groupdict())
+        request_id = request.headers.get('x-request-id') or uuid.uuid4().hex
+        log.request_id.set(request_id)
+        log.game_id.set(request.params.get('game_id'))
+        log.user_id.set(None)
+        start = time.perf_counter()
+        try:
+            body, status = await handler(request, receive, send)
+        except HTTPException as e:
+            body, status = getattr(e, 'data', None) or {'message': e.description}, e.code
+        except Exception:
+            logger.exception('request failed')
+            body, status = {'message': 'Internal Server Error'}, 500
+        if not request.started:
+            await send_json(send, body, status, [(b'x-request-id', request_id.encode())])
+        metrics = self.app.extensions.get('metrics')
+        if metrics is not None:
+            metrics.observe_request(pattern.pattern, method, status,
+                                    time.perf_counter() - start, request.stats)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.pool.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def run_db(self, request, fn, *args):
+        # Runs fn as its own transaction on a DB thread, like a sync request.
+        def run():
+            with self.app.app_context(), attach_stats(request.stats):
+                result = fn(*args)
+                commit_db()
+                return result
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.pool, context.run, run)
+
+    async def run_on_table(self, request, game_id, fn, remote=None, on_result=None):
+        # Nothing here has written through get_db, so there is no request
+        # transaction to commit before handing over to the table worker.
+        with self.app.app_context(), attach_stats(request.stats):
+            future = submit_to_owner(game_id, fn, remote, on_result)
+        try:
+            # Shielded so a timeout doesn't cancel it through the wrapper.
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)),
+                                          self.action_timeout)
+        except GameNotFound as e:
+            raise NotFound(str(e))
+        except asyncio.TimeoutError:
+            raise ServiceUnavailable(table_busy(game_id, future.cancel()))
+
+    def parse(self, parser, request):
+        with self.app.app_context():
+            return parser.parse_args(req=request)
+
+    async def authenticate(self, request):
+        user_id, error = await self.run_db(request, authenticate,
+                                           request.headers.get('x-access-token'))
+        log.user_id.set(user_id)
+        return user_id, error
+
+    async def create_game(self, request, receive, send):
+        user_id, error = await self.authenticate(request)
+        if error:
+            return error
+        game = self.parse(game_parser, request)
+        return await self.run_db(request, lambda: create_game(get_db(), game))
+
+    async def join(self, request, receive, send):
+        user_id, error = await self.authenticate(request)
+        if error:
+            return error
+        player = self.parse(player_parser, request)
+        return await self.run_on_table(request, request.params['game_id'],
+                                       partial(join_game, user_id=user_id, player=dict(player)))
+
+    async def act(self, request, action_cd, **kwargs):
+        user_id, error = await self.authenticate(request)
+        if error:
+            return error
+        return await self.run_on_table(request, request.params['game_id'],
+                                       partial(apply_action, action_cd=action_cd,
+                                               user_id=user_id, **kwargs))
+
+    async def check_call(self, request, receive, send):
+        return await self.act(request, 'check_call')
+
+    async def check_fold(self, request, receive, send):
+        return await self.act(request, 'check_fold')
+
+    async def bet(self, request, receive, send):
+        return await self.act(request, 'bet', bet_amt=int(request.params['bet_amt']))
+
+    async def register(self, request, receive, send):
+        return await self.run_db(request, register_user, self.parse(user_parser, request))
+
+    async def login(self, request, receive, send):
+        return await self.run_db(request, login_user, self.parse(user_parser, request))
+
+    async def stream(self, request, receive, send):
+        user_id, error = await self.authenticate(request)
+        if error:
+            return error
+        game_id = request.params['game_id']
+        q = AsyncQueue(broker.max_queue, asyncio.get_running_loop())
+        state = await self.run_on_table(request, game_id,
+                                        partial(subscribe_state, user_id=user_id, q=q),
+                                        partial(watch_state, user_id=user_id),
+                                        lambda state: broker.subscribe(game_id, q))
+        watcher = asyncio.ensure_future(wait_for_disconnect(receive, q))
+        request.started = True
+        try:
+            await send({'type': 'http.response.start', 'status': 200,
+                        'headers': [(b'content-type', b'text/event-stream'),
+                                    (b'cache-control', b'no-cache')]})
+            await send_event(send, state_event(state))
+            while True:
+                try:
+                    message = await q.get_async(self.keepalive)
+                except asyncio.TimeoutError:
+                    await send_event(send, ': keepalive\n\n')
+                    continue
+                if message is None:
+                    break
+                await send_event(send, message_event(message, user_id))
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            watcher.cancel()
+            broker.unsubscribe(game_id, q)
+        return None, 200
+
+    async def wsgi(self, scope, body, send):
+        # The response is iterated on one DB thread, since Flask's contexts
+        # belong to the thread that pushed them, and each chunk waits for
+        # the send so a slow client holds back a large download.
+        loop = asyncio.get_running_loop()
+        environ = wsgi_environ(scope, body)
+
+        def send_sync(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def run():
+            response = {}
+
+            def start_response(status, headers, exc_info=None):
+                response['status'] = int(status.split(' ', 1)[0])
+                response['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1'))
+                                       for k, v in headers]
+            result = self.app(environ, start_response)
+            try:
+                send_sync({'type': 'http.response.start', 'status': response['status'],
+                           'headers': response['headers']})
+                for chunk in result:
+                    if chunk:
+                        send_sync({'type': 'http.response.body', 'body': chunk,
+                                   'more_body': True})
+                send_sync({'type': 'http.response.body', 'body': b''})
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        await loop.run_in_executor(self.pool, run)
+
+
+async def send_event(send, event: str):
+    await send({'type': 'http.response.body', 'body': event.encode(), 'more_body': True})
+
+
+async def wait_for_disconnect(receive, q: AsyncQueue):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+    q.close()
+
+
+def create_asgi_app(config_dict) -> AsgiApp:
+    return AsgiApp(create_app(config_dict))
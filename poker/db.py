@@ -1,9 +1,81 @@
 from flask import current_app, g
+from sqlalchemy import event
 import dataset
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+_databases = {}
+_lock = threading.Lock()
+
+
+def connect(url, synchronous='NORMAL', busy_timeout_ms=5000) -> dataset.Database:
+    # One Database per process and url. dataset keeps a connection per
+    # thread, so each worker thread reuses its connection (and sqlite's
+    # prepared statement cache) across requests instead of reconnecting.
+    key = (os.getpid(), url)
+    with _lock:
+        if key not in _databases:
+            engine_kwargs = {}
+            if url.startswith('sqlite'):
+                engine_kwargs['connect_args'] = {'check_same_thread': False,
+                                                 'cached_statements': 256}
+            db = dataset.connect(url, engine_kwargs=engine_kwargs)
+            if db.is_sqlite:
+                def set_pragmas(dbapi_con, con_record):
+                    dbapi_con.execute('PRAGMA synchronous={}'.format(synchronous))
+                    dbapi_con.execute('PRAGMA busy_timeout={}'.format(int(busy_timeout_ms)))
+                    dbapi_con.execute('PRAGMA foreign_keys=ON')
+                event.listen(db.engine, 'connect', set_pragmas)
+            logger.info('connected to db', extra={'url': repr(db.engine.url)})
+            _databases[key] = db
+        return _databases[key]
+
+
+def get_app_db() -> dataset.Database:
+    config = current_app.config
+    return connect(config['DBCONN'],
+                   config.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+                   config.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
 
 
 def get_db():
+    # Everything a request writes through get_db is one transaction,
+    # committed after the view returns and rolled back if it raised.
     if 'db' not in g:
-        print('connecting to db')
-        g.db = dataset.connect(current_app.config['DBCONN'])
+        g.db = get_app_db()
+        g.db.begin()
     return g.db
+
+
+def defer_write(fn):
+    # fn(db) runs in the request's transaction just before it commits, so
+    # the request takes no write lock before then, and table workers it
+    # hands off to can write in the meantime.
+    g.setdefault('deferred_writes', []).append(fn)
+
+
+def commit_db():
+    for fn in g.pop('deferred_writes', []):
+        fn(get_db())
+    db = g.pop('db', None)
+    if db is not None:
+        db.commit()
+
+
+def rollback_db(exc=None):
+    g.pop('deferred_writes', None)
+    db = g.pop('db', None)
+    if db is not None:
+        db.rollback()
+
+
+def init_app(app):
+    @app.after_request
+    def commit_request(response):
+        commit_db()
+        return response
+
+    app.teardown_appcontext(rollback_db)
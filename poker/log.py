@@ -0,0 +1,113 @@
+from contextvars import ContextVar
+from flask import request
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import datetime
+import json
+import logging
+import queue
+import sys
+import threading
+import uuid
+
+# Log records are put on a queue by the thread that logs them and written
+# by one listener thread, so a request never waits on the stream. The
+# correlation ids are context variables, which table workers inherit by
+# running their work in the submitting request's context.
+
+request_id: ContextVar = ContextVar('request_id', default=None)
+game_id: ContextVar = ContextVar('game_id', default=None)
+user_id: ContextVar = ContextVar('user_id', default=None)
+CONTEXT = {'request_id': request_id, 'game_id': game_id, 'user_id': user_id}
+
+# Attributes every LogRecord has; anything else was passed in extra.
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class ContextFilter(logging.Filter):
+    def filter(self, record):
+        for name, var in CONTEXT.items():
+            if not hasattr(record, name):
+                setattr(record, name, var.get())
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {'time': datetime.datetime.fromtimestamp(record.created).isoformat(),
+                 'level': record.levelname,
+                 'logger': record.name,
+                 'message': record.getMessage()}
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    # When the listener falls behind and the queue is full, records are
+    # counted and dropped instead of going through handleError, which would
+    # print a traceback for each one.
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def dropped_records() -> int:
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+_lock = threading.Lock()
+_listener = None
+_queue_handler = None
+
+
+def configure_logging(config):
+    global _listener, _queue_handler
+    logger = logging.getLogger('poker')
+    with _lock:
+        if _listener is None:
+            q = queue.Queue(config.get('LOG_QUEUE_SIZE', 10000))
+            _queue_handler = DroppingQueueHandler(q)
+            _queue_handler.addFilter(ContextFilter())
+            stream = logging.StreamHandler(sys.stderr)
+            _listener = QueueListener(q, stream, respect_handler_level=True)
+            _listener.start()
+            atexit.register(_listener.stop)
+            logger.addHandler(_queue_handler)
+            logger.propagate = False
+    if config.get('LOG_FORMAT', 'json') == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s %(levelname)s %(name)s '
+                                      '[%(request_id)s %(game_id)s %(user_id)s] %(message)s')
+    for handler in _listener.handlers:
+        handler.setFormatter(formatter)
+    logger.setLevel(config.get('LOG_LEVEL', 'INFO'))
+    for name, level in config.get('LOG_LEVELS', {}).items():
+        logging.getLogger(name).setLevel(level)
+
+
+def bind_request():
+    request_id.set(request.headers.get('X-Request-ID') or uuid.uuid4().hex)
+    game_id.set((request.view_args or {}).get('game_id'))
+    user_id.set(None)
+
+
+def unbind_request(exc=None):
+    for var in CONTEXT.values():
+        var.set(None)
+
+
+def init_logging(app):
+    configure_logging(app.config)
+    app.before_request(bind_request)
+    app.teardown_request(unbind_request)
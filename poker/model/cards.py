@@ -0,0 +1,100 @@
+import random
+from typing import Iterable, List
+
+# Cards are ints 0-51: suit * 13 + rank, with rank 0 = deuce and 12 = ace.
+# Sets of cards are 64-bit masks with one 16-bit lane per suit, so the rank
+# mask of a suit is (mask >> 16 * suit) & 0x1FFF. Strings like 'AhKd' are only
+# used at the API/DB edge.
+
+RANKS = '23456789TJQKA'
+SUITS = 'dchs'
+
+NEW_DECK = bytes(range(52))
+
+CARD_STRS = [r + s for s in SUITS for r in RANKS]
+CARD_BITS = [1 << (16 * (c // 13) + c % 13) for c in range(52)]
+_CARD_INTS = {s: c for c, s in enumerate(CARD_STRS)}
+
+
+def card_from_str(card: str) -> int:
+    return _CARD_INTS[card]
+
+
+def card_to_str(card: int) -> str:
+    return CARD_STRS[card]
+
+
+def cards_from_str(cards: str) -> bytes:
+    return bytes(_CARD_INTS[cards[i:i+2]] for i in range(0, len(cards), 2))
+
+
+def cards_to_str(cards: Iterable[int]) -> str:
+    return ''.join(CARD_STRS[c] for c in cards)
+
+
+def cards_mask(cards: Iterable[int]) -> int:
+    mask = 0
+    for c in cards:
+        mask |= CARD_BITS[c]
+    return mask
+
+
+def mask_to_cards(mask: int) -> List[int]:
+    return [c for c in range(52) if mask & CARD_BITS[c]]
+
+
+# (n, bits) for each Fisher-Yates draw of a 52 card shuffle.
+_DRAWS = [(n, n.bit_length()) for n in range(52, 1, -1)]
+
+
+def shuffled_deck(seed: int) -> bytearray:
+    # The order random.Random(seed).shuffle gives a new deck, drawn the
+    # same way without its per-card method calls. Hands are replayed from
+    # their seed, so this must never change.
+    getrandbits = random.Random(seed).getrandbits
+    cards = bytearray(NEW_DECK)
+    for n, bits in _DRAWS:
+        j = getrandbits(bits)
+        while j >= n:
+            j = getrandbits(bits)
+        i = n - 1
+        cards[i], cards[j] = cards[j], cards[i]
+    return cards
+
+
+class Deck:
+    cards: bytearray
+    pos: int
+
+    def __init__(self, cards: bytes = NEW_DECK):
+        self.cards = bytearray(cards)
+        self.pos = 0
+
+    @classmethod
+    def from_str(cls, cards: str) -> 'Deck':
+        return cls(cards_from_str(cards))
+
+    def to_str(self) -> str:
+        return cards_to_str(self.cards[self.pos:])
+
+    def reset(self):
+        self.cards[:] = NEW_DECK
+        self.pos = 0
+
+    def shuffle(self, rng=random):
+        rng.shuffle(self.cards)
+        self.pos = 0
+
+    def load(self, cards: bytes):
+        self.cards[:] = cards
+        self.pos = 0
+
+    def deal(self, n: int) -> bytes:
+        if self.pos + n > len(self.cards):
+            raise Exception(f'Cannot deal {n} cards, only {len(self)} left in the deck')
+        cards = bytes(self.cards[self.pos:self.pos+n])
+        self.pos += n
+        return cards
+
+    def __len__(self):
+        return len(self.cards) - self.pos
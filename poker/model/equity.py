@@ -0,0 +1,116 @@
+from itertools import combinations
+from math import comb
+from typing import List, Sequence
+import numpy as np
+from poker.model.cards import CARD_BITS, cards_from_str
+from poker.model.evaluator import _FLUSHES, _MASK_PRODUCTS, _UNSUITED
+
+# Vectorized version of evaluator.evaluate_mask: runouts are arrays of card
+# masks, flushes come from the same rank mask table and non-flush prime
+# products are looked up with a binary search over the sorted keys.
+
+EXHAUSTIVE_LIMIT = 200000
+DEFAULT_SAMPLES = 100000
+CHUNK_SIZE = 65536
+
+_CARD_BITS = np.array(CARD_BITS, dtype=np.uint64)
+_FLUSH_SCORES = np.array(_FLUSHES, dtype=np.int16)
+_LANE_PRODUCTS = np.array(_MASK_PRODUCTS, dtype=np.int64)
+_UNSUITED_KEYS = np.array(sorted(_UNSUITED), dtype=np.int64)
+_UNSUITED_SCORES = np.array([_UNSUITED[k] for k in sorted(_UNSUITED)],
+                            dtype=np.int16)
+_LANE = np.uint64(0x1FFF)
+_SHIFTS = [np.uint64(16 * s) for s in range(4)]
+
+
+def evaluate_masks(masks: np.ndarray) -> np.ndarray:
+    lanes = [((masks >> shift) & _LANE).astype(np.intp) for shift in _SHIFTS]
+    flush = np.maximum(np.maximum(_FLUSH_SCORES[lanes[0]], _FLUSH_SCORES[lanes[1]]),
+                       np.maximum(_FLUSH_SCORES[lanes[2]], _FLUSH_SCORES[lanes[3]]))
+    product = (_LANE_PRODUCTS[lanes[0]] * _LANE_PRODUCTS[lanes[1]]
+               * _LANE_PRODUCTS[lanes[2]] * _LANE_PRODUCTS[lanes[3]])
+    unsuited = _UNSUITED_SCORES[np.searchsorted(_UNSUITED_KEYS, product)]
+    return np.where(flush > 0, flush, unsuited)
+
+
+def _mask(cards) -> int:
+    mask = 0
+    for c in cards:
+        mask |= CARD_BITS[c]
+    return mask
+
+
+def _draw(rng, n: int, size: int, needed: int) -> np.ndarray:
+    # Draw with replacement and redraw the rows that repeated a card, which
+    # is much cheaper than a partial shuffle of every row when only a few
+    # cards are needed.
+    picks = rng.integers(0, size, (n, needed), dtype=np.intp)
+    rows = np.arange(n)
+    while True:
+        ordered = np.sort(picks[rows], axis=1)
+        rows = rows[(ordered[:, 1:] == ordered[:, :-1]).any(axis=1)]
+        if not len(rows):
+            return picks
+        picks[rows] = rng.integers(0, size, (len(rows), needed), dtype=np.intp)
+
+
+def _tally(hole_masks: np.ndarray, board_masks: np.ndarray, totals: np.ndarray):
+    scores = evaluate_masks(board_masks[:, None] | hole_masks[None, :])
+    best = scores == scores.min(axis=1)[:, None]
+    num_best = best.sum(axis=1)[:, None]
+    totals[0] += (best & (num_best == 1)).sum(axis=0)
+    totals[1] += (best & (num_best > 1)).sum(axis=0)
+    totals[2] += (best / num_best).sum(axis=0)
+
+
+def equity(hands: Sequence[Sequence[int]], board: Sequence[int] = b'',
+           samples: int = DEFAULT_SAMPLES, seed=None,
+           exhaustive_limit: int = EXHAUSTIVE_LIMIT) -> dict:
+    hands = [bytes(h) for h in hands]
+    board = bytes(board)
+    if len(hands) < 2:
+        raise ValueError('Equity needs at least two hands')
+    if any(len(h) != 2 for h in hands):
+        raise ValueError('Each hand must have two cards')
+    if len(board) > 5:
+        raise ValueError('Board cannot have more than five cards')
+    known = b''.join(hands) + board
+    if len(set(known)) != len(known) or any(c >= 52 for c in known):
+        raise ValueError('Cards must be distinct')
+
+    hole_masks = np.array([_mask(h) for h in hands], dtype=np.uint64)
+    board_mask = np.uint64(_mask(board))
+    remaining = np.array([c for c in range(52) if c not in known], dtype=np.intp)
+    needed = 5 - len(board)
+    totals = np.zeros((3, len(hands)))
+
+    exhaustive = comb(len(remaining), needed) <= exhaustive_limit
+    if needed == 0:
+        runouts = 1
+        _tally(hole_masks, np.array([board_mask]), totals)
+    elif exhaustive:
+        runs = np.array(list(combinations(remaining, needed)), dtype=np.intp)
+        runouts = len(runs)
+        for start in range(0, runouts, CHUNK_SIZE):
+            cards = _CARD_BITS[runs[start:start+CHUNK_SIZE]]
+            _tally(hole_masks, np.bitwise_or.reduce(cards, axis=1) | board_mask,
+                   totals)
+    else:
+        rng = np.random.default_rng(seed)
+        runouts = samples
+        for start in range(0, samples, CHUNK_SIZE):
+            n = min(CHUNK_SIZE, samples - start)
+            cards = _CARD_BITS[remaining[_draw(rng, n, len(remaining), needed)]]
+            _tally(hole_masks, np.bitwise_or.reduce(cards, axis=1) | board_mask,
+                   totals)
+
+    win, tie, share = totals / runouts
+    return {'runouts': runouts,
+            'exhaustive': exhaustive,
+            'players': [{'win': float(w), 'tie': float(t), 'equity': float(e)}
+                        for w, t, e in zip(win, tie, share)]}
+
+
+def equity_str(hands: List[str], board: str = '', **kwargs) -> dict:
+    return equity([cards_from_str(h) for h in hands], cards_from_str(board),
+                  **kwargs)
@@ -0,0 +1,149 @@
+from itertools import combinations
+from typing import Iterable, List
+from poker.model.cards import cards_from_str, cards_mask
+
+# Hands are scored Cactus Kev style: 1 is a royal flush and 7462 is 7-5-4-3-2
+# offsuit, so lower is better. Non-flush hands are keyed by the product of
+# one prime per rank (the product is the same for any ordering of the cards)
+# and flushes are keyed by the 13-bit mask of ranks in the flush suit. Both
+# tables are precomputed for 5, 6 and 7 cards, so scoring a hand is one
+# multiply per card plus a single lookup.
+
+PRIMES = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41]
+
+HAND_CATEGORIES = ['straight_flush', 'four_of_a_kind', 'full_house', 'flush',
+                   'straight', 'three_of_a_kind', 'two_pair', 'pair',
+                   'high_card']
+# Worst score in each of the categories above.
+_CATEGORY_LIMITS = [10, 166, 322, 1599, 1609, 2467, 3325, 6185, 7462]
+
+WORST_HAND = 7462
+
+_STRAIGHTS = [0x1F00 >> i for i in range(9)] + [0x100F]
+
+_DESC = list(range(12, -1, -1))
+
+
+def _product(ranks) -> int:
+    product = 1
+    for r in ranks:
+        product *= PRIMES[r]
+    return product
+
+
+def _mask(ranks) -> int:
+    mask = 0
+    for r in ranks:
+        mask |= 1 << r
+    return mask
+
+
+def _ranks_in(mask) -> List[int]:
+    return [r for r in _DESC if mask & (1 << r)]
+
+
+def _build_five_card_tables():
+    flushes = [0] * 8192
+    unsuited = {}
+    five_bit = sorted((_mask(c) for c in combinations(range(13), 5)),
+                      reverse=True)
+    no_straight = [m for m in five_bit if m not in _STRAIGHTS]
+    score = 1
+    for m in _STRAIGHTS:
+        flushes[m] = score
+        score += 1
+    for q in _DESC:
+        for k in _DESC:
+            if k != q:
+                unsuited[PRIMES[q] ** 4 * PRIMES[k]] = score
+                score += 1
+    for t in _DESC:
+        for p in _DESC:
+            if p != t:
+                unsuited[PRIMES[t] ** 3 * PRIMES[p] ** 2] = score
+                score += 1
+    for m in no_straight:
+        flushes[m] = score
+        score += 1
+    for m in _STRAIGHTS:
+        unsuited[_product(_ranks_in(m))] = score
+        score += 1
+    for t in _DESC:
+        others = [r for r in _DESC if r != t]
+        for k in combinations(others, 2):
+            unsuited[PRIMES[t] ** 3 * _product(k)] = score
+            score += 1
+    for hi, lo in combinations(_DESC, 2):
+        for k in _DESC:
+            if k not in (hi, lo):
+                unsuited[PRIMES[hi] ** 2 * PRIMES[lo] ** 2 * PRIMES[k]] = score
+                score += 1
+    for p in _DESC:
+        others = [r for r in _DESC if r != p]
+        for k in combinations(others, 3):
+            unsuited[PRIMES[p] ** 2 * _product(k)] = score
+            score += 1
+    for m in no_straight:
+        unsuited[_product(_ranks_in(m))] = score
+        score += 1
+    assert score - 1 == WORST_HAND
+    return flushes, unsuited
+
+
+def _build_tables():
+    flushes, unsuited = _build_five_card_tables()
+    # A 6 or 7 card flush is worth its best 5 card subset. Masks are
+    # visited in increasing order so every subset is already scored.
+    for m in range(8192):
+        if bin(m).count('1') in (6, 7):
+            flushes[m] = min(flushes[m & ~(1 << r)]
+                             for r in range(13) if m & (1 << r))
+    # Same for rank multisets: dropping one card from a 6 or 7 card
+    # multiset gives a smaller multiset that has already been scored.
+    fourth_powers = list(zip(PRIMES, [p ** 4 for p in PRIMES]))
+    level = unsuited
+    for _ in (6, 7):
+        grown = {}
+        for key, score in level.items():
+            for p, p4 in fourth_powers:
+                if key % p4:
+                    child = key * p
+                    if score < grown.get(child, WORST_HAND + 1):
+                        grown[child] = score
+        unsuited.update(grown)
+        level = grown
+    return flushes, unsuited
+
+
+_FLUSHES, _UNSUITED = _build_tables()
+
+# Product of the rank primes for every 13-bit rank mask.
+_MASK_PRODUCTS = [_product(r for r in range(13) if m & (1 << r))
+                  for m in range(8192)]
+
+
+def evaluate_mask(mask: int) -> int:
+    d = mask & 0x1FFF
+    c = (mask >> 16) & 0x1FFF
+    h = (mask >> 32) & 0x1FFF
+    s = mask >> 48
+    score = _FLUSHES[d] or _FLUSHES[c] or _FLUSHES[h] or _FLUSHES[s]
+    if score:
+        return score
+    return _UNSUITED[_MASK_PRODUCTS[d] * _MASK_PRODUCTS[c]
+                     * _MASK_PRODUCTS[h] * _MASK_PRODUCTS[s]]
+
+
+def evaluate(cards: Iterable[int]) -> int:
+    return evaluate_mask(cards_mask(cards))
+
+
+def evaluate_str(cards: str) -> int:
+    return evaluate_mask(cards_mask(cards_from_str(cards)))
+
+
+def hand_category(score: int) -> str:
+    for name, limit in zip(HAND_CATEGORIES, _CATEGORY_LIMITS):
+        if score <= limit:
+            return name
+    raise ValueError(f'Invalid hand score {score}')
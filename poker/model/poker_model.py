@@ -1,10 +1,68 @@
 from poker.repo.poker_repo import *
-from typing import List
+from poker.model.cards import Deck, cards_from_str, cards_to_str, cards_mask, shuffled_deck
+from poker.model.evaluator import evaluate_mask
+from typing import List, Tuple
 from enum import Enum
-import random
+import logging
+import secrets
+
+
+logger = logging.getLogger(__name__)
+
+
+def diff_row(saved: dict, row: dict) -> dict:
+    return {k: v for k, v in row.items() if k not in saved or saved[k] != v}
+
+
+def public_row(row: dict, private_fields) -> dict:
+    return {k: v for k, v in row.items() if k not in private_fields}
+
+
+def row_converters(fields, load=None, dump=None) -> tuple:
+    # Generates straight-line load_row/to_row methods for the given columns,
+    # the way namedtuple does, so converting a row is one attribute store or
+    # dict entry per column. Columns missing from a row load as None.
+    load = load or {}
+    dump = dump or {}
+    namespace = {}
+    lines = ['def load_row(self, row):', '    get = row.get']
+    for f in fields:
+        if f in load:
+            namespace['load_' + f] = load[f]
+            lines.append('    self.{0} = load_{0}(get({0!r}))'.format(f))
+        else:
+            lines.append('    self.{0} = get({0!r})'.format(f))
+    lines.append('def to_row(self):')
+    lines.append('    return {' + ', '.join(
+        ('{0!r}: dump_{0}(self.{0})' if f in dump else '{0!r}: self.{0}').format(f)
+        for f in fields) + '}')
+    namespace.update(('dump_' + f, fn) for f, fn in dump.items())
+    exec('\n'.join(lines), namespace)
+    return namespace['load_row'], namespace['to_row']
+
+
+def new_player(game_id, user_id, seat_num, buyin) -> dict:
+    return {'game_id': game_id,
+            'user_id': user_id,
+            'seat_num': seat_num,
+            'buyin': buyin,
+            'stack': buyin,
+            'bet_amt': 0,
+            'sitting_out': False,
+            'is_active': False,
+            'has_acted': False,
+            'has_folded': False,
+            'amt_in_pot': 0,
+            'hand': ''}
+
+
+PLAYER_FIELDS = ('game_id', 'user_id', 'seat_num', 'buyin', 'stack',
+                 'bet_amt', 'amt_in_pot', 'position', 'is_active',
+                 'sitting_out', 'has_folded', 'has_acted', 'hand')
 
 
 class Player:
+    __slots__ = PLAYER_FIELDS + ('_saved',)
     game_id: str
     user_id: str
     seat_num: int
@@ -17,11 +75,20 @@ class Player:
     amt_in_pot: int
     has_folded: bool
     has_acted: bool
-    hand: str
+    hand: bytes
 
-    def __init__(self, player_dict: dict):
-        for key, value in player_dict.items():
-            setattr(self, key, value)
+    load_row, to_row = row_converters(
+        PLAYER_FIELDS,
+        load={'hand': lambda hand: cards_from_str(hand or '')},
+        dump={'hand': cards_to_str})
+
+    def __init__(self, player_dict: dict, is_new=False):
+        self.load_row(player_dict)
+        self._saved = None if is_new else self.to_row()
+
+    @classmethod
+    def from_row(cls, row: dict, is_new=False) -> 'Player':
+        return cls(row, is_new)
 
     def reset(self):
         self.is_active = False
@@ -29,7 +96,7 @@ class Player:
         self.bet_amt = 0
         self.has_folded = False
         self.has_acted = False
-        self.hand = ''
+        self.hand = b''
 
     def bet(self, bet_amt):
         if bet_amt > self.stack:
@@ -45,7 +112,11 @@ class Players:
     players: List[Player]
 
     def __init__(self, players_dict: List[dict]):
-        self.players = [Player(p) for p in players_dict]
+        self.players = [Player.from_row(p) for p in players_dict]
+        self.players.sort(key=lambda x: x.seat_num)
+
+    def add_player(self, player: Player):
+        self.players.append(player)
         self.players.sort(key=lambda x: x.seat_num)
 
     def get_sitting_players(self) -> List[Player]:
@@ -58,12 +129,11 @@ class Players:
     def set_initial_active(self):
         players = self.get_sitting_players()
         bets = {p.bet_amt for p in players}
-        if len(bets) == 1 and bets.pop() == 0:
-            players[0].is_active = True
-        elif len(players) > 2:
-            players[2].is_active = True
-        else:
-            players[0].is_active = True
+        first = 2 if len(players) > 2 and not (len(bets) == 1 and bets.pop() == 0) else 0
+        order = players[first:] + players[:first]
+        # Players who are all in have nothing left to act with.
+        can_act = [p for p in order if not p.has_folded and p.stack > 0]
+        (can_act or order)[0].is_active = True
 
     def get_small_blind(self):
         return self.get_sitting_players()[0]
@@ -79,12 +149,25 @@ class Players:
 
     def all_have_acted(self):
         return all(p.has_acted for p in self.players
-                   if not p.sitting_out and not p.has_folded)
+                   if not p.sitting_out and not p.has_folded and p.stack > 0)
 
     def bets_are_equal(self):
-        bets = {p.bet_amt for p in self.players
-                if not p.sitting_out and not p.has_folded}
-        return len(bets)==1
+        # Players who are all in for less than the highest bet can't match it.
+        highest_bet = self.highest_bet()
+        return all(p.bet_amt == highest_bet for p in self.players
+                   if not p.sitting_out and not p.has_folded and p.stack > 0)
+
+    def get_live_players(self) -> List[Player]:
+        return [p for p in self.players
+                if not p.sitting_out and not p.has_folded]
+
+    def all_in(self) -> bool:
+        # No more betting is possible: at most one live player has chips
+        # left and they have matched the highest bet.
+        live = self.get_live_players()
+        with_chips = [p for p in live if p.stack > 0]
+        return len(live) > 1 and (not with_chips or (
+            len(with_chips) == 1 and with_chips[0].bet_amt >= self.highest_bet()))
 
 
 class State(Enum):
@@ -95,13 +178,28 @@ class State(Enum):
     RIVER = 5
 
 
-new_deck = 'Ad2d3d4d5d6d7d8d9dTdJdQdKd' + \
-           'Ac2c3c4c5c6c7c8c9cTcJcQcKc' + \
-           'Ah2h3h4h5h6h7h8h9hThJhQhKh' + \
-           'As2s3s4s5s6s7s8s9sTsJsQsKs'
+# A snapshot of the game is stored every SNAPSHOT_INTERVAL logged actions so
+# replaying a game never has to go through its whole history.
+SNAPSHOT_INTERVAL = 50
+
+# Actions taken by a tournament when a hand ends, before the next is dealt.
+BETWEEN_HANDS_ACTIONS = ('leave', 'small_blind', 'big_blind')
+
+
+GAME_FIELDS = ('game_id', 'game_type', 'num_seats', 'big_blind', 'small_blind',
+               'min_buyin', 'max_buyin', 'table_name', 'state_cd', 'pot_amt',
+               'board', 'deck', 'deck_seed', 'action_seq', 'version',
+               'tournament_id', 'seated', 'hands_played', 'pot_total',
+               'hand_start_seq')
 
 
 class Game:
+    __slots__ = GAME_FIELDS + ('players', 'on_hand_end', 'publisher',
+                               'deck_source', '_saved',
+                               '_pending_actions', '_pending_hands',
+                               '_pending_writes', '_after_save', '_removed_players',
+                               '_winnings',
+                               '_seed_override', '_rng')
     game_id: str
     game_type: str
     num_seats: int
@@ -113,30 +211,80 @@ class Game:
     state_cd: State
     players: Players
     pot_amt: int
-    board: str
-    deck: str
-
-    def __init__(self, game_dict: dict, players_dict: List[dict]):
-        for key, value in game_dict.items():
-            if key == 'state_cd':
-                setattr(self, key, State[value])
-            else:
-                setattr(self, key, value)
-        self.deck = new_deck
-        self.board = ''
+    board: bytearray
+    deck: Deck
+    deck_seed: int
+    action_seq: int
+    version: int
+    # Lobby summary, kept up to date as players come and go and hands end
+    # so listing tables never has to look at the players.
+    seated: int
+    hands_played: int
+    pot_total: int
+    # Actions with a seq above this belong to the hand being played.
+    hand_start_seq: int
+
+    load_row, to_row = row_converters(
+        GAME_FIELDS,
+        load={'state_cd': lambda state_cd: State[state_cd] if state_cd else None,
+              'deck': lambda deck: Deck.from_str(deck) if deck else Deck(),
+              'board': lambda board: bytearray(cards_from_str(board or '')),
+              'action_seq': lambda action_seq: action_seq or 0,
+              'seated': lambda seated: seated or 0,
+              'hands_played': lambda hands_played: hands_played or 0,
+              'pot_total': lambda pot_total: pot_total or 0,
+              'hand_start_seq': lambda hand_start_seq: hand_start_seq or 0},
+        dump={'state_cd': lambda state_cd: state_cd.name if state_cd else None,
+              'deck': Deck.to_str,
+              'board': cards_to_str})
+
+    def __init__(self, game_dict: dict, players_dict: List[dict], rng=None):
+        self.load_row(game_dict)
         self.players = Players(players_dict)
+        self._saved = self.to_row()
+        self._pending_actions = []
+        self._pending_hands = []
+        self._pending_writes = []
+        self._after_save = []
+        self._removed_players = []
+        self._winnings = {}
+        self._seed_override = None
+        self._rng = rng
+        # Called with the game after each hand, before the next one is dealt.
+        self.on_hand_end = None
+        # Set by the service layer: where saved changes are published (with
+        # has_subscribers and publish), and a function returning the seed
+        # and deck for each new hand, or None to use the seeds below.
+        self.publisher = None
+        self.deck_source = None
+
+    @classmethod
+    def from_row(cls, row: dict, player_rows: List[dict], rng=None) -> 'Game':
+        return cls(row, player_rows, rng)
 
     def post_blinds(self):
         sitting_players = self.players.get_sitting_players()
         sb = sitting_players[0]
         bb = sitting_players[1]
-        sb.bet(self.small_blind)
-        bb.bet(self.big_blind)
+        sb.bet(min(self.small_blind, sb.stack))
+        bb.bet(min(self.big_blind, bb.stack))
+
+    def new_deck(self) -> Tuple[int, bytearray]:
+        # The seed and deck for the next hand. A replayed hand is dealt again
+        # from the seed logged with its actions.
+        deck = self.deck_source() if self.deck_source is not None else None
+        if deck is not None:
+            return deck
+        if self._seed_override is not None:
+            seed = self._seed_override
+        elif self._rng is not None:
+            seed = self._rng.getrandbits(63)
+        else:
+            seed = secrets.randbits(63)
+        return seed, shuffled_deck(seed)
 
     def shuffle_deck(self):
-        cards = [self.deck[i:i+2] for i in range(0, len(self.deck), 2)]
-        random.shuffle(cards)
-        self.deck = ''.join(cards)
+        self.deck.load(shuffled_deck(self.deck_seed))
 
     def collect_bets(self):
         for p in self.players.get_sitting_players():
@@ -145,28 +293,116 @@ class Game:
             p.bet_amt = 0
 
     def deal_flop(self):
-        self.board = self.deck[:6]
-        self.deck = self.deck[6:]
+        self.board[:] = self.deck.deal(3)
 
     def deal_turn_river(self):
-        self.board += self.deck[:2]
-        self.deck = self.deck[2:]
+        self.board += self.deck.deal(1)
 
     def deal_hands(self):
         for p in self.players.get_sitting_players():
-            p.hand = self.deck[:2]
-            self.deck = self.deck[2:]
+            p.hand = self.deck.deal(2)
+
+    def get_pots(self) -> List[dict]:
+        contributors = [p for p in self.players.players if p.amt_in_pot]
+        pots = []
+        prev_level = 0
+        for level in sorted({p.amt_in_pot for p in contributors}):
+            amount = sum(min(p.amt_in_pot, level) - min(p.amt_in_pot, prev_level)
+                         for p in contributors)
+            eligible = [p for p in contributors
+                        if p.amt_in_pot >= level and not p.has_folded]
+            if not eligible and not pots:
+                eligible = self.players.get_live_players()
+            if pots and (not eligible or eligible == pots[-1]['players']):
+                pots[-1]['amount'] += amount
+            else:
+                pots.append({'amount': amount, 'players': eligible})
+            prev_level = level
+        return pots
+
+    def showdown(self) -> List[dict]:
+        scores = {}
+        if len(self.players.get_live_players()) > 1:
+            board_mask = cards_mask(self.board)
+            for p in self.players.get_live_players():
+                scores[p.user_id] = evaluate_mask(cards_mask(p.hand) | board_mask)
+        results = []
+        for pot in self.get_pots():
+            best = min(scores.get(p.user_id, 0) for p in pot['players'])
+            winners = [p for p in pot['players']
+                       if scores.get(p.user_id, 0) == best]
+            share, remainder = divmod(pot['amount'], len(winners))
+            for i, p in enumerate(winners):
+                won = share + (1 if i < remainder else 0)
+                p.stack += won
+                self._winnings[p.user_id] = self._winnings.get(p.user_id, 0) + won
+            self.pot_amt -= pot['amount']
+            results.append({'amount': pot['amount'],
+                            'winners': [p.user_id for p in winners]})
+        logger.debug('hand finished', extra={'game_id': self.game_id, 'pots': results})
+        return results
+
+    def hand_record(self) -> dict:
+        # What happened in the hand that just ended, read before the players
+        # are reset. The hand's actions are the logged ones with a seq in
+        # (start_seq, end_seq].
+        players = []
+        for p in self.players.players:
+            if not p.hand:
+                continue
+            won = self._winnings.get(p.user_id, 0)
+            players.append({'user_id': p.user_id,
+                            'seat_num': p.seat_num,
+                            'position': p.position,
+                            'hand': cards_to_str(p.hand),
+                            'stack': p.stack - won + p.amt_in_pot,
+                            'amt_in_pot': p.amt_in_pot,
+                            'won': won,
+                            'has_folded': p.has_folded})
+        return {'game_id': self.game_id,
+                'hand_num': self.hands_played,
+                'table_name': self.table_name,
+                'game_type': self.game_type,
+                'small_blind': self.small_blind,
+                'big_blind': self.big_blind,
+                'deck_seed': self.deck_seed,
+                'board': cards_to_str(self.board),
+                'pot': sum(p['amt_in_pot'] for p in players),
+                'start_seq': self.hand_start_seq,
+                'end_seq': self.action_seq + len(self._pending_actions),
+                'players': players}
+
+    def end_hand(self):
+        self.hands_played += 1
+        self.pot_total += sum(p.amt_in_pot for p in self.players.players)
+        self._pending_hands.append(self.hand_record())
+        self._winnings = {}
+        for p in self.players.players:
+            p.reset()
+            if p.stack == 0:
+                p.sitting_out = True
+        self.pot_amt = 0
+        self.board.clear()
+        self.deck.reset()
+        self.state_cd = State.STARTING
+        if self.on_hand_end is not None:
+            self.on_hand_end(self)
 
     def init_round(self, state_cd):
+        logger.debug('starting round', extra={'game_id': self.game_id,
+                                              'state': state_cd.name})
         self.state_cd = state_cd
         if state_cd in (State.FLOP, State.TURN, State.RIVER):
             self.collect_bets()
+            for p in self.players.get_live_players():
+                if p.stack > 0:
+                    p.has_acted = False
         if state_cd == State.PREFLOP:
-            print('setting positions')
+            self.hand_start_seq = self.action_seq + len(self._pending_actions)
             self.players.init_positions()
-            print('posting blinds')
             self.post_blinds()
-            print('dealing hands')
+            self.deck_seed, cards = self.new_deck()
+            self.deck.load(cards)
             self.deal_hands()
         elif state_cd == State.FLOP:
             self.deal_flop()
@@ -175,44 +411,261 @@ class Game:
         elif state_cd == State.RIVER:
             self.deal_turn_river()
         self.players.set_initial_active()
+        if state_cd == State.PREFLOP and self.players.all_in():
+            # Nobody can act in a hand the blinds put everyone all in for, so
+            # its seed is logged here rather than with a player's action.
+            self.log_action('deal', None, 0)
 
 
     def is_end_of_round(self):
         return (self.state_cd in (State.PREFLOP, State.FLOP, State.TURN, State.RIVER)
-                and self.players.all_have_acted()
-                and self.players.bets_are_equal())
+                and (self.players.all_in()
+                     or (self.players.all_have_acted() and self.players.bets_are_equal())))
 
-    def update_state(self, db):
-        print('updating state')
-        sitting_players = self.players.get_sitting_players()
+    def advance(self) -> bool:
+        # Once nobody can bet, the rest of the board is dealt straight out
+        # rather than waiting on players who are all in.
         changed = False
-        if self.state_cd == State.STARTING and len(sitting_players) > 1:
-            print('starting preflop')
-            self.init_round(State.PREFLOP)
+        while self.advance_once():
+            changed = True
+        return changed
+
+    def advance_once(self) -> bool:
+        changed = False
+        if (self.state_cd != State.STARTING
+                and len(self.players.get_live_players()) == 1):
+            self.collect_bets()
+            self.showdown()
+            self.end_hand()
             changed = True
         elif self.is_end_of_round():
             if self.state_cd != State.RIVER:
                 next_state = State(self.state_cd.value + 1)
                 self.init_round(next_state)
             else:
-                pass
+                self.collect_bets()
+                self.showdown()
+                self.end_hand()
+            changed = True
+        sitting_players = self.players.get_sitting_players()
+        if self.state_cd == State.STARTING and len(sitting_players) > 1:
+            self.init_round(State.PREFLOP)
             changed = True
-        if changed:
+        return changed
+
+    def update_state(self, db):
+        changed = self.advance()
+        self.save(db)
+        return changed
+
+    def save(self, db):
+        # Without a db the game only lives in memory, so there is nothing to
+        # keep the logged actions for.
+        if db is None:
+            self.pop_actions()
+            self._pending_hands = []
+            self._pending_writes = []
+            self.run_after_save()
+        else:
             self.update_db(db)
 
     def update_db(self, db):
-        update_players(db, [vars(p) for p in self.players.players])
-        game_dict = vars(self)
-        del game_dict['players']
-        game_dict['state_cd'] = self.state_cd.name
-        update_game(db, game_dict)
-
-    def act(self, db, action_cd, user_id, **kwargs):
+        player_rows = []
+        player_changes = []
+        new_players = []
+        for p in self.players.players:
+            row = p.to_row()
+            if p._saved is None:
+                player_rows.append((p, row))
+                new_players.append(row)
+                continue
+            changes = diff_row(p._saved, row)
+            if changes:
+                changes['game_id'] = p.game_id
+                changes['user_id'] = p.user_id
+                player_rows.append((p, row))
+                player_changes.append(changes)
+        actions = self._pending_actions
+        for i, action in enumerate(actions):
+            action['seq'] = self.action_seq + i + 1
+        if actions:
+            self.action_seq += len(actions)
+        game_row = self.to_row()
+        game_changes = diff_row(self._saved, game_row)
+        removed = [{'game_id': self.game_id, 'user_id': user_id}
+                   for user_id in self._removed_players]
+        hands = self._pending_hands
+        writes = self._pending_writes
+        if not (game_changes or player_changes or new_players or removed or writes):
+            self.run_after_save()
+            return
+        expected_version = self.version
+        self.version = (expected_version or 0) + 1
+        game_row['version'] = game_changes['version'] = self.version
+        game_changes['game_id'] = self.game_id
+        snapshot_due = (self.action_seq // SNAPSHOT_INTERVAL
+                        > (self.action_seq - len(actions)) // SNAPSHOT_INTERVAL)
+        try:
+            with db:
+                delete_players(db, removed)
+                add_players(db, new_players)
+                update_players(db, player_changes)
+                update_game(db, game_changes, expected_version)
+                insert_actions(db, actions)
+                insert_hands(db, hands)
+                if snapshot_due:
+                    insert_snapshot(db, self.game_id, self.action_seq,
+                                    self.get_snapshot())
+                for fn in writes:
+                    fn(db)
+        except Exception:
+            if actions:
+                self.action_seq -= len(actions)
+            self.version = expected_version
+            raise
+        self._pending_actions = []
+        self._pending_hands = []
+        self._pending_writes = []
+        self._removed_players = []
+        for p, row in player_rows:
+            p._saved = row
+        self._saved = game_row
+        player_changes += new_players
+        if self.publisher is not None and self.publisher.has_subscribers(self.game_id):
+            self.publisher.publish(self.game_id, {
+                'version': self.version,
+                'game': public_row(game_changes, ('deck',)),
+                'players': {c['user_id']: public_row(c, ('hand', 'game_id'))
+                            for c in player_changes},
+                'hands': {c['user_id']: c['hand']
+                          for c in player_changes if 'hand' in c}})
+        self.run_after_save()
+
+    def get_state(self, user_id=None) -> dict:
+        state = public_row(self.to_row(), ('deck',))
+        state['players'] = {p.user_id: public_row(p.to_row(), ('hand', 'game_id'))
+                            for p in self.players.players}
+        if any(p.user_id == user_id for p in self.players.players):
+            state['hand'] = cards_to_str(self.players.get_player(user_id).hand)
+        return state
+
+    def get_snapshot(self) -> dict:
+        return {'game': self.to_row(),
+                'players': [p.to_row() for p in self.players.players]}
+
+    def mark_saved(self):
+        for p in self.players.players:
+            p._saved = p.to_row()
+        self._saved = self.to_row()
+        self._pending_actions = []
+        self._pending_hands = []
+
+    def defer_write(self, fn):
+        # fn(db) runs in the transaction that next saves the game, for state
+        # kept elsewhere that must not be written unless the game is.
+        self._pending_writes.append(fn)
+
+    def after_save(self, fn):
+        # fn() runs once the game's next save has committed, for work that
+        # must not happen if the save fails and the action is retried.
+        self._after_save.append(fn)
+
+    def run_after_save(self):
+        callbacks, self._after_save = self._after_save, []
+        for fn in callbacks:
+            fn()
+
+    def pop_actions(self) -> List[dict]:
+        actions, self._pending_actions = self._pending_actions, []
+        return actions
+
+    def log_action(self, action_cd, user_id, amount, seat_num=None) -> dict:
+        action = {'game_id': self.game_id,
+                  'user_id': user_id,
+                  'action_cd': action_cd,
+                  'amount': amount,
+                  'seat_num': seat_num,
+                  'deck_seed': self.deck_seed}
+        self._pending_actions.append(action)
+        return action
+
+    def join(self, player_dict: dict, advance=True):
+        # Seating several players at once passes advance=False for all but
+        # the last, so the hand starts with everyone dealt in.
+        player = Player(player_dict, is_new=True)
+        if self.state_cd != State.STARTING:
+            # Players joining mid hand wait for the next one.
+            player.has_folded = True
+        self.players.add_player(player)
+        self.seated += 1
+        action = self.log_action('join' if advance else 'seat', player.user_id,
+                                 player.buyin, player.seat_num)
+        if advance:
+            self.advance()
+            action['deck_seed'] = self.deck_seed
+
+    def leave(self, user_id):
+        player = self.players.get_player(user_id)
+        if self.state_cd != State.STARTING and not (player.has_folded or player.sitting_out):
+            raise Exception(f'Player {user_id} cannot leave during a hand')
+        self.players.players.remove(player)
+        self.seated -= 1
+        if player._saved is not None:
+            self._removed_players.append(user_id)
+        self.log_action('leave', user_id, player.stack, player.seat_num)
+
+    def rebuy(self, user_id, amount):
         player = self.players.get_player(user_id)
+        player.stack += amount
+        player.sitting_out = False
+        if self.state_cd != State.STARTING:
+            player.has_folded = True
+        action = self.log_action('rebuy', user_id, amount, player.seat_num)
+        self.advance()
+        action['deck_seed'] = self.deck_seed
+
+    def set_blinds(self, small_blind, big_blind):
+        # Takes effect from the next hand.
+        if small_blind != self.small_blind:
+            self.small_blind = small_blind
+            self.log_action('small_blind', None, small_blind)
+        if big_blind != self.big_blind:
+            self.big_blind = big_blind
+            self.log_action('big_blind', None, big_blind)
+
+    def replay_between_hands(self, action: dict):
+        if action['action_cd'] == 'leave':
+            self.leave(action['user_id'])
+        else:
+            setattr(self, action['action_cd'], action['amount'])
+
+    def replay(self, action: dict):
+        self._seed_override = action['deck_seed']
+        try:
+            if action['action_cd'] in ('join', 'seat'):
+                self.join(new_player(self.game_id, action['user_id'],
+                                     action['seat_num'], action['amount']),
+                          advance=action['action_cd'] == 'join')
+            elif action['action_cd'] in BETWEEN_HANDS_ACTIONS:
+                self.replay_between_hands(action)
+            elif action['action_cd'] == 'rebuy':
+                self.rebuy(action['user_id'], action['amount'])
+            else:
+                self.apply(action['action_cd'], action['user_id'],
+                           bet_amt=action['amount'])
+        finally:
+            self._seed_override = None
+        self.action_seq = action['seq']
+        self._pending_actions = []
+        self._pending_hands = []
+
+    def apply(self, action_cd, user_id, **kwargs):
+        player = self.players.get_player(user_id)
+        stack = player.stack
         if action_cd == 'check_call':
             highest_bet = self.players.highest_bet()
             if player.bet_amt < highest_bet:
-                player.bet(highest_bet)
+                player.bet(min(highest_bet - player.bet_amt, player.stack))
         if action_cd == 'check_fold':
             if player.bet_amt < self.players.highest_bet():
                 player.fold()
@@ -220,4 +673,10 @@ class Game:
             bet_amt = kwargs['bet_amt']
             player.bet(bet_amt)
         player.has_acted = True
-        self.update_state(db)
+        action = self.log_action(action_cd, user_id, stack - player.stack)
+        self.advance()
+        action['deck_seed'] = self.deck_seed
+
+    def act(self, db, action_cd, user_id, **kwargs):
+        self.apply(action_cd, user_id, **kwargs)
+        self.save(db)
@@ -0,0 +1,336 @@
+from typing import Dict, List, NamedTuple, Optional
+from poker.model.poker_model import Game, new_player
+import json
+import math
+import random
+import threading
+import uuid
+
+
+class BlindLevel(NamedTuple):
+    small_blind: int
+    big_blind: int
+    seconds: int
+
+
+DEFAULT_SCHEDULE = [BlindLevel(sb, 2 * sb, 600)
+                    for sb in (25, 50, 75, 100, 150, 200, 300, 400, 500, 700,
+                               1000, 1500, 2000, 3000, 5000)]
+
+
+class Move(NamedTuple):
+    user_id: str
+    from_game_id: str
+    to_game_id: str
+    seat_num: int
+    stack: int
+
+
+class TournamentError(Exception):
+    pass
+
+
+def new_tournament(name, table_size=9, starting_stack=10000, max_entrants=None,
+                   start_at=None, schedule=DEFAULT_SCHEDULE, created_by=None) -> dict:
+    return {'tournament_id': str(uuid.uuid4()),
+            'name': name,
+            'state_cd': 'REGISTERING',
+            'table_size': table_size,
+            'starting_stack': starting_stack,
+            'max_entrants': max_entrants,
+            'schedule': json.dumps([list(level) for level in schedule]),
+            'level': 0,
+            'start_at': start_at,
+            'level_started_at': None,
+            'created_by': created_by}
+
+
+class Tournament:
+    # Seating is tracked here rather than read back from the tables: seats
+    # maps each table to its occupied seats and tables_by_count
+    # buckets tables by how many players they seat, so finding the
+    # shortest table after a hand costs O(table_size), however many tables
+    # are running.
+    tournament_id: str
+    entrants: Dict[str, dict]
+    seats: Dict[str, Dict[int, str]]
+
+    def __init__(self, tournament_row: dict, entrant_rows: List[dict] = ()):
+        self.tournament_id = tournament_row['tournament_id']
+        self.name = tournament_row['name']
+        self.state_cd = tournament_row['state_cd']
+        self.table_size = tournament_row['table_size']
+        self.starting_stack = tournament_row['starting_stack']
+        self.max_entrants = tournament_row.get('max_entrants')
+        self.schedule = [BlindLevel(*level) for level in json.loads(tournament_row['schedule'])]
+        self.level = tournament_row.get('level') or 0
+        self.start_at = tournament_row.get('start_at')
+        self.level_started_at = tournament_row.get('level_started_at')
+        self.created_by = tournament_row.get('created_by')
+        self.entrants = {e['user_id']: dict(e) for e in entrant_rows}
+        self.seats = {}
+        self.tables_by_count = [set() for _ in range(self.table_size + 1)]
+        self.remaining = 0
+        for e in self.entrants.values():
+            if e['game_id'] is not None:
+                self.seats.setdefault(e['game_id'], {})[e['seat_num']] = e['user_id']
+            if e['place'] is None:
+                self.remaining += 1
+        for game_id, seats in self.seats.items():
+            self.tables_by_count[len(seats)].add(game_id)
+        self.in_flight = {}
+        self.lock = threading.RLock()
+        self._saved = self.to_row()
+        self._new_entrants = []
+        self._changed_entrants = set()
+        self._removed_entrants = []
+
+    def to_row(self) -> dict:
+        return {'tournament_id': self.tournament_id,
+                'name': self.name,
+                'state_cd': self.state_cd,
+                'table_size': self.table_size,
+                'starting_stack': self.starting_stack,
+                'max_entrants': self.max_entrants,
+                'schedule': json.dumps([list(level) for level in self.schedule]),
+                'level': self.level,
+                'start_at': self.start_at,
+                'level_started_at': self.level_started_at,
+                'created_by': self.created_by}
+
+    def get_changes(self) -> dict:
+        # Everything changed since the last mark_saved, for one bulk write.
+        # Entrants are copied, as they may change again before it commits.
+        row = self.to_row()
+        changes = {k: v for k, v in row.items() if self._saved.get(k) != v}
+        new = [dict(e) for e in self._new_entrants]
+        changed = [dict(self.entrants[u]) for u in self._changed_entrants
+                   if u in self.entrants and self.entrants[u] not in self._new_entrants]
+        removed = [dict(e) for e in self._removed_entrants]
+        return {'tournament': changes, 'new_entrants': new,
+                'changed_entrants': changed, 'removed_entrants': removed}
+
+    def mark_saved(self, changes: dict):
+        # Called once changes from get_changes have committed. Anything that
+        # changed again in the meantime stays pending for the next write.
+        with self.lock:
+            self._saved.update(changes['tournament'])
+            inserted = {e['user_id'] for e in changes['new_entrants']}
+            deleted = {e['user_id'] for e in changes['removed_entrants']}
+            self._new_entrants = [e for e in self._new_entrants if e['user_id'] not in inserted]
+            self._removed_entrants = [e for e in self._removed_entrants
+                                      if e['user_id'] not in deleted]
+            for e in changes['new_entrants'] + changes['changed_entrants']:
+                entrant = self.entrants.get(e['user_id'])
+                if entrant is None:
+                    if e['user_id'] in inserted:
+                        self._removed_entrants.append(e)
+                elif entrant == e:
+                    self._changed_entrants.discard(e['user_id'])
+                else:
+                    self._changed_entrants.add(e['user_id'])
+
+    @property
+    def blinds(self) -> BlindLevel:
+        return self.schedule[self.level]
+
+    def next_level_at(self) -> Optional[float]:
+        if self.state_cd != 'RUNNING' or self.level + 1 >= len(self.schedule):
+            return None
+        return self.level_started_at + self.blinds.seconds
+
+    def register(self, user_id):
+        with self.lock:
+            if self.state_cd != 'REGISTERING':
+                raise TournamentError('Registration is closed.')
+            if user_id in self.entrants:
+                raise TournamentError('Already registered.')
+            if self.max_entrants and len(self.entrants) >= self.max_entrants:
+                raise TournamentError('Tournament is full.')
+            entrant = {'tournament_id': self.tournament_id, 'user_id': user_id,
+                       'game_id': None, 'seat_num': None, 'place': None}
+            self.entrants[user_id] = entrant
+            self._new_entrants.append(entrant)
+            self.remaining += 1
+
+    def unregister(self, user_id):
+        with self.lock:
+            if self.state_cd != 'REGISTERING':
+                raise TournamentError('Registration is closed.')
+            if user_id not in self.entrants:
+                raise TournamentError('Not registered.')
+            entrant = self.entrants.pop(user_id)
+            if entrant in self._new_entrants:
+                self._new_entrants.remove(entrant)
+            else:
+                self._removed_entrants.append(entrant)
+            self.remaining -= 1
+
+    def start(self, now, rng=random) -> List[tuple]:
+        # Returns (game row, player rows) for every table. Players are dealt
+        # round robin over a shuffled order, so table sizes differ by at most
+        # one from the start.
+        with self.lock:
+            if self.state_cd != 'REGISTERING':
+                raise TournamentError('Tournament has already started.')
+            if len(self.entrants) < 2:
+                raise TournamentError('At least two entrants are needed to start.')
+            user_ids = list(self.entrants)
+            rng.shuffle(user_ids)
+            num_tables = math.ceil(len(user_ids) / self.table_size)
+            tables = []
+            for i in range(num_tables):
+                game_row = self.new_table_row(i + 1)
+                players = []
+                for seat_num, user_id in enumerate(user_ids[i::num_tables], 1):
+                    players.append(new_player(game_row['game_id'], user_id, seat_num,
+                                              self.starting_stack))
+                    self.seat(user_id, game_row['game_id'], seat_num)
+                tables.append((game_row, players))
+            self.state_cd = 'RUNNING'
+            self.level = 0
+            self.level_started_at = now
+            return tables
+
+    def new_table_row(self, table_num) -> dict:
+        return {'game_id': str(uuid.uuid4()),
+                'game_type': 'texas_holdem',
+                'num_seats': self.table_size,
+                'small_blind': self.blinds.small_blind,
+                'big_blind': self.blinds.big_blind,
+                'min_buyin': self.starting_stack,
+                'max_buyin': self.starting_stack,
+                'table_name': '{} #{}'.format(self.name, table_num),
+                'state_cd': 'STARTING',
+                'pot_amt': 0,
+                'version': 0,
+                'action_seq': 0,
+                'tournament_id': self.tournament_id}
+
+    def seat(self, user_id, game_id, seat_num):
+        entrant = self.entrants[user_id]
+        if entrant['game_id'] is not None:
+            self.unseat(user_id)
+        seats = self.seats.setdefault(game_id, {})
+        self.tables_by_count[len(seats)].discard(game_id)
+        seats[seat_num] = user_id
+        self.tables_by_count[len(seats)].add(game_id)
+        entrant['game_id'] = game_id
+        entrant['seat_num'] = seat_num
+        self._changed_entrants.add(user_id)
+
+    def unseat(self, user_id):
+        entrant = self.entrants[user_id]
+        seats = self.seats[entrant['game_id']]
+        self.tables_by_count[len(seats)].discard(entrant['game_id'])
+        del seats[entrant['seat_num']]
+        self.tables_by_count[len(seats)].add(entrant['game_id'])
+        entrant['game_id'] = None
+        entrant['seat_num'] = None
+        self._changed_entrants.add(user_id)
+
+    def advance_level(self, now) -> BlindLevel:
+        # Tables pick up the new blinds when their current hand ends, so a
+        # level change never has to touch every table.
+        with self.lock:
+            if self.level + 1 < len(self.schedule):
+                self.level += 1
+            self.level_started_at = now
+            return self.blinds
+
+    def shortest_table(self, exclude=None) -> Optional[str]:
+        for tables in self.tables_by_count:
+            for game_id in tables:
+                if game_id != exclude:
+                    return game_id
+        return None
+
+    def hand_finished(self, game: Game) -> List[Move]:
+        # Called between hands of a table: busted players are eliminated,
+        # the table gets the current blinds and, if the field has shrunk
+        # enough, it is broken up or gives players to the shortest tables.
+        # The returned moves have already left this game and must be
+        # seated at their new tables with seat_moved_player.
+        # If the game's save fails, the hand ends again on the game as it was
+        # reloaded, so players already placed or moved are not counted twice.
+        with self.lock:
+            moves = []
+            for p in list(game.players.players):
+                entrant = self.entrants[p.user_id]
+                if entrant['game_id'] not in (game.game_id, None):
+                    game.leave(p.user_id)
+                    self.in_flight[p.user_id] = p.stack
+                    moves.append(Move(p.user_id, game.game_id, entrant['game_id'],
+                                      entrant['seat_num'], p.stack))
+            busted = [p for p in game.players.players if p.stack == 0]
+            out = [p for p in busted if self.entrants[p.user_id]['place'] is None]
+            place = self.remaining - len(out) + 1
+            for p in busted:
+                game.leave(p.user_id)
+                if self.entrants[p.user_id]['game_id'] == game.game_id:
+                    self.unseat(p.user_id)
+            for p in out:
+                self.entrants[p.user_id]['place'] = place
+                self._changed_entrants.add(p.user_id)
+                self.remaining -= 1
+            if self.remaining <= 1:
+                for p in game.players.players:
+                    self.entrants[p.user_id]['place'] = 1
+                    self._changed_entrants.add(p.user_id)
+                self.state_cd = 'FINISHED'
+                return moves
+            game.set_blinds(self.blinds.small_blind, self.blinds.big_blind)
+            return moves + self.balance(game)
+
+    def balance(self, game: Game) -> List[Move]:
+        game_id = game.game_id
+        seats = self.seats.get(game_id, {})
+        tables_needed = math.ceil(self.remaining / self.table_size)
+        shortest = self.shortest_table(exclude=game_id)
+        if shortest is None:
+            return []
+        if len(self.seats) > tables_needed and len(seats) <= len(self.seats[shortest]):
+            to_move = len(seats)
+        else:
+            to_move = 0
+            while len(seats) - to_move > len(self.seats[shortest]) + 1 + to_move:
+                to_move += 1
+        if not to_move:
+            return []
+        moves = []
+        stacks = {p.user_id: p.stack for p in game.players.players}
+        movers = list(seats.values())[:to_move]
+        for user_id in movers:
+            stack = stacks[user_id] if user_id in stacks else self.in_flight[user_id]
+            target = self.shortest_table(exclude=game_id)
+            seat_num = min(set(range(1, self.table_size + 1)) - self.seats[target].keys())
+            if user_id in stacks:
+                game.leave(user_id)
+            self.seat(user_id, target, seat_num)
+            self.in_flight[user_id] = stack
+            moves.append(Move(user_id, game_id, target, seat_num, stack))
+        if not self.seats[game_id]:
+            del self.seats[game_id]
+            self.tables_by_count[0].discard(game_id)
+        return moves
+
+    def is_current(self, move: Move) -> bool:
+        # A move is stale if the player was moved again before arriving,
+        # because the table they were heading to was broken up.
+        entrant = self.entrants[move.user_id]
+        return entrant['game_id'] == move.to_game_id and entrant['seat_num'] == move.seat_num
+
+    def seat_moved_player(self, game: Game, move: Move):
+        with self.lock:
+            if not self.is_current(move):
+                return False
+            self.in_flight.pop(move.user_id, None)
+        game.join(new_player(game.game_id, move.user_id, move.seat_num, move.stack))
+        return True
+
+
+def seat_table(game: Game, players: List[dict]):
+    # Everyone is seated before the first hand is dealt.
+    for player in players[:-1]:
+        game.join(player, advance=False)
+    game.join(players[-1])
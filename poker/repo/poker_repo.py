@@ -1,4 +1,7 @@
 from typing import List
+from sqlalchemy import and_, bindparam, func, or_, select, tuple_
+import datetime
+import json
 
 
 def get_players_table(db):
@@ -9,33 +12,264 @@ def get_games_table(db):
     return db.get_table('games')
 
 
-def get_games(db) -> List[dict]:
-    return list(get_games_table(db))
+LOBBY_COLUMNS = ('game_id', 'table_name', 'game_type', 'num_seats', 'small_blind',
+                 'big_blind', 'min_buyin', 'max_buyin', 'state_cd', 'seated',
+                 'hands_played', 'pot_total')
+
+
+def get_games(db, limit=50, after=None, game_type=None, min_big_blind=None,
+              max_big_blind=None, min_free_seats=None) -> List[dict]:
+    # One page of cash tables in game_id order, starting after the game_id
+    # of the last page. Only the games table is read: seated counts are
+    # kept on the game row.
+    table = get_games_table(db).table
+    c = table.c
+    stmt = select([c[name] for name in LOBBY_COLUMNS]) \
+        .where(c.tournament_id.is_(None)) \
+        .order_by(c.game_id) \
+        .limit(limit)
+    if after is not None:
+        stmt = stmt.where(c.game_id > after)
+    if game_type is not None:
+        stmt = stmt.where(c.game_type == game_type)
+    if min_big_blind is not None:
+        stmt = stmt.where(c.big_blind >= min_big_blind)
+    if max_big_blind is not None:
+        stmt = stmt.where(c.big_blind <= max_big_blind)
+    if min_free_seats is not None:
+        stmt = stmt.where(c.num_seats - func.coalesce(c.seated, 0) >= min_free_seats)
+    return [dict(row) for row in db.executable.execute(stmt)]
 
 
 def get_game(db, game_id) -> dict:
     return get_games_table(db).find_one(game_id=game_id)
 
-def update_game(db, game: dict):
+
+def get_game_version(db, game_id) -> int:
+    if not get_games_table(db).has_column('version'):
+        return None
+    row = next(iter(db.query('SELECT version FROM games WHERE game_id = :game_id',
+                             game_id=game_id)), None)
+    return row['version'] if row else None
+
+
+class StaleGameError(Exception):
+    pass
+
+
+class GameNotFound(Exception):
+    pass
+
+
+def update_game(db, game: dict, expected_version=None):
+    # When expected_version is given the row is only updated if nobody else
+    # has written it since it was read.
     games = db['games']
-    games.update(game, ['game_id'])
+    values = {k: v for k, v in game.items() if k != 'game_id'}
+    values['active_at'] = datetime.datetime.now()
+    for k, v in values.items():
+        if not games.has_column(k):
+            if k == 'deck_seed':
+                games.create_column(k, db.types.bigint)
+            else:
+                games.create_column_by_example(k, v)
+    table = games.table
+    stmt = table.update() \
+        .where(table.c.game_id == game['game_id']) \
+        .values(values)
+    if expected_version is not None:
+        stmt = stmt.where(table.c.version == expected_version)
+    if db.executable.execute(stmt).rowcount == 0 and expected_version is not None:
+        raise StaleGameError(f'Game {game["game_id"]} was changed since version {expected_version}')
 
 
 def insert_game(db, game: dict):
     game['state_cd'] = 'STARTING'
-    db['games'].insert(game)
+    game['pot_amt'] = 0
+    game['version'] = 0
+    game['action_seq'] = 0
+    game['seated'] = 0
+    game['hands_played'] = 0
+    game['pot_total'] = 0
+    with db:
+        db['games'].insert(dict(game, active_at=datetime.datetime.now()))
+        insert_snapshot(db, game['game_id'], 0, {'game': game, 'players': []})
+
+
+def get_idle_games(db, idle_before, finished_before, limit=100, game_id=None) -> List[str]:
+    # Cash tables nobody has played at since idle_before, and tables that
+    # have been finished since finished_before: empty ones, and those of a
+    # tournament that is over. Oldest first.
+    c = get_games_table(db).table.c
+    tournaments = db['tournaments'].table
+    over = select([tournaments.c.tournament_id]) \
+        .where(tournaments.c.state_cd.in_(('FINISHED', 'CANCELLED')))
+    finished = or_(func.coalesce(c.seated, 0) == 0, c.tournament_id.in_(over))
+    stmt = select([c.game_id]) \
+        .where(c.active_at < max(idle_before, finished_before)) \
+        .where(or_(and_(c.tournament_id.is_(None), c.active_at < idle_before),
+                   and_(c.active_at < finished_before, finished))) \
+        .order_by(c.active_at) \
+        .limit(limit)
+    if game_id is not None:
+        stmt = stmt.where(c.game_id == game_id)
+    return [row['game_id'] for row in db.executable.execute(stmt)]
+
+
+# Every table holding rows of a game, for moving a game between databases.
+TABLE_DATA = ('games', 'players', 'actions', 'snapshots', 'hands', 'hand_players')
+
+
+def get_table_data(db, game_id) -> dict:
+    return {name: list(db[name].find(game_id=game_id)) for name in TABLE_DATA if name in db}
+
+
+def delete_table_data(db, game_id):
+    for name in TABLE_DATA:
+        if name in db:
+            db[name].delete(game_id=game_id)
+
+
+def insert_table_data(db, data: dict):
+    for name, rows in data.items():
+        if rows:
+            insert_rows(db, db[name], rows)
 
 
 def add_player(db, player: dict):
     db['players'].insert(player)
 
 
+def insert_rows(db, table, rows: List[dict], types=None):
+    # Table.insert_many runs on the connection of the thread that created
+    # the table, so pooled databases insert through the caller's connection.
+    table._sync_columns(rows[0], True, types=types)
+    db.executable.execute(table.table.insert(), rows)
+
+
+def add_players(db, players: List[dict]):
+    if players:
+        insert_rows(db, db['players'], players)
+
+
 def get_players(db, game_id) -> List[dict]:
     players = get_players_table(db)
     return list(players.find(game_id=game_id))
 
 
-def update_players(db, players):
+def delete_players(db, players: List[dict]):
+    if players:
+        table = db['players'].table
+        stmt = table.delete() \
+            .where(table.c.game_id == bindparam('_game_id')) \
+            .where(table.c.user_id == bindparam('_user_id'))
+        db.executable.execute(stmt, [{'_game_id': p['game_id'], '_user_id': p['user_id']}
+                                     for p in players])
+
+
+def update_players(db, players: List[dict]):
+    # Players are grouped by the set of columns they changed so each group
+    # is a single executemany.
     players_db = db['players']
+    groups = {}
     for p in players:
-        players_db.update(p, ['game_id', 'user_id'])
+        columns = tuple(sorted(k for k in p if k not in ('game_id', 'user_id')))
+        groups.setdefault(columns, []).append(p)
+    for columns, rows in groups.items():
+        for c in columns:
+            if not players_db.has_column(c):
+                players_db.create_column_by_example(c, rows[0][c])
+        table = players_db.table
+        stmt = table.update() \
+            .where(table.c.game_id == bindparam('_game_id')) \
+            .where(table.c.user_id == bindparam('_user_id')) \
+            .values({c: bindparam(c) for c in columns})
+        params = []
+        for r in rows:
+            param = {c: r[c] for c in columns}
+            param['_game_id'] = r['game_id']
+            param['_user_id'] = r['user_id']
+            params.append(param)
+        db.executable.execute(stmt, params)
+
+
+def insert_actions(db, actions: List[dict]):
+    if actions:
+        now = datetime.datetime.now()
+        for a in actions:
+            a['created_dttm'] = now
+        insert_rows(db, db['actions'], actions, types={'seq': db.types.integer,
+                                                       'amount': db.types.integer,
+                                                       'seat_num': db.types.integer,
+                                                       'deck_seed': db.types.bigint})
+
+
+def get_actions(db, game_id, after_seq=0, upto_seq=None) -> List[dict]:
+    if 'actions' not in db:
+        return []
+    actions = db['actions']
+    clauses = [actions.table.c.seq > after_seq]
+    if upto_seq is not None:
+        clauses.append(actions.table.c.seq <= upto_seq)
+    return list(actions.find(*clauses, game_id=game_id, order_by='seq'))
+
+
+def insert_hands(db, hands: List[dict]):
+    if hands:
+        now = datetime.datetime.now()
+        insert_rows(db, db['hands'],
+                    [dict(h, ended_at=now, players=json.dumps(h['players'])) for h in hands],
+                    types={'deck_seed': db.types.bigint})
+        insert_rows(db, db['hand_players'],
+                    [{'game_id': h['game_id'], 'hand_num': h['hand_num'],
+                      'user_id': p['user_id'], 'ended_at': now}
+                     for h in hands for p in h['players']])
+
+
+def get_hands(db, limit, after=None, start=None, end=None, user_id=None) -> List[dict]:
+    # One page of hands in (ended_at, game_id, hand_num) order, starting
+    # after that key of the last hand of the previous page. A user's hands
+    # are found through hand_players, which is indexed the same way.
+    if 'hands' not in db:
+        return []
+    hands = db['hands'].table
+    keyed = hands
+    stmt = select([hands])
+    if user_id is not None:
+        keyed = db['hand_players'].table
+        stmt = stmt.select_from(keyed.join(hands, and_(keyed.c.game_id == hands.c.game_id,
+                                                       keyed.c.hand_num == hands.c.hand_num))) \
+            .where(keyed.c.user_id == user_id)
+    key = tuple_(keyed.c.ended_at, keyed.c.game_id, keyed.c.hand_num)
+    if after is not None:
+        stmt = stmt.where(key > tuple_(*after))
+    if start is not None:
+        stmt = stmt.where(keyed.c.ended_at >= start)
+    if end is not None:
+        stmt = stmt.where(keyed.c.ended_at < end)
+    stmt = stmt.order_by(keyed.c.ended_at, keyed.c.game_id, keyed.c.hand_num).limit(limit)
+    rows = []
+    for row in db.executable.execute(stmt):
+        row = dict(row)
+        row['players'] = json.loads(row['players'])
+        rows.append(row)
+    return rows
+
+
+def insert_snapshot(db, game_id, seq, state: dict):
+    db['snapshots'].insert({'game_id': game_id,
+                            'seq': seq,
+                            'state': json.dumps(state)})
+
+
+def get_latest_snapshot(db, game_id, upto_seq=None) -> dict:
+    if 'snapshots' not in db:
+        return None
+    snapshots = db['snapshots']
+    clauses = []
+    if upto_seq is not None:
+        clauses.append(snapshots.table.c.seq <= upto_seq)
+    snapshot = snapshots.find_one(*clauses, game_id=game_id, order_by='-seq')
+    if snapshot:
+        snapshot['state'] = json.loads(snapshot['state'])
+    return snapshot
@@ -0,0 +1,175 @@
+from sqlalchemy import (MetaData, Table, Column, Index, Integer, BigInteger,
+                        Boolean, DateTime, Float, LargeBinary, Text)
+
+# Tables the app reads and writes, with their keys and lookup indexes.
+# create_schema builds any that are missing on a fresh database; existing
+# databases are brought up to date with the Alembic migrations in
+# migrations/.
+
+metadata = MetaData()
+
+users = Table(
+    'users', metadata,
+    Column('user_id', Text, primary_key=True),
+    Column('username', Text),
+    Column('email', Text),
+    Column('password', Text),
+    Column('password_hash', Text),
+    Column('role', Text),
+    Column('auth_token', Text),
+    Index('ux_users_username', 'username', unique=True),
+    Index('ux_users_email', 'email', unique=True))
+
+tokens = Table(
+    'tokens', metadata,
+    Column('auth_token', Text, primary_key=True),
+    Column('user_id', Text),
+    Column('token_expiry_dttm', DateTime),
+    Index('ix_tokens_user_id', 'user_id'),
+    Index('ix_tokens_token_expiry_dttm', 'token_expiry_dttm'))
+
+revoked_tokens = Table(
+    'revoked_tokens', metadata,
+    Column('token_id', Text, primary_key=True),
+    Column('token_expiry', Integer),
+    Index('ix_revoked_tokens_token_expiry', 'token_expiry'))
+
+games = Table(
+    'games', metadata,
+    Column('game_id', Text, primary_key=True),
+    Column('game_type', Text),
+    Column('num_seats', Integer),
+    Column('big_blind', Integer),
+    Column('small_blind', Integer),
+    Column('min_buyin', Integer),
+    Column('max_buyin', Integer),
+    Column('table_name', Text),
+    Column('state_cd', Text),
+    Column('pot_amt', Integer),
+    Column('board', Text),
+    Column('deck', Text),
+    Column('deck_seed', BigInteger),
+    Column('action_seq', Integer),
+    Column('version', Integer),
+    Column('tournament_id', Text),
+    Column('seated', Integer),
+    Column('hands_played', Integer),
+    Column('pot_total', BigInteger),
+    Column('hand_start_seq', Integer),
+    Column('active_at', DateTime),
+    Index('ix_games_tournament_id', 'tournament_id'),
+    Index('ix_games_active_at', 'active_at'))
+
+players = Table(
+    'players', metadata,
+    Column('game_id', Text, primary_key=True),
+    Column('user_id', Text, primary_key=True),
+    Column('seat_num', Integer),
+    Column('buyin', Integer),
+    Column('stack', Integer),
+    Column('bet_amt', Integer),
+    Column('amt_in_pot', Integer),
+    Column('position', Integer),
+    Column('is_active', Boolean),
+    Column('sitting_out', Boolean),
+    Column('has_folded', Boolean),
+    Column('has_acted', Boolean),
+    Column('hand', Text),
+    Index('ix_players_user_id', 'user_id'))
+
+actions = Table(
+    'actions', metadata,
+    Column('game_id', Text, primary_key=True),
+    Column('seq', Integer, primary_key=True),
+    Column('user_id', Text),
+    Column('action_cd', Text),
+    Column('amount', Integer),
+    Column('seat_num', Integer),
+    Column('deck_seed', BigInteger),
+    Column('created_dttm', DateTime))
+
+hands = Table(
+    'hands', metadata,
+    Column('game_id', Text, primary_key=True),
+    Column('hand_num', Integer, primary_key=True),
+    Column('ended_at', DateTime),
+    Column('table_name', Text),
+    Column('game_type', Text),
+    Column('small_blind', Integer),
+    Column('big_blind', Integer),
+    Column('deck_seed', BigInteger),
+    Column('board', Text),
+    Column('pot', Integer),
+    Column('start_seq', Integer),
+    Column('end_seq', Integer),
+    Column('players', Text),
+    Index('ix_hands_ended_at', 'ended_at', 'game_id', 'hand_num'))
+
+hand_players = Table(
+    'hand_players', metadata,
+    Column('game_id', Text, primary_key=True),
+    Column('hand_num', Integer, primary_key=True),
+    Column('user_id', Text, primary_key=True),
+    Column('ended_at', DateTime),
+    Index('ix_hand_players_user_id', 'user_id', 'ended_at', 'game_id', 'hand_num'))
+
+snapshots = Table(
+    'snapshots', metadata,
+    Column('game_id', Text, primary_key=True),
+    Column('seq', Integer, primary_key=True),
+    Column('state', Text))
+
+table_shards = Table(
+    'table_shards', metadata,
+    Column('game_id', Text, primary_key=True),
+    Column('shard', Integer))
+
+tournaments = Table(
+    'tournaments', metadata,
+    Column('tournament_id', Text, primary_key=True),
+    Column('name', Text),
+    Column('state_cd', Text),
+    Column('table_size', Integer),
+    Column('starting_stack', Integer),
+    Column('max_entrants', Integer),
+    Column('schedule', Text),
+    Column('level', Integer),
+    Column('start_at', Float),
+    Column('level_started_at', Float),
+    Column('created_by', Text))
+
+tournament_entrants = Table(
+    'tournament_entrants', metadata,
+    Column('tournament_id', Text, primary_key=True),
+    Column('user_id', Text, primary_key=True),
+    Column('game_id', Text),
+    Column('seat_num', Integer),
+    Column('place', Integer),
+    Index('ix_tournament_entrants_user_id', 'user_id'))
+
+
+# The archive database holds tables moved out of the app's database once
+# idle or finished. A table's hands stay rows, so hand histories can still
+# be exported; everything else about it is one compressed blob.
+
+archive_metadata = MetaData()
+
+archived_games = Table(
+    'archived_games', archive_metadata,
+    Column('game_id', Text, primary_key=True),
+    Column('tournament_id', Text),
+    Column('table_name', Text),
+    Column('active_at', DateTime),
+    Column('archived_at', DateTime),
+    Column('data', LargeBinary))
+
+hands.to_metadata(archive_metadata)
+hand_players.to_metadata(archive_metadata)
+
+
+def create_schema(db):
+    metadata.create_all(db.engine)
+
+
+def create_archive_schema(db):
+    archive_metadata.create_all(db.engine)
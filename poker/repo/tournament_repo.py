@@ -0,0 +1,49 @@
+from typing import List
+from poker.repo.poker_repo import insert_rows
+from sqlalchemy import bindparam
+
+
+def insert_tournament(db, tournament: dict):
+    db['tournaments'].insert(tournament)
+
+
+def get_tournament(db, tournament_id) -> dict:
+    return db['tournaments'].find_one(tournament_id=tournament_id)
+
+
+def get_tournaments(db, state_cd=None) -> List[dict]:
+    if state_cd is None:
+        return list(db['tournaments'].all())
+    return list(db['tournaments'].find(state_cd=state_cd))
+
+
+def get_entrants(db, tournament_id) -> List[dict]:
+    return list(db['tournament_entrants'].find(tournament_id=tournament_id))
+
+
+def save_tournament(db, tournament_id, changes: dict):
+    # Applies Tournament.get_changes() in one transaction, with one
+    # statement per kind of change however many entrants moved.
+    with db:
+        if changes['tournament']:
+            db['tournaments'].update(dict(changes['tournament'], tournament_id=tournament_id),
+                                     ['tournament_id'])
+        if changes['new_entrants']:
+            insert_rows(db, db['tournament_entrants'], changes['new_entrants'])
+        table = db['tournament_entrants'].table
+        key = [{'_tournament_id': e['tournament_id'], '_user_id': e['user_id']}
+               for e in changes['removed_entrants']]
+        if key:
+            stmt = table.delete() \
+                .where(table.c.tournament_id == bindparam('_tournament_id')) \
+                .where(table.c.user_id == bindparam('_user_id'))
+            db.executable.execute(stmt, key)
+        if changes['changed_entrants']:
+            stmt = table.update() \
+                .where(table.c.tournament_id == bindparam('_tournament_id')) \
+                .where(table.c.user_id == bindparam('_user_id')) \
+                .values({c: bindparam(c) for c in ('game_id', 'seat_num', 'place')})
+            db.executable.execute(stmt, [
+                {'_tournament_id': e['tournament_id'], '_user_id': e['user_id'],
+                 'game_id': e['game_id'], 'seat_num': e['seat_num'], 'place': e['place']}
+                for e in changes['changed_entrants']])
@@ -0,0 +1,42 @@
+from poker.model.cards import shuffled_deck
+from poker.model.poker_model import BETWEEN_HANDS_ACTIONS, Game
+from poker.repo.poker_repo import get_actions, get_latest_snapshot
+
+
+def replay_game(db, game_id, upto_seq=None) -> Game:
+    snapshot = get_latest_snapshot(db, game_id, upto_seq)
+    if not snapshot:
+        return None
+    game = Game(snapshot['state']['game'], snapshot['state']['players'])
+    actions = get_actions(db, game_id, snapshot['seq'], upto_seq)
+    i = 0
+
+    def between_hands(game):
+        # What a tournament did when a hand ended (eliminations, table moves
+        # and blind changes) is logged right after the action that ended it
+        # and must be applied before the next hand is dealt.
+        nonlocal i
+        while i + 1 < len(actions) and actions[i + 1]['action_cd'] in BETWEEN_HANDS_ACTIONS:
+            i += 1
+            game.replay_between_hands(actions[i])
+
+    def dealt_out():
+        # A hand dealt straight out is logged as a deal right after whatever
+        # started it, with its own seed.
+        nonlocal i
+        if i + 1 < len(actions) and actions[i + 1]['action_cd'] == 'deal':
+            i += 1
+            return actions[i]['deck_seed'], shuffled_deck(actions[i]['deck_seed'])
+        return None
+
+    game.on_hand_end = between_hands
+    game.deck_source = dealt_out
+    while i < len(actions):
+        game.replay(actions[i])
+        i += 1
+    if actions:
+        game.action_seq = actions[-1]['seq']
+    game.on_hand_end = None
+    game.deck_source = None
+    game.mark_saved()
+    return game
@@ -0,0 +1,202 @@
+from datetime import datetime, timedelta
+from functools import partial
+from flask import current_app
+from sqlalchemy import DateTime
+from poker.db import connect, get_app_db
+from poker.repo.poker_repo import (delete_table_data, get_idle_games, get_table_data,
+                                   insert_table_data)
+from poker.repo.schema import create_archive_schema, metadata
+from poker.service.game_cache import get_game_cache
+from poker.service.hand_history import hands_page, paginate
+from poker.service.lobby_cache import get_lobby_cache
+from poker.service.shards import LOCAL, get_shard_router
+from poker.service.table_executor import get_table_executor
+import json
+import logging
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Tables idle for a long time, and finished ones, are moved out of the app's
+# database in batches so the games and players tables only hold tables in
+# use. Archiving and restoring run on the table's worker like any other call
+# for it, and the game cache restores an archived table the next time
+# anything asks for it.
+
+HISTORY = ('hands', 'hand_players')
+
+
+def pack(data: dict) -> bytes:
+    # Written once and rarely read, so it gets the best compression.
+    return zlib.compress(json.dumps(data, default=datetime.isoformat).encode(), 9)
+
+
+def unpack(blob: bytes) -> dict:
+    data = json.loads(zlib.decompress(blob))
+    for name, rows in data.items():
+        columns = [c.name for c in metadata.tables[name].c if isinstance(c.type, DateTime)]
+        for row in rows:
+            for column in columns:
+                if row.get(column) is not None:
+                    row[column] = datetime.fromisoformat(row[column])
+    return data
+
+
+def archive_table(db, archive, game_id, idle_before, finished_before) -> bool:
+    # Checked again here, since the table may have been played at since it
+    # was picked.
+    if not get_idle_games(db, idle_before, finished_before, 1, game_id):
+        return False
+    data = get_table_data(db, game_id)
+    history = {name: data.pop(name, []) for name in HISTORY}
+    game = data['games'][0]
+    with archive:
+        for name in ('archived_games',) + HISTORY:
+            archive[name].delete(game_id=game_id)
+        archive['archived_games'].insert({'game_id': game_id,
+                                          'tournament_id': game.get('tournament_id'),
+                                          'table_name': game.get('table_name'),
+                                          'active_at': game.get('active_at'),
+                                          'archived_at': datetime.now(),
+                                          'data': pack(data)})
+        insert_table_data(archive, history)
+    with db:
+        delete_table_data(db, game_id)
+    return True
+
+
+def restore_table(db, archive, game_id) -> bool:
+    row = archive['archived_games'].find_one(game_id=game_id)
+    if row is None:
+        return False
+    data = unpack(row['data'])
+    for name in HISTORY:
+        data[name] = list(archive[name].find(game_id=game_id))
+    # Coming back counts as activity, or the next sweep would take it again.
+    data['games'][0]['active_at'] = datetime.now()
+    with db:
+        insert_table_data(db, data)
+    with archive:
+        for name in ('archived_games',) + HISTORY:
+            archive[name].delete(game_id=game_id)
+    return True
+
+
+def archived_actions(archive, game_id, after_seq=0, upto_seq=None) -> list:
+    # get_actions for the archive, where the actions are in the blob.
+    row = archive['archived_games'].find_one(game_id=game_id)
+    if row is None:
+        return []
+    return [a for a in sorted(unpack(row['data'])['actions'], key=lambda a: a['seq'])
+            if a['seq'] > after_seq and (upto_seq is None or a['seq'] <= upto_seq)]
+
+
+def iter_archived_hands(archive, start=None, end=None, user_id=None, page_size=500):
+    # iter_hands for the archive, where the actions are in the blob.
+    return paginate(lambda after: hands_page(archive, page_size, after, start, end, user_id,
+                                             read_actions=archived_actions),
+                    page_size)
+
+
+class TableArchiver:
+    def __init__(self, db, archive, executor, cache, lobby_cache, router=None,
+                 idle_seconds=86400, finished_seconds=600, batch_size=100, interval=60.0):
+        self.db = db
+        self.archive = archive
+        self.executor = executor
+        self.cache = cache
+        self.lobby_cache = lobby_cache
+        self.router = router
+        self.idle_seconds = idle_seconds
+        self.finished_seconds = finished_seconds
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is None and self.interval > 0:
+                self.thread = threading.Thread(target=self.run, name='table-archiver',
+                                               daemon=True)
+                self.thread.start()
+
+    def run(self):
+        # Batches follow each other straight away while there is a backlog.
+        while True:
+            archived = 0
+            try:
+                archived = self.sweep(datetime.now())
+            except Exception:
+                logger.exception('archive sweep failed')
+            if archived < self.batch_size:
+                time.sleep(self.interval)
+
+    def sweep(self, now) -> int:
+        # Archives up to batch_size tables from each store, each as a job on
+        # the table's own worker or shard.
+        idle_before = now - timedelta(seconds=self.idle_seconds)
+        finished_before = now - timedelta(seconds=self.finished_seconds)
+        find = partial(get_idle_games, idle_before=idle_before,
+                       finished_before=finished_before, limit=self.batch_size)
+        jobs = []
+        for shard in (self.router.stores() if self.router else [LOCAL]):
+            if shard is LOCAL:
+                jobs += [self.executor.submit(game_id, self.archive_one, game_id, idle_before,
+                                              finished_before)
+                         for game_id in find(self.db)]
+            else:
+                jobs += [self.router.call(shard, partial(archive_in_shard, game_id=game_id,
+                                                         idle_before=idle_before,
+                                                         finished_before=finished_before),
+                                          game_id)
+                         for game_id in self.router.query(shard, find)]
+        archived = sum(job.result() for job in jobs)
+        if archived:
+            self.lobby_cache.clear()
+            logger.info('tables archived', extra={'count': archived})
+        return archived
+
+    def archive_one(self, game_id, idle_before, finished_before) -> bool:
+        archived = archive_table(self.db, self.archive, game_id, idle_before, finished_before)
+        self.cache.invalidate(game_id)
+        return archived
+
+    def restore(self, db, game_id) -> bool:
+        restored = restore_table(db, self.archive, game_id)
+        if restored:
+            logger.info('table restored', extra={'game_id': game_id})
+        return restored
+
+    def iter_hands(self, start=None, end=None, user_id=None, page_size=500):
+        return iter_archived_hands(self.archive, start, end, user_id, page_size)
+
+
+def archive_in_shard(db, game_id, idle_before, finished_before) -> bool:
+    return get_table_archiver().archive_one(game_id, idle_before, finished_before)
+
+
+_archiver_lock = threading.Lock()
+
+
+def get_table_archiver():
+    # None unless the app is configured with ARCHIVE_DBCONN.
+    config = current_app.config
+    if not config.get('ARCHIVE_DBCONN'):
+        return None
+    with _archiver_lock:
+        if 'table_archiver' not in current_app.extensions:
+            archive = connect(config['ARCHIVE_DBCONN'])
+            create_archive_schema(archive)
+            archiver = TableArchiver(
+                get_app_db(), archive, get_table_executor(), get_game_cache(),
+                get_lobby_cache(), get_shard_router(),
+                config.get('ARCHIVE_IDLE_SECONDS', 86400),
+                config.get('ARCHIVE_FINISHED_SECONDS', 600),
+                config.get('ARCHIVE_BATCH_SIZE', 100),
+                config.get('ARCHIVE_INTERVAL_SECONDS', 60))
+            get_game_cache().restore = archiver.restore
+            current_app.extensions['table_archiver'] = archiver
+    return current_app.extensions['table_archiver']
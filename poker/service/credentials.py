@@ -0,0 +1,153 @@
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy import bindparam
+import base64
+import hashlib
+import hmac
+import os
+import threading
+
+# Passwords are stored as "scheme$params$salt$hash". Hashing is deliberately
+# slow, so it runs on a fixed pool of threads (hashlib releases the GIL
+# while it works) and at most max_pending hashes may be queued or running:
+# past that, callers get PasswordHasherBusy rather than piling up.
+
+SCHEMES = ('scrypt', 'pbkdf2_sha256')
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+def b64(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+def hash_password(password: str, scheme='scrypt', salt=None, scrypt_n=2 ** 14, scrypt_r=8,
+                  scrypt_p=1, pbkdf2_iterations=260000) -> str:
+    salt = salt or os.urandom(16)
+    if scheme == 'scrypt':
+        digest = hashlib.scrypt(password.encode(), salt=salt, n=scrypt_n, r=scrypt_r,
+                                p=scrypt_p, maxmem=256 * scrypt_n * scrypt_r, dklen=32)
+        params = '{},{},{}'.format(scrypt_n, scrypt_r, scrypt_p)
+    elif scheme == 'pbkdf2_sha256':
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, pbkdf2_iterations)
+        params = str(pbkdf2_iterations)
+    else:
+        raise ValueError('Unknown password hash scheme {}'.format(scheme))
+    return '$'.join((scheme, params, b64(salt), b64(digest)))
+
+
+def verify_password(password: str, encoded: str) -> bool:
+    scheme, params, salt, digest = encoded.split('$')
+    salt = base64.b64decode(salt)
+    if scheme == 'scrypt':
+        n, r, p = (int(x) for x in params.split(','))
+        expected = hash_password(password, scheme, salt, scrypt_n=n, scrypt_r=r, scrypt_p=p)
+    else:
+        expected = hash_password(password, scheme, salt, pbkdf2_iterations=int(params))
+    return hmac.compare_digest(expected.encode(), encoded.encode())
+
+
+class PasswordHasher:
+    def __init__(self, scheme='scrypt', workers=4, max_pending=64, timeout=10.0, **cost):
+        if scheme not in SCHEMES:
+            raise ValueError('Unknown password hash scheme {}'.format(scheme))
+        self.scheme = scheme
+        self.cost = cost
+        self.timeout = timeout
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix='password-hasher')
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.rejected = 0
+        # Verified when a user doesn't exist, so a miss takes as long as a hit.
+        self.dummy = hash_password('', scheme, **cost)
+
+    def run(self, fn, *args):
+        if not self.slots.acquire(timeout=self.timeout):
+            self.rejected += 1
+            raise PasswordHasherBusy('Too many password checks in progress.')
+        try:
+            future = self.pool.submit(fn, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda f: self.slots.release())
+        return future.result()
+
+    def hash(self, password: str) -> str:
+        return self.run(lambda: hash_password(password, self.scheme, **self.cost))
+
+    def hash_many(self, passwords) -> list:
+        # For offline batches, which use the whole pool and skip the bound.
+        return list(self.pool.map(lambda p: hash_password(p, self.scheme, **self.cost), passwords))
+
+    def verify(self, password: str, encoded: str) -> bool:
+        return self.run(verify_password, password, encoded or self.dummy) and encoded is not None
+
+    def needs_rehash(self, encoded: str) -> bool:
+        return encoded.split('$')[:2] != self.dummy.split('$')[:2]
+
+    def check_user(self, user, password) -> bool:
+        # Returns whether the password matches and, for rows still holding
+        # a plaintext password or an outdated hash, sets a fresh hash on the
+        # user for the caller to save.
+        if password is None:
+            return False
+        if user is not None and not user.get('password_hash') and user.get('password') is not None:
+            if not hmac.compare_digest(user['password'].encode(), password.encode()):
+                return False
+        elif not self.verify(password, user.get('password_hash') if user else None):
+            return False
+        if user.get('password') is not None or self.needs_rehash(user['password_hash']):
+            user['password_hash'] = self.hash(password)
+            user['password'] = None
+        return True
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+
+def upgrade_plaintext_passwords(db, hasher: PasswordHasher, batch_size=100) -> int:
+    # Hashes the passwords of users who haven't logged in since hashing
+    # was introduced, one batch and one executemany at a time.
+    users = db['users']
+    if not users.has_column('password_hash'):
+        users.create_column('password_hash', db.types.text)
+    # Rows are updated by primary key, which is id in tables made by
+    # dataset, where user_id may be null.
+    table = users.table
+    key, = table.primary_key.columns
+    stmt = table.update() \
+        .where(key == bindparam('_key')) \
+        .values(password_hash=bindparam('password_hash'), password=None)
+    count = 0
+    while True:
+        rows = list(db.query('SELECT {}, password FROM users '
+                             'WHERE password IS NOT NULL LIMIT :n'.format(key.name),
+                             n=batch_size))
+        if not rows:
+            return count
+        hashes = hasher.hash_many([r['password'] for r in rows])
+        with db:
+            updated = db.executable.execute(stmt, [{'_key': r[key.name], 'password_hash': h}
+                                                   for r, h in zip(rows, hashes)]).rowcount
+        # Stops rather than selecting the same rows forever.
+        if not updated:
+            return count
+        count += updated
+
+
+def get_password_hasher() -> PasswordHasher:
+    if 'password_hasher' not in current_app.extensions:
+        config = current_app.config
+        cost = {}
+        for key in ('scrypt_n', 'scrypt_r', 'scrypt_p', 'pbkdf2_iterations'):
+            if 'PASSWORD_' + key.upper() in config:
+                cost[key] = config['PASSWORD_' + key.upper()]
+        current_app.extensions['password_hasher'] = PasswordHasher(
+            config.get('PASSWORD_HASH_SCHEME', 'scrypt'),
+            config.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 4),
+            config.get('PASSWORD_HASH_MAX_PENDING', 64),
+            config.get('PASSWORD_HASH_TIMEOUT_SECONDS', 10.0),
+            **cost)
+    return current_app.extensions['password_hasher']
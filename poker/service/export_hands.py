@@ -0,0 +1,41 @@
+from poker.service.archive import iter_archived_hands
+from poker.service.hand_history import FORMATS, gzip_chunks, iter_hands, merge_hands
+import argparse
+import dataset
+import datetime
+import sys
+
+# Command line export, kept apart from hand_history so running it with -m
+# doesn't import the module twice. It reads the stores directly instead of
+# starting the app's shards, which would be a second writer for each of them,
+# and merges them the same way the history endpoint does.
+
+
+def store_hands(db, shards=(), archive=None, start=None, end=None, user_id=None):
+    hands = merge_hands(*(iter_hands(store, start, end, user_id) for store in [db, *shards]))
+    if archive is None:
+        return hands
+    return merge_hands(hands, iter_archived_hands(archive, start, end, user_id))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export hand histories as gzipped NDJSON or text.')
+    parser.add_argument('--db', required=True, help='database url, e.g. sqlite:///dev.db')
+    parser.add_argument('--shards', type=int, default=0, help='number of shard databases')
+    parser.add_argument('--shard-db', default='sqlite:///shard{}.db',
+                        help='shard database url, {} is the shard number')
+    parser.add_argument('--archive-db', help='archive database url, e.g. sqlite:///archive.db')
+    parser.add_argument('--start', type=datetime.datetime.fromisoformat)
+    parser.add_argument('--end', type=datetime.datetime.fromisoformat)
+    parser.add_argument('--user', help='only hands this user_id played')
+    parser.add_argument('--format', choices=sorted(FORMATS), default='ndjson')
+    parser.add_argument('--output', default='-', help='file to write, - for stdout')
+    args = parser.parse_args()
+    hands = store_hands(dataset.connect(args.db),
+                        [dataset.connect(args.shard_db.format(i)) for i in range(args.shards)],
+                        dataset.connect(args.archive_db) if args.archive_db else None,
+                        args.start, args.end, args.user)
+    out = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')
+    with out:
+        for chunk in gzip_chunks(FORMATS[args.format](hands)):
+            out.write(chunk)
@@ -0,0 +1,104 @@
+from collections import OrderedDict
+from flask import current_app
+from poker.model.poker_model import Game
+from poker.repo.poker_repo import (GameNotFound, StaleGameError, get_game, get_game_version,
+                                   get_players)
+from poker.service.pubsub import broker
+from poker.service.shuffle import decks
+import threading
+import time
+
+
+def new_game(row: dict, player_rows) -> Game:
+    # A game that publishes its changes to stream subscribers and deals
+    # from the shared deck pool.
+    game = Game(row, player_rows)
+    game.publisher = broker
+    game.deck_source = decks.take
+    return game
+
+
+class GameCache:
+    # Write-through cache of live Game objects. Game.update_db persists every
+    # change as it happens, so a cached game is always what the DB holds
+    # unless another process wrote to it, which the version check catches.
+    games: OrderedDict
+
+    def __init__(self, max_size=1000, idle_seconds=600, verify_version=True):
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self.verify_version = verify_version
+        self.games = OrderedDict()
+        self.lock = threading.Lock()
+        # Called with (db, game_id) for a game that isn't in the db, to bring
+        # it back from the archive; returns whether it did.
+        self.restore = None
+
+    def get(self, db, game_id) -> Game:
+        now = time.monotonic()
+        with self.lock:
+            self.evict_idle(now)
+            entry = self.games.get(game_id)
+            if entry:
+                self.games[game_id] = (entry[0], now)
+                self.games.move_to_end(game_id)
+        if entry and (not self.verify_version
+                      or get_game_version(db, game_id) == entry[0].version):
+            return entry[0]
+        row = get_game(db, game_id)
+        if row is None and self.restore is not None and self.restore(db, game_id):
+            row = get_game(db, game_id)
+        if row is None:
+            raise GameNotFound('Game {} not found.'.format(game_id))
+        game = new_game(row, get_players(db, game_id))
+        self.put(game, now)
+        return game
+
+    def put(self, game: Game, now=None):
+        with self.lock:
+            self.games[game.game_id] = (game, now or time.monotonic())
+            self.games.move_to_end(game.game_id)
+            while len(self.games) > self.max_size:
+                self.games.popitem(last=False)
+
+    def invalidate(self, game_id):
+        with self.lock:
+            self.games.pop(game_id, None)
+
+    def evict_idle(self, now):
+        while self.games:
+            game_id, (game, last_used) = next(iter(self.games.items()))
+            if now - last_used < self.idle_seconds:
+                break
+            del self.games[game_id]
+
+    def __len__(self):
+        return len(self.games)
+
+
+def run_with_game(db, cache: GameCache, game_id, fn, attach=None):
+    # Runs fn(db, game) on the cached game. The version check in update_game
+    # catches writers outside this process; the call is retried once against
+    # the fresh game before giving up.
+    for _ in range(2):
+        game = cache.get(db, game_id)
+        if attach is not None:
+            attach(game)
+        try:
+            return fn(db, game)
+        except StaleGameError:
+            cache.invalidate(game_id)
+        except Exception:
+            cache.invalidate(game_id)
+            raise
+    return {'message': 'Game was changed by another request, please retry.'}, 409
+
+
+def get_game_cache() -> GameCache:
+    if 'game_cache' not in current_app.extensions:
+        config = current_app.config
+        current_app.extensions['game_cache'] = GameCache(
+            config.get('GAME_CACHE_SIZE', 1000),
+            config.get('GAME_CACHE_IDLE_SECONDS', 600),
+            config.get('GAME_CACHE_VERIFY_VERSION', True))
+    return current_app.extensions['game_cache']
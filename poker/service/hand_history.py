@@ -0,0 +1,128 @@
+from typing import Callable, Iterable, Iterator, List
+from bisect import bisect_left, bisect_right
+from poker.repo.poker_repo import get_actions, get_hands
+import heapq
+import json
+import zlib
+
+# Hands are exported as a pipeline of generators: pages of hands are read
+# with their actions, formatted one line at a time and gzipped in chunks,
+# so memory use depends on the page size and not on how many hands match.
+
+ACTION_FIELDS = ('seq', 'user_id', 'action_cd', 'amount', 'seat_num')
+
+
+def hands_page(db, page_size, after=None, start=None, end=None, user_id=None,
+               read_actions=get_actions) -> List[dict]:
+    hands = get_hands(db, page_size, after, start, end, user_id)
+    # One query per table in the page covers the actions of all its hands.
+    seq_ranges = {}
+    for h in hands:
+        lo, hi = seq_ranges.get(h['game_id'], (h['start_seq'], h['end_seq']))
+        seq_ranges[h['game_id']] = (min(lo, h['start_seq']), max(hi, h['end_seq']))
+    actions = {game_id: read_actions(db, game_id, lo, hi)
+               for game_id, (lo, hi) in seq_ranges.items()}
+    seqs = {game_id: [a['seq'] for a in rows] for game_id, rows in actions.items()}
+    for h in hands:
+        game_seqs = seqs[h['game_id']]
+        first = bisect_right(game_seqs, h['start_seq'])
+        last = bisect_left(game_seqs, h['end_seq'] + 1)
+        h['actions'] = [{k: a[k] for k in ACTION_FIELDS}
+                        for a in actions[h['game_id']][first:last]]
+    return hands
+
+
+def hand_key(hand) -> tuple:
+    return hand['ended_at'], hand['game_id'], hand['hand_num']
+
+
+def paginate(fetch: Callable[[tuple], List[dict]], page_size) -> Iterator[dict]:
+    # fetch(after) returns the page of hands after the key `after`.
+    after = None
+    while True:
+        hands = fetch(after)
+        yield from hands
+        if len(hands) < page_size:
+            return
+        after = hand_key(hands[-1])
+
+
+def iter_hands(db, start=None, end=None, user_id=None, page_size=500) -> Iterator[dict]:
+    return paginate(lambda after: hands_page(db, page_size, after, start, end, user_id),
+                    page_size)
+
+
+def merge_hands(*sources: Iterable[dict]) -> Iterator[dict]:
+    # Each source is in hand_key order, as every store pages its hands.
+    return heapq.merge(*sources, key=hand_key)
+
+
+def ndjson_lines(hands: Iterable[dict]) -> Iterator[str]:
+    for h in hands:
+        yield json.dumps(h, default=str) + '\n'
+
+
+def spaced(cards: str) -> str:
+    return ' '.join(cards[i:i + 2] for i in range(0, len(cards), 2))
+
+
+def text_lines(hands: Iterable[dict]) -> Iterator[str]:
+    # Close to the text format the big sites export, which most hand
+    # analysis tools can read.
+    for h in hands:
+        yield "Hand #{}-{}: Hold'em No Limit ({}/{}) - {}\n".format(
+            h['game_id'], h['hand_num'], h['small_blind'], h['big_blind'],
+            h['ended_at'].strftime('%Y/%m/%d %H:%M:%S') if h['ended_at'] else '')
+        yield "Table '{}'\n".format(h['table_name'])
+        players = {p['user_id']: p for p in h['players']}
+        for p in h['players']:
+            yield 'Seat {}: {} ({} in chips)\n'.format(p['seat_num'], p['user_id'], p['stack'])
+        yield '*** HOLE CARDS ***\n'
+        for p in h['players']:
+            yield 'Dealt to {} [{}]\n'.format(p['user_id'], spaced(p['hand']))
+        # A check_fold only shows up as a fold if it was the player's last.
+        folds = {}
+        for a in h['actions']:
+            if a['action_cd'] == 'check_fold' and a['user_id'] in players:
+                folds[a['user_id']] = a['seq']
+        for a in h['actions']:
+            if a['user_id'] not in players:
+                continue
+            if a['action_cd'] == 'check_call':
+                verb = 'calls {}'.format(a['amount']) if a['amount'] else 'checks'
+            elif a['action_cd'] == 'check_fold':
+                folded = players[a['user_id']]['has_folded'] and folds[a['user_id']] == a['seq']
+                verb = 'folds' if folded else 'checks'
+            elif a['action_cd'] == 'bet':
+                verb = 'bets {}'.format(a['amount'])
+            else:
+                continue
+            yield '{}: {}\n'.format(a['user_id'], verb)
+        if h['board']:
+            yield '*** BOARD *** [{}]\n'.format(spaced(h['board']))
+        yield '*** SUMMARY ***\n'
+        yield 'Total pot {}\n'.format(h['pot'])
+        for p in h['players']:
+            if p['won']:
+                yield 'Seat {}: {} won ({})\n'.format(p['seat_num'], p['user_id'], p['won'])
+        yield '\n'
+
+
+FORMATS = {'ndjson': ndjson_lines, 'text': text_lines}
+
+
+def gzip_chunks(lines: Iterable[str], chunk_size=64 * 1024, level=6) -> Iterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    buffer = []
+    size = 0
+    for line in lines:
+        data = line.encode()
+        buffer.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            chunk = compressor.compress(b''.join(buffer))
+            buffer = []
+            size = 0
+            if chunk:
+                yield chunk
+    yield compressor.compress(b''.join(buffer)) + compressor.flush()
@@ -0,0 +1,51 @@
+from collections import OrderedDict
+from flask import current_app
+import threading
+import time
+
+
+class LobbyCache:
+    # Lobby pages keyed by their filters and cursor, served for `ttl`
+    # seconds. Every client polling the lobby asks for the same few pages,
+    # so a short ttl turns most of those requests into a dict lookup at the
+    # cost of seat counts being up to `ttl` seconds old.
+    pages: OrderedDict
+
+    def __init__(self, ttl=1.0, max_size=1000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.pages = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, now=None):
+        now = now if now is not None else time.monotonic()
+        with self.lock:
+            entry = self.pages.get(key)
+            if entry is None or entry[1] + self.ttl <= now:
+                return None
+            self.pages.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, page, now=None):
+        now = now if now is not None else time.monotonic()
+        with self.lock:
+            self.pages[key] = (page, now)
+            self.pages.move_to_end(key)
+            while len(self.pages) > self.max_size:
+                self.pages.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.pages.clear()
+
+    def __len__(self):
+        return len(self.pages)
+
+
+def get_lobby_cache() -> LobbyCache:
+    if 'lobby_cache' not in current_app.extensions:
+        config = current_app.config
+        current_app.extensions['lobby_cache'] = LobbyCache(
+            config.get('LOBBY_CACHE_SECONDS', 1.0),
+            config.get('LOBBY_CACHE_SIZE', 1000))
+    return current_app.extensions['lobby_cache']
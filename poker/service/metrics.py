@@ -0,0 +1,184 @@
+from contextlib import contextmanager
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from poker.log import dropped_records
+import cProfile
+import os
+import random
+import threading
+import time
+import uuid
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# Stats for the request being served by this thread. Table workers attach
+# the stats of the request they run for, so their queries count too.
+_local = threading.local()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def samples(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield '{:g}'.format(bound), total
+        yield '+Inf', self.count
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}
+        self.query_counts = {}
+        self.query_seconds = {}
+        self.requests = {}
+
+    def observe_request(self, endpoint, method, status, seconds, stats: RequestStats):
+        key = (endpoint, method)
+        with self.lock:
+            if key not in self.latency:
+                self.latency[key] = Histogram(LATENCY_BUCKETS)
+                self.query_counts[key] = Histogram(QUERY_COUNT_BUCKETS)
+                self.query_seconds[key] = Histogram(LATENCY_BUCKETS)
+            self.latency[key].observe(seconds)
+            self.query_counts[key].observe(stats.queries)
+            self.query_seconds[key].observe(stats.query_seconds)
+            status_key = (endpoint, method, str(status))
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            lines += ['# HELP poker_requests_total Requests by endpoint and status.',
+                      '# TYPE poker_requests_total counter']
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append('poker_requests_total{{{}}} {}'.format(
+                    labels(endpoint=endpoint, method=method, status=status), count))
+            for name, help, histograms in (
+                    ('poker_request_duration_seconds', 'Request latency.', self.latency),
+                    ('poker_request_db_queries', 'DB queries per request.', self.query_counts),
+                    ('poker_request_db_seconds', 'Time spent in DB queries per request.', self.query_seconds)):
+                lines += ['# HELP {} {}'.format(name, help),
+                          '# TYPE {} histogram'.format(name)]
+                for (endpoint, method), h in sorted(histograms.items()):
+                    for le, count in h.samples():
+                        lines.append('{}_bucket{{{}}} {}'.format(
+                            name, labels(endpoint=endpoint, method=method, le=le), count))
+                    lines.append('{}_sum{{{}}} {:g}'.format(
+                        name, labels(endpoint=endpoint, method=method), h.sum))
+                    lines.append('{}_count{{{}}} {}'.format(
+                        name, labels(endpoint=endpoint, method=method), h.count))
+        lines += ['# HELP poker_log_records_dropped_total Log records dropped on a full queue.',
+                  '# TYPE poker_log_records_dropped_total counter',
+                  'poker_log_records_dropped_total {}'.format(dropped_records())]
+        return '\n'.join(lines) + '\n'
+
+
+def labels(**kwargs) -> str:
+    return ','.join('{}="{}"'.format(k, v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                    for k, v in kwargs.items())
+
+
+def current_stats():
+    return getattr(_local, 'stats', None)
+
+
+@contextmanager
+def attach_stats(stats):
+    previous = current_stats()
+    _local.stats = stats
+    try:
+        yield
+    finally:
+        _local.stats = previous
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_stats() is not None:
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats()
+    if stats is not None and conn.info.get('query_start'):
+        stats.queries += 1
+        stats.query_seconds += time.perf_counter() - conn.info['query_start'].pop()
+
+
+_listening = False
+
+
+def listen_for_queries():
+    # Every engine is instrumented, including ones handed in by an injector.
+    global _listening
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+        _listening = True
+
+
+def get_metrics():
+    return current_app.extensions.get('metrics')
+
+
+def start_request():
+    g.metrics_start = time.perf_counter()
+    _local.stats = RequestStats()
+    config = current_app.config
+    profile_dir = config.get('METRICS_PROFILE_DIR')
+    if profile_dir and random.random() < config.get('METRICS_PROFILE_SAMPLE_RATE', 0.01):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+def finish_request(response):
+    stats = current_stats()
+    _local.stats = None
+    start = g.pop('metrics_start', None)
+    if start is None or stats is None:
+        return response
+    seconds = time.perf_counter() - start
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    get_metrics().observe_request(endpoint, request.method, response.status_code,
+                                  seconds, stats)
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        config = current_app.config
+        if seconds >= config.get('METRICS_SLOW_REQUEST_SECONDS', 0.5):
+            profiler.dump_stats(os.path.join(
+                config['METRICS_PROFILE_DIR'],
+                '{}-{}.prof'.format(int(time.time()), uuid.uuid4().hex[:8])))
+    return response
+
+
+def init_metrics(app):
+    app.extensions['metrics'] = Metrics()
+    if app.config.get('METRICS_PROFILE_DIR'):
+        os.makedirs(app.config['METRICS_PROFILE_DIR'], exist_ok=True)
+    listen_for_queries()
+    app.before_request(start_request)
+    app.after_request(finish_request)
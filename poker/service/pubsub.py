@@ -0,0 +1,97 @@
+from collections import defaultdict
+import asyncio
+import queue
+import threading
+
+
+class TableBroker:
+    # Fans out state diffs for a game to every subscriber queue for that
+    # game. A subscriber that stops reading is dropped rather than allowed to
+    # block the table.
+    subscribers: defaultdict
+
+    def __init__(self, max_queue=256):
+        self.max_queue = max_queue
+        self.subscribers = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def subscribe(self, game_id, q=None) -> queue.Queue:
+        if q is None:
+            q = queue.Queue(self.max_queue)
+        with self.lock:
+            self.subscribers[game_id].add(q)
+        return q
+
+    def unsubscribe(self, game_id, q):
+        with self.lock:
+            subscribers = self.subscribers.get(game_id)
+            if subscribers is not None:
+                subscribers.discard(q)
+                if not subscribers:
+                    del self.subscribers[game_id]
+
+    def has_subscribers(self, game_id) -> bool:
+        return game_id in self.subscribers
+
+    def publish(self, game_id, message: dict):
+        with self.lock:
+            subscribers = list(self.subscribers.get(game_id, ()))
+        for q in subscribers:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                self.unsubscribe(game_id, q)
+                with q.mutex:
+                    q.queue.clear()
+                q.put_nowait(None)
+
+
+broker = TableBroker()
+
+
+class AsyncQueue(queue.Queue):
+    # A subscriber queue an asyncio task can wait on without a thread: the
+    # broker puts messages from the table worker as usual and each put wakes
+    # the task's event loop.
+    def __init__(self, maxsize, loop):
+        super().__init__(maxsize)
+        self.loop = loop
+        self.ready = asyncio.Event()
+        self.closed = False
+
+    def _put(self, item):
+        super()._put(item)
+        self.wake()
+
+    def wake(self):
+        try:
+            self.loop.call_soon_threadsafe(self.ready.set)
+        except RuntimeError:
+            # The loop has shut down; there is no one left to wake.
+            pass
+
+    def close(self):
+        self.closed = True
+        self.wake()
+
+    async def get_async(self, timeout):
+        # The next message, or None once closed. Raises asyncio.TimeoutError
+        # if nothing arrives within timeout.
+        while True:
+            self.ready.clear()
+            if self.closed:
+                return None
+            try:
+                return self.get_nowait()
+            except queue.Empty:
+                pass
+            await asyncio.wait_for(self.ready.wait(), timeout)
+
+
+def message_for(message: dict, user_id) -> dict:
+    # Hole cards are only ever sent to the player holding them.
+    message = dict(message)
+    hands = message.pop('hands', {})
+    if user_id in hands:
+        message['hand'] = hands[user_id]
+    return message
@@ -0,0 +1,340 @@
+from concurrent.futures import Future
+from functools import partial
+from flask import current_app
+from poker.db import get_app_db
+from poker.repo.poker_repo import (delete_table_data, get_table_data, insert_game,
+                                   insert_table_data)
+from poker.service.game_cache import get_game_cache, run_with_game
+from poker.service.hand_history import hands_page, merge_hands, paginate
+from poker.service.pubsub import broker
+from poker.service.table_executor import get_table_executor
+import itertools
+import logging
+import multiprocessing
+import threading
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Cash tables can be spread over shard processes, each the only writer of
+# its own SQLite file, so tables scale with cores instead of queueing on
+# one writer. The router in the app process keeps the directory of which
+# shard holds each table (the table_shards table) and sends it the table's
+# calls as pickled functions of (db, game) or (db). A table with no entry
+# lives in the app's own db and runs on the local executor as before; that
+# covers tournament tables and tables created before sharding.
+
+LOCAL = None
+
+
+class ShardError(Exception):
+    pass
+
+
+def shard_for(game_id, num_shards) -> int:
+    return zlib.crc32(game_id.encode()) % num_shards
+
+
+def create_table(db, game):
+    insert_game(db, game)
+    return game
+
+
+def export_table(db, game_id) -> dict:
+    # Removes a table from this store and returns its rows.
+    with db:
+        data = get_table_data(db, game_id)
+        delete_table_data(db, game_id)
+    return data
+
+
+def import_table(db, data):
+    with db:
+        insert_table_data(db, data)
+
+
+# Set in each shard process: stream messages for the tables the router has
+# subscribers for are sent back to it over the pipe.
+_send = None
+_forwarders = {}
+
+
+class EventForwarder:
+    def __init__(self, game_id):
+        self.game_id = game_id
+
+    def put_nowait(self, message):
+        try:
+            _send((None, self.game_id, message))
+        except OSError:
+            pass
+
+
+def watch_game(db, game_id):
+    if game_id not in _forwarders:
+        _forwarders[game_id] = EventForwarder(game_id)
+        broker.subscribe(game_id, _forwarders[game_id])
+
+
+def unwatch_game(db, game_id):
+    forwarder = _forwarders.pop(game_id, None)
+    if forwarder is not None:
+        broker.unsubscribe(game_id, forwarder)
+
+
+def watch_state(db, game, user_id):
+    watch_game(db, game.game_id)
+    return game.get_state(user_id)
+
+
+def serve_shard(conn, config):
+    # The shard process: one thread runs calls in the order they arrive.
+    global _send
+    from poker import create_app
+    app = create_app(config)
+    lock = threading.Lock()
+
+    def send(message):
+        with lock:
+            conn.send(message)
+    _send = send
+    with app.app_context():
+        db = get_app_db()
+        cache = get_game_cache()
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                return
+            if message is None:
+                return
+            call_id, kind, game_id, fn = message
+            try:
+                if kind == 'table':
+                    reply = (call_id, True, run_with_game(db, cache, game_id, fn))
+                elif kind == 'export':
+                    unwatch_game(db, game_id)
+                    reply = (call_id, True, export_table(db, game_id))
+                    cache.invalidate(game_id)
+                else:
+                    reply = (call_id, True, fn(db))
+            except Exception as e:
+                reply = (call_id, False, e)
+            try:
+                send(reply)
+            except Exception as e:
+                send((call_id, False, ShardError(repr(e))))
+
+
+class ShardRouter:
+    placements: dict
+
+    def __init__(self, num_shards, shard_dbconn, config, db, executor, cache):
+        self.db = db
+        self.executor = executor
+        self.cache = cache
+        self.placements = {r['game_id']: r['shard'] for r in db['table_shards'].all()}
+        self.moving = set()
+        self.unwatching = set()
+        self.lock = threading.Lock()
+        self.moved = threading.Condition(self.lock)
+        self.calls = {}
+        self.call_ids = itertools.count()
+        self.calls_lock = threading.Lock()
+        self.conns = []
+        self.send_locks = []
+        self.processes = []
+        context = multiprocessing.get_context('spawn')
+        # Shards only restore archived tables; the app's archiver sweeps
+        # them through the router.
+        for i in range(num_shards):
+            conn, child = context.Pipe()
+            process = context.Process(
+                target=serve_shard, name='poker-shard-{}'.format(i), daemon=True,
+                args=(child, dict(config, DBCONN=shard_dbconn.format(i), SHARDS=0,
+                                  ARCHIVE_INTERVAL_SECONDS=0)))
+            process.start()
+            child.close()
+            self.conns.append(conn)
+            self.send_locks.append(threading.Lock())
+            self.processes.append(process)
+            threading.Thread(target=self.read_replies, args=(i,),
+                             name='shard-reader-{}'.format(i), daemon=True).start()
+
+    def stores(self) -> list:
+        return [LOCAL] + list(range(len(self.conns)))
+
+    def send(self, shard, kind, game_id, fn, on_result=None) -> Future:
+        future = Future()
+        with self.calls_lock:
+            call_id = next(self.call_ids)
+            self.calls[call_id] = (shard, future, on_result)
+        try:
+            with self.send_locks[shard]:
+                self.conns[shard].send((call_id, kind, game_id, fn))
+        except Exception:
+            with self.calls_lock:
+                self.calls.pop(call_id, None)
+            raise
+        return future
+
+    def read_replies(self, shard):
+        conn = self.conns[shard]
+        while True:
+            try:
+                call_id, ok, result = conn.recv()
+            except (EOFError, OSError):
+                self.fail_calls(shard)
+                return
+            if call_id is None:
+                # A stream message; ok is the game_id. The reader must never
+                # block on a send, so unwatching is left to another thread.
+                if broker.has_subscribers(ok):
+                    broker.publish(ok, result)
+                elif ok not in self.unwatching:
+                    self.unwatching.add(ok)
+                    threading.Thread(target=self.unwatch, args=(shard, ok), daemon=True).start()
+                continue
+            with self.calls_lock:
+                _, future, on_result = self.calls.pop(call_id)
+            if not ok:
+                future.set_exception(result)
+                continue
+            try:
+                if on_result is not None:
+                    on_result(result)
+                future.set_result(result)
+            except Exception as e:
+                future.set_exception(e)
+
+    def unwatch(self, shard, game_id):
+        try:
+            self.send(shard, 'call', game_id, partial(unwatch_game, game_id=game_id)).result()
+        finally:
+            self.unwatching.discard(game_id)
+
+    def fail_calls(self, shard):
+        with self.calls_lock:
+            failed = [call_id for call_id, call in self.calls.items() if call[0] == shard]
+            futures = [self.calls.pop(call_id)[1] for call_id in failed]
+        for future in futures:
+            future.set_exception(ShardError('Shard {} stopped.'.format(shard)))
+
+    def submit_table(self, game_id, fn, local, on_result=None) -> Future:
+        # local() runs the call in this process for tables without a shard.
+        # The lookup and the send happen under the lock, so a migration
+        # always queues its export behind calls that were already routed.
+        with self.lock:
+            while game_id in self.moving:
+                self.moved.wait()
+            shard = self.placements.get(game_id, LOCAL)
+            if shard is LOCAL:
+                return local()
+            return self.send(shard, 'table', game_id, fn, on_result)
+
+    def call(self, shard, fn, game_id=None) -> Future:
+        if shard is LOCAL:
+            return self.executor.submit(game_id or '', fn, self.db)
+        return self.send(shard, 'call', game_id, fn)
+
+    def query(self, shard, fn):
+        # Reads that aren't about one table; local ones run in the caller.
+        if shard is LOCAL:
+            return fn(self.db)
+        return self.send(shard, 'call', None, fn).result()
+
+    def query_all(self, fn) -> list:
+        futures = [self.send(shard, 'call', None, fn) for shard in range(len(self.conns))]
+        return [fn(self.db)] + [f.result() for f in futures]
+
+    def create_game(self, game) -> dict:
+        shard = shard_for(game['game_id'], len(self.conns))
+        game = self.call(shard, partial(create_table, game=game)).result()
+        self.save_placement(game['game_id'], shard)
+        return game
+
+    def save_placement(self, game_id, shard):
+        with self.db:
+            if shard is LOCAL:
+                self.db['table_shards'].delete(game_id=game_id)
+            else:
+                self.db['table_shards'].upsert({'game_id': game_id, 'shard': shard}, ['game_id'])
+        with self.lock:
+            if shard is LOCAL:
+                self.placements.pop(game_id, None)
+            else:
+                self.placements[game_id] = shard
+
+    def export(self, shard, game_id) -> Future:
+        if shard is not LOCAL:
+            return self.send(shard, 'export', game_id, None)
+
+        def run():
+            data = export_table(self.db, game_id)
+            self.cache.invalidate(game_id)
+            return data
+        return self.executor.submit(game_id, run)
+
+    def migrate(self, game_id, shard):
+        # Moves a table to another shard, or back to the local db when shard
+        # is LOCAL. Calls for the table wait until it has landed.
+        if shard is not LOCAL and not 0 <= shard < len(self.conns):
+            raise ShardError('No shard {}.'.format(shard))
+        with self.lock:
+            while game_id in self.moving:
+                self.moved.wait()
+            source = self.placements.get(game_id, LOCAL)
+            if source == shard:
+                return
+            self.moving.add(game_id)
+            exported = self.export(source, game_id)
+        try:
+            data = exported.result()
+            if not data.get('games'):
+                raise ShardError('No game {}.'.format(game_id))
+            try:
+                self.call(shard, partial(import_table, data=data), game_id).result()
+            except Exception:
+                self.call(source, partial(import_table, data=data), game_id).result()
+                raise
+            self.save_placement(game_id, shard)
+            if shard is not LOCAL and broker.has_subscribers(game_id):
+                self.call(shard, partial(watch_game, game_id=game_id)).result()
+            logger.info('table migrated', extra={'game_id': game_id, 'from_shard': source,
+                                                 'to_shard': shard})
+        finally:
+            with self.lock:
+                self.moving.discard(game_id)
+                self.moved.notify_all()
+
+    def iter_hands(self, start=None, end=None, user_id=None, page_size=500):
+        # Each store pages through its hands in order; merging them keeps
+        # the export in one order across shards.
+        def pages(shard):
+            return paginate(lambda after: self.query(shard, partial(
+                hands_page, page_size=page_size, after=after, start=start, end=end,
+                user_id=user_id)), page_size)
+        return merge_hands(*(pages(shard) for shard in self.stores()))
+
+    def shutdown(self):
+        for lock, conn in zip(self.send_locks, self.conns):
+            with lock:
+                conn.send(None)
+        for process in self.processes:
+            process.join()
+
+
+_router_lock = threading.Lock()
+
+
+def get_shard_router():
+    # None unless the app is configured with SHARDS.
+    config = current_app.config
+    if not config.get('SHARDS'):
+        return None
+    with _router_lock:
+        if 'shard_router' not in current_app.extensions:
+            current_app.extensions['shard_router'] = ShardRouter(
+                config['SHARDS'], config.get('SHARD_DBCONN', 'sqlite:///shard{}.db'),
+                dict(config), get_app_db(), get_table_executor(), get_game_cache())
+    return current_app.extensions['shard_router']
@@ -0,0 +1,70 @@
+from collections import deque
+from typing import Tuple
+from poker.model.cards import shuffled_deck
+import os
+import secrets
+import threading
+
+# Every hand is dealt from a deck shuffled from a random 63 bit seed, which
+# is logged with its actions and stored with the hand, so the deal can be
+# replayed and audited. Decks are made ahead in batches: one call to the OS
+# for a batch of seeds, shuffled on a background thread whenever the pool
+# runs low, so starting a hand at a busy table only pops a deck.
+
+
+def new_seeds(n) -> list:
+    data = secrets.token_bytes(8 * n)
+    return [int.from_bytes(data[i:i + 8], 'little') >> 1 for i in range(0, 8 * n, 8)]
+
+
+class DeckPool:
+    decks: deque
+
+    def __init__(self, batch_size=64):
+        self.batch_size = batch_size
+        self.reset()
+
+    def reset(self):
+        self.decks = deque()
+        self.low = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def take(self) -> Tuple[int, bytearray]:
+        try:
+            deck = self.decks.popleft()
+        except IndexError:
+            deck = None
+        if len(self.decks) < self.batch_size // 2:
+            self.start()
+            self.low.set()
+        if deck is None:
+            seed = new_seeds(1)[0]
+            deck = seed, shuffled_deck(seed)
+        return deck
+
+    def fill(self):
+        seeds = new_seeds(self.batch_size)
+        self.decks.extend((seed, shuffled_deck(seed)) for seed in seeds)
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='deck-pool', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            self.low.wait()
+            self.low.clear()
+            while len(self.decks) < self.batch_size:
+                self.fill()
+
+    def __len__(self):
+        return len(self.decks)
+
+
+decks = DeckPool()
+# A forked child, such as a shard, must not deal the parent's queued decks
+# too, and the parent's filling thread doesn't run there.
+os.register_at_fork(after_in_child=decks.reset)
@@ -0,0 +1,65 @@
+from flask import current_app
+from itsdangerous import URLSafeSerializer, BadSignature
+import threading
+import time
+import uuid
+
+
+class RevocationList:
+    # Ids of signed tokens that were logged out before they expired. Each
+    # process keeps its own copy and reloads the revoked_tokens table every
+    # `refresh_seconds`, so verifying a token never touches the DB.
+    revoked: dict
+
+    def __init__(self, refresh_seconds=30):
+        self.refresh_seconds = refresh_seconds
+        self.next_refresh = 0
+        self.revoked = {}
+        self.lock = threading.Lock()
+
+    def is_revoked(self, token_id) -> bool:
+        return token_id in self.revoked
+
+    def revoke(self, token_id, expiry):
+        with self.lock:
+            self.revoked[token_id] = expiry
+
+    def refresh_due(self, now) -> bool:
+        with self.lock:
+            if now < self.next_refresh:
+                return False
+            self.next_refresh = now + self.refresh_seconds
+        return True
+
+    def load(self, rows, now):
+        revoked = {r['token_id']: r['token_expiry'] for r in rows
+                   if r['token_expiry'] > now}
+        with self.lock:
+            self.revoked = revoked
+
+
+def get_serializer() -> URLSafeSerializer:
+    return URLSafeSerializer(current_app.config['SECRET_KEY'],
+                             salt='auth-token')
+
+
+def get_revocation_list() -> RevocationList:
+    if 'revocation_list' not in current_app.extensions:
+        current_app.extensions['revocation_list'] = RevocationList(
+            current_app.config.get('REVOCATION_REFRESH_SECONDS', 30))
+    return current_app.extensions['revocation_list']
+
+
+def issue_signed_token(user) -> str:
+    lifetime = current_app.config.get('TOKEN_LIFETIME_SECONDS', 3600)
+    return get_serializer().dumps({'user_id': user['user_id'],
+                                   'role': user['role'],
+                                   'exp': int(time.time()) + lifetime,
+                                   'jti': uuid.uuid4().hex})
+
+
+def load_signed_token(token) -> dict:
+    try:
+        return get_serializer().loads(token)
+    except BadSignature:
+        return None
@@ -0,0 +1,265 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List
+from poker.model.poker_model import Game, Player, State, new_player
+from poker.model.tournament_model import (DEFAULT_SCHEDULE, Tournament, new_tournament,
+                                          seat_table)
+from poker.repo.poker_repo import insert_game
+import argparse
+import json
+import random
+import time
+
+# Plays bots against each other on in-memory games. Games are only
+# persisted if a sink is given: anything with a save(game) method, called
+# after every action.
+
+
+class SimulationError(Exception):
+    pass
+
+
+class MemorySink:
+    def __init__(self):
+        self.actions = []
+
+    def save(self, game: Game):
+        self.actions += game.pop_actions()
+
+
+class DatabaseSink:
+    def __init__(self, db):
+        self.db = db
+        self.game_ids = set()
+
+    def save(self, game: Game):
+        if game.game_id not in self.game_ids:
+            insert_game(self.db, game.to_row())
+            game.mark_saved()
+            self.game_ids.add(game.game_id)
+        else:
+            game.update_db(self.db)
+
+
+def to_call(game: Game, player: Player) -> int:
+    return game.players.highest_bet() - player.bet_amt
+
+
+def raise_to(game: Game, player: Player, amount: int):
+    bet_amt = min(to_call(game, player) + amount, player.stack)
+    if bet_amt <= to_call(game, player):
+        return 'check_call', {}
+    return 'bet', {'bet_amt': bet_amt}
+
+
+def calling_station(game, player, rng):
+    return 'check_call', {}
+
+
+def aggressive(game, player, rng):
+    return raise_to(game, player, 2 * game.big_blind)
+
+
+def tight(game, player, rng):
+    high, low = sorted(c % 13 for c in player.hand)[::-1]
+    if high == low or low >= 8:
+        return raise_to(game, player, 3 * game.big_blind)
+    return 'check_fold', {}
+
+
+def random_bot(game, player, rng):
+    roll = rng.random()
+    if roll < 0.2:
+        return 'check_fold', {}
+    if roll < 0.7:
+        return 'check_call', {}
+    if roll < 0.95:
+        return raise_to(game, player, game.big_blind * rng.randint(1, 5))
+    return raise_to(game, player, player.stack)
+
+
+STRATEGIES: Dict[str, Callable] = {
+    'calling_station': calling_station,
+    'aggressive': aggressive,
+    'tight': tight,
+    'random': random_bot,
+}
+
+
+def next_to_act(game: Game) -> Player:
+    sitting = game.players.get_sitting_players()
+    if game.state_cd == State.PREFLOP and len(sitting) > 2:
+        sitting = sitting[2:] + sitting[:2]
+    highest_bet = game.players.highest_bet()
+    for p in sitting:
+        if p.has_folded or p.stack == 0:
+            continue
+        if not p.has_acted or p.bet_amt < highest_bet:
+            return p
+    raise SimulationError('No player can act in {} of game {}'.format(
+        game.state_cd.name, game.game_id))
+
+
+def chip_count(game: Game) -> int:
+    return game.pot_amt + sum(p.stack + p.bet_amt for p in game.players.players)
+
+
+def new_sim_game(game_id, big_blind, num_seats, rng) -> Game:
+    game = {'game_id': game_id,
+            'game_type': 'texas_holdem',
+            'num_seats': num_seats,
+            'big_blind': big_blind,
+            'small_blind': big_blind // 2,
+            'min_buyin': big_blind,
+            'max_buyin': 1000 * big_blind,
+            'table_name': game_id,
+            'state_cd': 'STARTING',
+            'pot_amt': 0,
+            'version': 0,
+            'action_seq': 0}
+    return Game(game, [], rng=rng)
+
+
+def play_table(num_hands: int, strategies: List[str], seed=None, sink=None,
+               big_blind=50, buyin=5000, game_id='sim', check_rules=True) -> dict:
+    rng = random.Random(seed)
+    game = new_sim_game(game_id, big_blind, len(strategies), rng)
+
+    def save():
+        if sink is None:
+            game.save(None)
+        else:
+            sink.save(game)
+
+    save()
+    bots = {}
+    for i, name in enumerate(strategies):
+        user_id = '{}-{}'.format(name, i)
+        bots[user_id] = STRATEGIES[name]
+        game.join(new_player(game_id, user_id, i + 1, buyin))
+        save()
+    chips = buyin * len(strategies)
+    hands = actions = rebuys = 0
+    hand_seed = game.deck_seed
+    while hands < num_hands:
+        if game.state_cd == State.STARTING:
+            # Everyone else is busted, so they all buy back in.
+            for p in game.players.players:
+                if p.sitting_out:
+                    game.rebuy(p.user_id, buyin)
+                    chips += buyin
+                    rebuys += 1
+            save()
+            hand_seed = game.deck_seed
+        player = next_to_act(game)
+        action_cd, kwargs = bots[player.user_id](game, player, rng)
+        game.apply(action_cd, player.user_id, **kwargs)
+        save()
+        actions += 1
+        if game.deck_seed != hand_seed or game.state_cd == State.STARTING:
+            hands += 1
+            hand_seed = game.deck_seed
+        if check_rules:
+            if chip_count(game) != chips:
+                raise SimulationError('Chips not conserved after {} by {}: {} != {}'.format(
+                    action_cd, player.user_id, chip_count(game), chips))
+            if any(p.stack < 0 for p in game.players.players):
+                raise SimulationError('Negative stack after {} by {}'.format(
+                    action_cd, player.user_id))
+    return {'hands': hands, 'actions': actions, 'rebuys': rebuys}
+
+
+def play_tournament(num_entrants: int, strategies: List[str], seed=None, table_size=9,
+                    starting_stack=5000, hands_per_level=20, check_rules=True) -> dict:
+    # Tables take turns acting, one action each, and the clock is the number
+    # of hands played, so blind levels go up every hands_per_level hands.
+    rng = random.Random(seed)
+    schedule = [level._replace(seconds=hands_per_level) for level in DEFAULT_SCHEDULE]
+    tournament = Tournament(new_tournament('sim', table_size, starting_stack, schedule=schedule))
+    bots = {}
+    for i in range(num_entrants):
+        user_id = 'bot-{}'.format(i)
+        bots[user_id] = STRATEGIES[strategies[i % len(strategies)]]
+        tournament.register(user_id)
+    games = {}
+    moved = []
+    hands = actions = moves = 0
+
+    def hand_finished(game):
+        nonlocal hands
+        hands += 1
+        # Moved players are seated once the action that moved them is done,
+        # as the service does on their new table's worker.
+        moved.extend(tournament.hand_finished(game))
+
+    def seat_moved():
+        nonlocal moves
+        while moved:
+            move = moved.pop(0)
+            tournament.seat_moved_player(games[move.to_game_id], move)
+            moves += 1
+
+    for game_row, players in tournament.start(0, rng):
+        game = Game(game_row, [], rng=random.Random(rng.getrandbits(64)))
+        game.on_hand_end = hand_finished
+        seat_table(game, players)
+        games[game.game_id] = game
+    seat_moved()
+    chips = num_entrants * starting_stack
+    while tournament.state_cd == 'RUNNING':
+        next_level_at = tournament.next_level_at()
+        if next_level_at is not None and hands >= next_level_at:
+            tournament.advance_level(hands)
+        for game in list(games.values()):
+            if game.state_cd == State.STARTING or tournament.state_cd != 'RUNNING':
+                continue
+            player = next_to_act(game)
+            action_cd, kwargs = bots[player.user_id](game, player, rng)
+            game.apply(action_cd, player.user_id, **kwargs)
+            seat_moved()
+            game.save(None)
+            actions += 1
+        if check_rules:
+            total = sum(chip_count(g) for g in games.values())
+            total += sum(tournament.in_flight.values())
+            if total != chips:
+                raise SimulationError('Chips not conserved: {} != {}'.format(total, chips))
+            if not all(len(seats) <= table_size for seats in tournament.seats.values()):
+                raise SimulationError('Too many players at a table')
+    places = {user_id: e['place'] for user_id, e in tournament.entrants.items()}
+    return {'hands': hands, 'actions': actions, 'moves': moves,
+            'tables': len(games), 'level': tournament.level, 'places': places}
+
+
+def _play_table(args) -> dict:
+    return play_table(*args)
+
+
+def simulate(num_tables: int, hands_per_table: int, strategies: List[str],
+             seed=None, workers=1) -> dict:
+    seeds = random.Random(seed).sample(range(2 ** 62), num_tables)
+    jobs = [(hands_per_table, strategies, s, None, 50, 5000, 'sim-{}'.format(i))
+            for i, s in enumerate(seeds)]
+    start = time.perf_counter()
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(_play_table, jobs))
+    else:
+        results = [_play_table(job) for job in jobs]
+    elapsed = time.perf_counter() - start
+    totals = {k: sum(r[k] for r in results) for k in ('hands', 'actions', 'rebuys')}
+    totals['seconds'] = elapsed
+    totals['hands_per_second'] = totals['hands'] / elapsed if elapsed else 0
+    return totals
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Play bots against each other without a database.')
+    parser.add_argument('--tables', type=int, default=1)
+    parser.add_argument('--hands', type=int, default=1000, help='hands per table')
+    parser.add_argument('--strategies', default='random,random,tight,aggressive',
+                        help='comma separated, one per seat: {}'.format(', '.join(STRATEGIES)))
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+    print(json.dumps(simulate(args.tables, args.hands, args.strategies.split(','),
+                              args.seed, args.workers)))
@@ -0,0 +1,66 @@
+from concurrent.futures import Future
+from flask import current_app
+import queue
+import threading
+import zlib
+
+
+class TableExecutor:
+    # Runs work for a table on the one worker thread its game_id hashes to,
+    # so actions on a table run strictly in submission order while other
+    # tables proceed on the other workers.
+    queues: list
+
+    def __init__(self, num_workers=4):
+        self.queues = [queue.Queue() for _ in range(num_workers)]
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def shard(self, game_id) -> int:
+        return zlib.crc32(game_id.encode()) % len(self.queues)
+
+    def start(self):
+        with self.lock:
+            if self.threads:
+                return
+            for i, q in enumerate(self.queues):
+                t = threading.Thread(target=self.run_worker, args=(q,),
+                                     name='table-worker-{}'.format(i),
+                                     daemon=True)
+                t.start()
+                self.threads.append(t)
+
+    def submit(self, game_id, fn, *args, **kwargs) -> Future:
+        if not self.threads:
+            self.start()
+        future = Future()
+        self.queues[self.shard(game_id)].put((future, fn, args, kwargs))
+        return future
+
+    def run_worker(self, q):
+        while True:
+            item = q.get()
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def shutdown(self):
+        with self.lock:
+            for q in self.queues:
+                q.put(None)
+            for t in self.threads:
+                t.join()
+            self.threads = []
+
+
+def get_table_executor() -> TableExecutor:
+    if 'table_executor' not in current_app.extensions:
+        current_app.extensions['table_executor'] = TableExecutor(
+            current_app.config.get('TABLE_WORKERS', 4))
+    return current_app.extensions['table_executor']
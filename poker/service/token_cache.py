@@ -0,0 +1,72 @@
+from flask import current_app
+import datetime
+import threading
+
+
+class TokenCache:
+    # Validated tokens are kept for `ttl` seconds before being re-read from
+    # the tokens table. The sliding expiry is tracked here on every request
+    # but only written back once it has moved by `refresh_fraction` of the
+    # token lifetime.
+    tokens: dict
+
+    def __init__(self, ttl=60, lifetime=3600, refresh_fraction=0.25,
+                 sweep_seconds=300):
+        self.ttl = datetime.timedelta(seconds=ttl)
+        self.lifetime = datetime.timedelta(seconds=lifetime)
+        self.refresh_after = self.lifetime * refresh_fraction
+        self.sweep_interval = datetime.timedelta(seconds=sweep_seconds)
+        self.next_sweep = datetime.datetime.min
+        self.tokens = {}
+        self.lock = threading.Lock()
+
+    def get(self, auth_token, now) -> dict:
+        entry = self.tokens.get(auth_token)
+        if entry and entry['cached_at'] + self.ttl > now:
+            return entry
+        return None
+
+    def put(self, token: dict, now) -> dict:
+        entry = {'auth_token': token['auth_token'],
+                 'user_id': token['user_id'],
+                 'token_expiry_dttm': token['token_expiry_dttm'],
+                 'persisted_expiry_dttm': token['token_expiry_dttm'],
+                 'cached_at': now}
+        with self.lock:
+            self.tokens[entry['auth_token']] = entry
+        return entry
+
+    def drop(self, auth_token):
+        with self.lock:
+            self.tokens.pop(auth_token, None)
+
+    def refresh(self, entry: dict, now) -> bool:
+        entry['token_expiry_dttm'] = now + self.lifetime
+        if entry['token_expiry_dttm'] - entry['persisted_expiry_dttm'] < self.refresh_after:
+            return False
+        entry['persisted_expiry_dttm'] = entry['token_expiry_dttm']
+        return True
+
+    def sweep_due(self, now) -> bool:
+        with self.lock:
+            if now < self.next_sweep:
+                return False
+            self.next_sweep = now + self.sweep_interval
+        return True
+
+    def purge_expired(self, now):
+        with self.lock:
+            self.tokens = {k: v for k, v in self.tokens.items()
+                           if v['token_expiry_dttm'] > now
+                           and v['cached_at'] + self.ttl > now}
+
+
+def get_token_cache() -> TokenCache:
+    if 'token_cache' not in current_app.extensions:
+        config = current_app.config
+        current_app.extensions['token_cache'] = TokenCache(
+            config.get('TOKEN_CACHE_TTL', 60),
+            config.get('TOKEN_LIFETIME_SECONDS', 3600),
+            config.get('TOKEN_REFRESH_FRACTION', 0.25),
+            config.get('TOKEN_SWEEP_SECONDS', 300))
+    return current_app.extensions['token_cache']
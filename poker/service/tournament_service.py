@@ -0,0 +1,204 @@
+from typing import Dict, List, Optional
+from functools import partial
+from flask import current_app
+from poker.db import get_app_db
+from poker.model.poker_model import Game
+from poker.model.tournament_model import Move, Tournament, seat_table
+from poker.repo.poker_repo import insert_game
+from poker.repo.tournament_repo import (get_entrants, get_tournament, get_tournaments,
+                                        insert_tournament, save_tournament)
+from poker.service.game_cache import get_game_cache, new_game
+from poker.service.table_executor import get_table_executor
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TournamentScheduler:
+    # Timed events (tournament starts and blind level changes) in a heap
+    # keyed by due time, so a tick only looks at the events that are due
+    # rather than at every tournament.
+    events: list
+
+    def __init__(self):
+        self.events = []
+        self.seq = itertools.count()
+        self.lock = threading.Lock()
+
+    def schedule(self, at, tournament_id, kind, level=None):
+        with self.lock:
+            heapq.heappush(self.events, (at, next(self.seq), tournament_id, kind, level))
+
+    def next_due(self) -> Optional[float]:
+        with self.lock:
+            return self.events[0][0] if self.events else None
+
+    def pop_due(self, now) -> List[tuple]:
+        due = []
+        with self.lock:
+            while self.events and self.events[0][0] <= now:
+                at, _, tournament_id, kind, level = heapq.heappop(self.events)
+                due.append((at, tournament_id, kind, level))
+        return due
+
+    def __len__(self):
+        return len(self.events)
+
+
+class TournamentService:
+    # Keeps running tournaments in memory. Tables report to it when a hand
+    # ends, on their executor worker; players moved between tables are
+    # seated by a job on the destination table's worker.
+    tournaments: Dict[str, Tournament]
+
+    def __init__(self, db, executor, cache, tick_seconds=1.0):
+        self.db = db
+        self.executor = executor
+        self.cache = cache
+        self.tick_seconds = tick_seconds
+        self.tournaments = {}
+        self.scheduler = TournamentScheduler()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def load(self):
+        # Restores the timed events of tournaments that were scheduled or
+        # running when the process last stopped.
+        for row in get_tournaments(self.db, 'REGISTERING') + get_tournaments(self.db, 'RUNNING'):
+            self.schedule(self.get(row['tournament_id']))
+
+    def get(self, tournament_id) -> Optional[Tournament]:
+        with self.lock:
+            if tournament_id in self.tournaments:
+                return self.tournaments[tournament_id]
+        row = get_tournament(self.db, tournament_id)
+        if row is None:
+            return None
+        tournament = Tournament(row, get_entrants(self.db, tournament_id))
+        with self.lock:
+            return self.tournaments.setdefault(tournament_id, tournament)
+
+    def create(self, row: dict) -> Tournament:
+        insert_tournament(self.db, row)
+        tournament = self.get(row['tournament_id'])
+        self.schedule(tournament)
+        return tournament
+
+    def save(self, tournament: Tournament):
+        tournament.mark_saved(self.write(tournament, self.db))
+
+    def write(self, tournament: Tournament, db) -> dict:
+        with tournament.lock:
+            changes = tournament.get_changes()
+            save_tournament(db, tournament.tournament_id, changes)
+        return changes
+
+    def schedule(self, tournament: Tournament):
+        if tournament.state_cd == 'REGISTERING' and tournament.start_at is not None:
+            self.scheduler.schedule(tournament.start_at, tournament.tournament_id, 'start')
+        elif tournament.next_level_at() is not None:
+            self.scheduler.schedule(tournament.next_level_at(), tournament.tournament_id,
+                                    'level', tournament.level)
+        else:
+            return
+        self.start_ticker()
+
+    def start_ticker(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run_ticker,
+                                               name='tournament-ticker', daemon=True)
+                self.thread.start()
+
+    def run_ticker(self):
+        while True:
+            try:
+                self.tick(time.time())
+            except Exception:
+                logger.exception('tournament tick failed')
+            time.sleep(self.tick_seconds)
+
+    def tick(self, now):
+        for at, tournament_id, kind, level in self.scheduler.pop_due(now):
+            tournament = self.get(tournament_id)
+            if tournament is None:
+                continue
+            if kind == 'start' and tournament.state_cd == 'REGISTERING':
+                if len(tournament.entrants) < 2:
+                    tournament.state_cd = 'CANCELLED'
+                    self.save(tournament)
+                else:
+                    self.start(tournament, now)
+            elif kind == 'level' and tournament.state_cd == 'RUNNING' \
+                    and tournament.level == level:
+                blinds = tournament.advance_level(at)
+                logger.info('blind level up', extra={'tournament_id': tournament_id,
+                                                     'level': tournament.level,
+                                                     'big_blind': blinds.big_blind})
+                self.save(tournament)
+                self.schedule(tournament)
+
+    def start(self, tournament: Tournament, now) -> List[Game]:
+        games = []
+        for game_row, players in tournament.start(now):
+            insert_game(self.db, game_row)
+            game = new_game(game_row, [])
+            game.mark_saved()
+            self.attach(game)
+            seat_table(game, players)
+            game.update_db(self.db)
+            self.cache.put(game)
+            games.append(game)
+        self.save(tournament)
+        self.schedule(tournament)
+        logger.info('tournament started', extra={'tournament_id': tournament.tournament_id,
+                                                 'tables': len(games)})
+        return games
+
+    def attach(self, game: Game):
+        if game.tournament_id is not None:
+            game.on_hand_end = self.hand_finished
+
+    def hand_finished(self, game: Game):
+        tournament = self.get(game.tournament_id)
+        if tournament is None or tournament.state_cd != 'RUNNING':
+            return
+        with tournament.lock:
+            moves = tournament.hand_finished(game)
+        # Written in the game's own save, so the two commit together, and
+        # only marked saved, and the moves sent, once it has.
+        written = []
+        game.defer_write(lambda db: written.append(self.write(tournament, db)))
+        game.after_save(partial(self.hand_saved, tournament, written, moves))
+        if tournament.state_cd == 'FINISHED':
+            logger.info('tournament finished', extra={'tournament_id': tournament.tournament_id})
+
+    def hand_saved(self, tournament: Tournament, written: List[dict], moves: List[Move]):
+        for changes in written:
+            tournament.mark_saved(changes)
+        for move in moves:
+            self.executor.submit(move.to_game_id, self.seat_moved_player, tournament, move)
+
+    def seat_moved_player(self, tournament: Tournament, move: Move):
+        try:
+            game = self.cache.get(self.db, move.to_game_id)
+            self.attach(game)
+            if tournament.seat_moved_player(game, move):
+                game.update_db(self.db)
+        except Exception:
+            self.cache.invalidate(move.to_game_id)
+            logger.exception('could not seat moved player',
+                             extra={'game_id': move.to_game_id, 'user_id': move.user_id})
+
+
+def get_tournament_service() -> TournamentService:
+    if 'tournament_service' not in current_app.extensions:
+        service = TournamentService(get_app_db(), get_table_executor(), get_game_cache(),
+                                    current_app.config.get('TOURNAMENT_TICK_SECONDS', 1.0))
+        service.load()
+        current_app.extensions['tournament_service'] = service
+    return current_app.extensions['tournament_service']
@@ -0,0 +1,19 @@
+from poker.service.credentials import SCHEMES, PasswordHasher, upgrade_plaintext_passwords
+import argparse
+import dataset
+import os
+
+# Hashes the passwords still stored in plaintext, for users who haven't
+# logged in since hashing was introduced.
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Hash plaintext passwords left in the users table.')
+    parser.add_argument('--db', required=True, help='database url, e.g. sqlite:///dev.db')
+    parser.add_argument('--scheme', choices=SCHEMES, default='scrypt')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--batch-size', type=int, default=100)
+    args = parser.parse_args()
+    hasher = PasswordHasher(args.scheme, args.workers)
+    count = upgrade_plaintext_passwords(dataset.connect(args.db), hasher, args.batch_size)
+    hasher.shutdown()
+    print('Hashed {} passwords.'.format(count))
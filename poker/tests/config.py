@@ -1,4 +1,4 @@
 test_user = dict(
-    USERNAME='testuser',
+    USERNAME='newuser',
     PASSWORD='testpass',
-    EMAIL='test@test.com')
+    EMAIL='newuser@test.com')
@@ -0,0 +1,95 @@
+import dataset
+import datetime
+import gzip
+import json
+from poker import create_app
+from poker.model.poker_model import Game
+from poker.repo.poker_repo import get_actions, get_game, get_players
+from poker.repo.schema import create_archive_schema, create_schema
+from poker.service.archive import archive_table, archived_actions, restore_table
+from poker.service.simulator import DatabaseSink, next_to_act, play_table
+
+
+def test_archived_table_restores_as_it_was():
+    db = dataset.connect('sqlite://')
+    archive = dataset.connect('sqlite://')
+    create_schema(db)
+    create_archive_schema(archive)
+    play_table(5, ['random', 'aggressive', 'tight'], seed=4, sink=DatabaseSink(db),
+               game_id='g')
+    before = Game(get_game(db, 'g'), get_players(db, 'g')).get_state()
+    actions = get_actions(db, 'g')
+    now = datetime.datetime.now()
+    assert not archive_table(db, archive, 'g', now - datetime.timedelta(hours=1), now)
+    later = now + datetime.timedelta(days=2)
+    assert archive_table(db, archive, 'g', later, later)
+    assert get_game(db, 'g') is None and db['hands'].count(game_id='g') == 0
+    assert archive['hands'].count(game_id='g') == 5
+    assert archived_actions(archive, 'g') == actions
+    assert restore_table(db, archive, 'g')
+    assert Game(get_game(db, 'g'), get_players(db, 'g')).get_state() == before
+    assert get_actions(db, 'g') == actions and db['hands'].count(game_id='g') == 5
+    assert archive['archived_games'].count() == 0 and not restore_table(db, archive, 'g')
+
+
+def test_idle_and_finished_tables_are_archived_and_restored_on_demand(tmp_path):
+    app = create_app({'ENV': 'UNITTEST', 'DBCONN': 'sqlite:///{}'.format(tmp_path / 'main.db'),
+                      'ARCHIVE_DBCONN': 'sqlite:///{}'.format(tmp_path / 'archive.db'),
+                      'ARCHIVE_INTERVAL_SECONDS': 0, 'LOBBY_CACHE_SECONDS': 0,
+                      'PASSWORD_SCRYPT_N': 2 ** 8})
+    client = app.test_client()
+    db = dataset.connect(app.config['DBCONN'])
+    archiver = app.extensions['table_archiver']
+    headers = []
+    for name in ('ar1', 'ar2'):
+        client.post('api/user/register', json={'username': name, 'password': name,
+                                               'email': name + '@test.com'})
+        rv = client.post('api/user/login', json={'username': name, 'password': name})
+        headers.append({'x-access-token': rv.json['auth_token']})
+    try:
+        game_ids = []
+        for _ in range(2):
+            rv = client.post('api/poker/', headers=headers[0],
+                             json={'game_type': 'texas_holdem', 'num_seats': 2, 'big_blind': 50,
+                                   'small_blind': 25, 'min_buyin': 100, 'max_buyin': 1000,
+                                   'table_name': 't'})
+            game_ids.append(rv.json['game_id'])
+        played, empty = game_ids
+        users = {}
+        for seat_num, h in enumerate(headers, 1):
+            rv = client.post('api/poker/{}/player/'.format(played), headers=h,
+                             json={'seat_num': seat_num, 'buyin': 1000})
+            users[rv.json['user_id']] = h
+
+        def check_call():
+            game = Game(get_game(db, played), get_players(db, played))
+            rv = client.get('api/poker/{}/player/check_call'.format(played),
+                            headers=users[next_to_act(game).user_id])
+            assert rv.status_code == 200
+        while not get_game(db, played)['hands_played']:
+            check_call()
+        state = Game(get_game(db, played), get_players(db, played)).get_state()
+
+        now = datetime.datetime.now()
+        assert archiver.sweep(now + datetime.timedelta(minutes=15)) == 1
+        assert get_game(db, empty) is None
+        assert [g['game_id'] for g in client.get('api/poker/').json['games']] == [played]
+        assert archiver.sweep(now + datetime.timedelta(days=2)) == 1
+        assert db['games'].count() == 0 and db['players'].count() == 0
+        assert db['hands'].count() == 0
+
+        rv = client.get('api/poker/history', headers=headers[0])
+        hand, = [json.loads(line) for line in gzip.decompress(rv.data).decode().splitlines()]
+        assert hand['game_id'] == played and hand['actions']
+
+        rv = client.get('api/poker/{}/equity'.format(played), headers=headers[0])
+        assert rv.status_code == 400
+        assert Game(get_game(db, played), get_players(db, played)).get_state() == state
+        assert db['hands'].count() == 1
+        check_call()
+        assert archiver.sweep(now + datetime.timedelta(minutes=15)) == 0
+        rv = client.get('api/poker/nope/player/check_call', headers=headers[0])
+        assert rv.status_code == 404 and rv.json['message'].startswith('Game nope not found.')
+    finally:
+        app.extensions['table_executor'].shutdown()
+        app.extensions['password_hasher'].shutdown()
@@ -0,0 +1,147 @@
+import asyncio
+import dataset
+import gzip
+import json
+import threading
+from poker.asgi import create_asgi_app
+from poker.model.poker_model import Game
+from poker.repo.poker_repo import get_actions, get_game, get_players
+from poker.service.pubsub import broker
+from poker.service.simulator import next_to_act
+
+GAME = {'game_type': 'texas_holdem', 'num_seats': 2, 'big_blind': 50, 'small_blind': 25,
+        'min_buyin': 100, 'max_buyin': 1000, 'table_name': 't'}
+
+
+class Connection:
+    # One request driven through the app the way an ASGI server would.
+    def __init__(self, app, method, path, body=None, headers=None):
+        query = path.partition('?')[2]
+        self.app = app
+        self.scope = {'type': 'http', 'method': method, 'path': path.partition('?')[0],
+                      'query_string': query.encode(), 'headers': [], 'http_version': '1.1'}
+        for k, v in dict(headers or {}).items():
+            self.scope['headers'].append((k.encode(), v.encode()))
+        self.body = b''
+        if body is not None:
+            self.body = json.dumps(body).encode()
+            self.scope['headers'].append((b'content-type', b'application/json'))
+        self.requested = False
+        self.disconnected = asyncio.Event()
+        self.messages = asyncio.Queue()
+
+    async def receive(self):
+        if not self.requested:
+            self.requested = True
+            return {'type': 'http.request', 'body': self.body}
+        await self.disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        await self.messages.put(message)
+
+    def start(self):
+        return asyncio.ensure_future(self.app(self.scope, self.receive, self.send))
+
+    async def next_chunk(self):
+        message = await asyncio.wait_for(self.messages.get(), 5)
+        return message.get('body', message.get('status'))
+
+
+async def call(app, method, path, body=None, headers=None):
+    conn = Connection(app, method, path, body, headers)
+    await conn.start()
+    start = await conn.messages.get()
+    data = b''
+    while not conn.messages.empty():
+        data += (await conn.messages.get()).get('body', b'')
+    return start['status'], data
+
+
+async def login(app, name):
+    user = {'username': name, 'password': name, 'email': name + '@test.com'}
+    status, _ = await call(app, 'POST', '/api/user/register', user)
+    assert status == 201
+    status, data = await call(app, 'POST', '/api/user/login', user)
+    assert status == 200 and 'password_hash' not in json.loads(data)
+    return {'x-access-token': json.loads(data)['auth_token']}
+
+
+async def seated_game(app, db):
+    headers = [await login(app, name) for name in ('a1', 'a2')]
+    status, data = await call(app, 'POST', '/api/poker/', GAME, headers[0])
+    assert status == 201
+    game_id = json.loads(data)['game_id']
+    users = {}
+    for seat_num, h in enumerate(headers, 1):
+        status, data = await call(app, 'POST', '/api/poker/{}/player/'.format(game_id),
+                                  {'seat_num': seat_num, 'buyin': 1000}, h)
+        assert status == 200
+        users[json.loads(data)['user_id']] = h
+    return game_id, users
+
+
+def make_app(tmp_path, **config):
+    dbconn = 'sqlite:///{}'.format(tmp_path / 'a.db')
+    app = create_asgi_app(dict({'ENV': 'UNITTEST', 'DBCONN': dbconn,
+                                'PASSWORD_SCRYPT_N': 2 ** 8}, **config))
+    return app, dataset.connect(dbconn)
+
+
+def test_asgi_serves_table_actions(tmp_path):
+    app, db = make_app(tmp_path)
+
+    async def run():
+        game_id, users = await seated_game(app, db)
+        game = Game(get_game(db, game_id), get_players(db, game_id))
+        headers = users[next_to_act(game).user_id]
+        before = len(get_actions(db, game_id))
+        status, _ = await call(app, 'GET', '/api/poker/{}/player/check_call'.format(game_id),
+                               headers=headers)
+        assert status == 200 and len(get_actions(db, game_id)) == before + 1
+        status, data = await call(app, 'GET', '/api/poker/{}/player/check_call'.format(game_id),
+                                  headers={'x-access-token': 'nope'})
+        assert status == 401 and json.loads(data)['message'] == 'Invalid token.'
+        status, data = await call(app, 'POST', '/api/poker/', {'game_type': 'x'}, headers)
+        assert status == 400 and 'num_seats' in json.loads(data)['errors']
+    asyncio.run(run())
+
+
+def test_asgi_hands_other_routes_to_flask(tmp_path):
+    app, db = make_app(tmp_path)
+
+    async def run():
+        game_id, users = await seated_game(app, db)
+        status, data = await call(app, 'GET', '/api/poker/?limit=1')
+        assert status == 200 and json.loads(data)['games'][0]['game_id'] == game_id
+        headers = next(iter(users.values()))
+        status, data = await call(app, 'GET', '/api/poker/history', headers=headers)
+        assert status == 200 and gzip.decompress(data) == b''
+    asyncio.run(run())
+
+
+def test_idle_streams_do_not_hold_threads(tmp_path):
+    # Counted from here, since earlier tests may have left pools running.
+    threads_before = threading.active_count()
+    app, db = make_app(tmp_path, ASGI_DB_THREADS=2, TABLE_WORKERS=2)
+
+    async def run():
+        game_id, users = await seated_game(app, db)
+        headers = next(iter(users.values()))
+        path = '/api/poker/{}/stream'.format(game_id)
+        conns = [Connection(app, 'GET', path, headers=headers) for _ in range(500)]
+        tasks = [c.start() for c in conns]
+        for c in conns:
+            assert await c.next_chunk() == 200
+            assert (await c.next_chunk()).startswith(b'event: state')
+        assert threading.active_count() - threads_before < 20
+        game = Game(get_game(db, game_id), get_players(db, game_id))
+        status, _ = await call(app, 'GET', '/api/poker/{}/player/check_call'.format(game_id),
+                               headers=users[next_to_act(game).user_id])
+        assert status == 200
+        for c in conns:
+            assert (await c.next_chunk()).startswith(b'data: ')
+            c.disconnected.set()
+        await asyncio.gather(*tasks)
+        assert not broker.has_subscribers(game_id)
+    asyncio.run(run())
@@ -1,6 +1,8 @@
 import pytest
+import json
 from .config import test_user
 from poker import create_app
+from poker.db import get_db
 import os
 import glob
 import datetime
@@ -8,7 +10,6 @@ import dataset
 from poker.repo.poker_repo import *
 from poker.model.poker_model import *
 from flask_injector import FlaskInjector
-from injector import singleton
 import sqlite3
 
 
@@ -23,8 +24,7 @@ def client():
     def configure(binder):
         binder.bind(
             sqlite3.Connection,
-            to=dataset.connect('sqlite:///temp.db'),
-            scope=singleton,
+            to=get_db,
             )
     FlaskInjector(app=app, modules=[configure])
     assert 'DBCONN' in app.config
@@ -45,15 +45,15 @@ def register_user(client, username, password, email):
 @pytest.fixture
 def registered_user(client):
     user_details = ('testuser', 'password', 'testuser@test.com')
-    rv = register_user(client, *user_details)
-    return rv.json
+    register_user(client, *user_details)
+    return dict(zip(('username', 'password', 'email'), user_details))
 
 
 @pytest.fixture
 def registered_user2(client):
     user_details = ('testuser2', 'password2', 'testuser2@test.com')
-    rv = register_user(client, *user_details)
-    return rv.json
+    register_user(client, *user_details)
+    return dict(zip(('username', 'password', 'email'), user_details))
 
 
 def login_user(client, username, email, password):
@@ -89,6 +89,13 @@ def test_register_user(client):
     assert 'user_id' in rv.json
 
 
+def test_register_user_rejects_taken_username(client, registered_user):
+    rv = register_user(client, registered_user['username'], 'other',
+                       'other@test.com')
+    assert rv._status_code == 400
+    assert rv.json['message'] == 'Username is taken.'
+
+
 def test_login_user_with_username(client, registered_user):
     rv = login_user(client, registered_user['username'],
                     None, registered_user['password'])
@@ -137,6 +144,16 @@ def test_authentication_fails_with_expired_token(client, logged_in_user1):
     assert rv.json['message'] == 'Token has expired.'
 
 
+def test_logout_invalidates_token(client, logged_in_user1):
+    headers = {'x-access-token': logged_in_user1['auth_token']}
+    assert client.get('api/user/testauth', headers=headers)._status_code == 200
+    rv = client.post('api/user/logout', headers=headers)
+    assert rv._status_code == 200
+    rv = client.get('api/user/testauth', headers=headers)
+    assert rv._status_code == 401
+    assert rv.json['message'] == 'Invalid token.'
+
+
 def create_2max_holdem_game(client, auth_token):
     rv = client.post('api/poker/',
                      json={'game_type': 'texas_holdem',
@@ -182,7 +199,7 @@ def add_player(client, holdem_2max_game: Game, logged_in_user, seat_num):
     return rv
 
 
-def get_db():
+def temp_db():
     return dataset.connect('sqlite:///temp.db')
 
 
@@ -190,7 +207,7 @@ def test_add_player(client, holdem_2max_game: Game, logged_in_user1):
     rv = add_player(client, holdem_2max_game, logged_in_user1, 1)
     print(rv.json)
     assert rv._status_code == 200
-    assert len(get_players(get_db(), holdem_2max_game.game_id)) == 1
+    assert len(get_players(temp_db(), holdem_2max_game.game_id)) == 1
 
 
 def test_start_game(holdem_2max_game_preflop: Game):
@@ -212,5 +229,50 @@ def test_action_when_not_turn(client, logged_in_user1, logged_in_user2, holdem_2
     url = 'api/poker/{}/player/check_call'.format(holdem_2max_game.game_id)
     client.get(url, headers={'x-access_token': logged_in_user1['auth_token']})
 
+
+def test_game_stream_pushes_diffs(client, logged_in_user1, logged_in_user2, holdem_2max_game_preflop: Game):
+    game = holdem_2max_game_preflop
+    headers = {'x-access-token': logged_in_user1['auth_token']}
+    rv = client.get('api/poker/{}/stream'.format(game.game_id),
+                    headers=headers, buffered=False)
+    assert rv.mimetype == 'text/event-stream'
+    events = iter(rv.response)
+    event = next(events).decode()
+    assert event.startswith('event: state')
+    state = json.loads(event.split('data: ', 1)[1])
+    assert state['state_cd'] == 'PREFLOP'
+    assert len(state['hand']) == 4
+    assert 'deck' not in state
+    client.get('api/poker/{}/player/check_call'.format(game.game_id),
+               headers=headers)
+    diff = json.loads(next(events).decode().split('data: ', 1)[1])
+    assert diff['players'][logged_in_user1['user_id']]['bet_amt'] == game.big_blind
+    assert 'hands' not in diff
+    rv.close()
+
+
 def test_preflop_call(client, db, holdem_2max_game_preflop: Game):
     pass
+
+
+def test_equity(client, logged_in_user1):
+    headers = {'x-access-token': logged_in_user1['auth_token']}
+    rv = client.post('api/poker/equity',
+                     json={'hands': ['AhAd', 'KsKc'], 'board': '2c7d9hKd'},
+                     headers=headers)
+    assert rv._status_code == 200
+    assert rv.json['exhaustive']
+    assert rv.json['runouts'] == 44
+    assert rv.json['players'][1]['win'] == pytest.approx(42 / 44)
+    rv = client.post('api/poker/equity', json={'hands': ['AhAd', 'AhKc']},
+                     headers=headers)
+    assert rv._status_code == 400
+    rv = client.post('api/poker/equity', json={'hands': ['AhAd', 7]}, headers=headers)
+    assert rv._status_code == 400
+
+
+def test_game_equity_requires_all_in(client, logged_in_user1, logged_in_user2, holdem_2max_game_preflop: Game):
+    game = holdem_2max_game_preflop
+    rv = client.get('api/poker/{}/equity'.format(game.game_id),
+                    headers={'x-access-token': logged_in_user1['auth_token']})
+    assert rv._status_code == 400
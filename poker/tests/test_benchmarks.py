@@ -0,0 +1,17 @@
+from benchmarks.bench import BENCHMARKS, CLIENTS, close_clients, compare
+import os
+
+
+def test_benchmarks_run():
+    for name, (group, setup) in BENCHMARKS.items():
+        setup()()
+        dirs = [client.dir for client in CLIENTS]
+        close_clients()
+        assert not any(os.path.exists(d) for d in dirs)
+
+
+def test_compare_flags_regressions():
+    old = {'results': {'a': {'min_us': 10.0}, 'b': {'min_us': 10.0}}}
+    new = {'results': {'a': {'min_us': 10.5}, 'b': {'min_us': 12.0},
+                       'c': {'min_us': 1.0}}}
+    assert compare(old, new, 0.1) == ['b']
@@ -0,0 +1,99 @@
+import dataset
+import threading
+import pytest
+from poker import create_app
+from poker.repo.schema import create_schema
+from poker.service.credentials import (PasswordHasher, PasswordHasherBusy, hash_password,
+                                       upgrade_plaintext_passwords, verify_password)
+
+CHEAP = {'scrypt_n': 2 ** 8}
+
+
+def test_hashes_verify_under_both_schemes():
+    for scheme, cost in (('scrypt', CHEAP), ('pbkdf2_sha256', {'pbkdf2_iterations': 1000})):
+        encoded = hash_password('secret', scheme, **cost)
+        assert encoded.startswith(scheme + '$') and 'secret' not in encoded
+        assert verify_password('secret', encoded)
+        assert not verify_password('Secret', encoded)
+    assert hash_password('secret', **CHEAP) != hash_password('secret', **CHEAP)
+
+
+def test_hasher_checks_users_and_upgrades_old_passwords():
+    hasher = PasswordHasher(workers=2, **CHEAP)
+    legacy = {'password': 'pw', 'password_hash': None}
+    assert not hasher.check_user(dict(legacy), 'nope')
+    assert hasher.check_user(legacy, 'pw')
+    assert legacy['password'] is None and verify_password('pw', legacy['password_hash'])
+    weak = {'password': None, 'password_hash': hash_password('pw', scrypt_n=2 ** 4)}
+    assert hasher.check_user(weak, 'pw') and not hasher.needs_rehash(weak['password_hash'])
+    assert not hasher.check_user(None, 'pw')
+    assert not hasher.check_user(weak, None)
+
+
+def test_hasher_bounds_pending_work():
+    hasher = PasswordHasher(workers=1, max_pending=1, timeout=0.01, **CHEAP)
+    release = threading.Event()
+    blocker = threading.Thread(target=hasher.run, args=(release.wait,))
+    blocker.start()
+    while hasher.slots._value:
+        pass
+    with pytest.raises(PasswordHasherBusy):
+        hasher.hash('pw')
+    release.set()
+    blocker.join()
+    assert hasher.rejected == 1 and verify_password('pw', hasher.hash('pw'))
+
+
+def test_plaintext_rows_are_hashed_in_batches():
+    db = dataset.connect('sqlite://')
+    create_schema(db)
+    for i in range(5):
+        db['users'].insert({'user_id': str(i), 'username': 'u{}'.format(i), 'password': 'pw'})
+    hasher = PasswordHasher(workers=2, **CHEAP)
+    assert upgrade_plaintext_passwords(db, hasher, batch_size=2) == 5
+    rows = list(db['users'].all())
+    assert all(r['password'] is None and verify_password('pw', r['password_hash']) for r in rows)
+
+
+def test_legacy_rows_without_user_id_are_hashed_by_id():
+    db = dataset.connect('sqlite://')
+    for i in range(3):
+        db['users'].insert({'username': 'u{}'.format(i), 'password': 'pw', 'user_id': None})
+    hasher = PasswordHasher(workers=2, **CHEAP)
+    assert upgrade_plaintext_passwords(db, hasher, batch_size=2) == 3
+    assert all(verify_password('pw', r['password_hash']) for r in db['users'].all())
+
+
+def test_login_looks_up_user_then_verifies_hash(tmp_path):
+    dbconn = 'sqlite:///{}'.format(tmp_path / 'p.db')
+    app = create_app({'ENV': 'UNITTEST', 'DBCONN': dbconn, 'PASSWORD_SCRYPT_N': 2 ** 8})
+    client = app.test_client()
+    rv = client.post('api/user/register', json={'username': 'cred', 'password': 'pw',
+                                                'email': 'cred@test.com'})
+    assert rv.status_code == 201 and 'password' not in rv.json and 'password_hash' not in rv.json
+    db = dataset.connect(dbconn)
+    db['users'].insert({'user_id': 'old', 'username': 'old', 'email': 'old@test.com',
+                        'password': 'legacy', 'role': 'USER'})
+    assert client.post('api/user/login', json={'username': 'cred', 'password': 'no'}) \
+        .status_code == 400
+    rv = client.post('api/user/login', json={'email': 'cred@test.com', 'password': 'pw'})
+    assert rv.status_code == 200 and set(rv.json) >= {'auth_token', 'user_id'}
+    assert 'password_hash' not in rv.json
+    assert client.post('api/user/login', json={'username': 'old', 'password': 'legacy'}) \
+        .status_code == 200
+    row = db['users'].find_one(username='old')
+    assert row['password'] is None and verify_password('legacy', row['password_hash'])
+
+
+def test_login_saves_legacy_row_without_user_id(tmp_path):
+    dbconn = 'sqlite:///{}'.format(tmp_path / 'legacy.db')
+    db = dataset.connect(dbconn)
+    for name in ('old1', 'old2'):
+        db['users'].insert({'username': name, 'password': name, 'password_hash': None,
+                            'user_id': None, 'role': 'USER'})
+    app = create_app({'ENV': 'UNITTEST', 'DBCONN': dbconn, 'PASSWORD_SCRYPT_N': 2 ** 8})
+    rv = app.test_client().post('api/user/login', json={'username': 'old1', 'password': 'old1'})
+    assert rv.status_code == 200 and rv.json['user_id']
+    old1, old2 = db['users'].find(order_by='id')
+    assert old1['user_id'] == rv.json['user_id'] and verify_password('old1', old1['password_hash'])
+    assert old2['user_id'] is None and old2['password'] == 'old2'
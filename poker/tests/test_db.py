@@ -0,0 +1,10 @@
+from poker.db import connect
+
+
+def test_connect_reuses_database_and_sets_pragmas(tmp_path):
+    url = 'sqlite:///{}'.format(tmp_path / 'pool.db')
+    db = connect(url, synchronous='NORMAL', busy_timeout_ms=2500)
+    assert connect(url) is db
+    assert db.query('PRAGMA journal_mode').next()['journal_mode'] == 'wal'
+    assert db.query('PRAGMA synchronous').next()['synchronous'] == 1
+    assert db.query('PRAGMA busy_timeout').next()['timeout'] == 2500
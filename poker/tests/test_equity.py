@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from poker.model.cards import CARD_BITS, cards_from_str
+from poker.model.equity import equity, equity_str, evaluate_masks
+from poker.model.evaluator import evaluate_mask
+import random
+
+
+def test_evaluate_masks_matches_evaluator():
+    rng = random.Random(7)
+    masks = []
+    for _ in range(5000):
+        mask = 0
+        for c in rng.sample(range(52), 7):
+            mask |= CARD_BITS[c]
+        masks.append(mask)
+    scores = evaluate_masks(np.array(masks, dtype=np.uint64))
+    assert list(scores) == [evaluate_mask(m) for m in masks]
+
+
+def test_exhaustive_equity_on_the_turn():
+    res = equity_str(['AhAd', 'KsKc'], '2c7d9hKd')
+    assert res['exhaustive']
+    assert res['runouts'] == 44
+    aces, kings = res['players']
+    assert aces['win'] == pytest.approx(2 / 44)
+    assert kings['win'] == pytest.approx(42 / 44)
+    assert aces['equity'] + kings['equity'] == pytest.approx(1)
+
+
+def test_complete_board_splits_pot():
+    res = equity_str(['AhKc', 'AdKd'], 'QhJhTc3d4s')
+    assert res['runouts'] == 1
+    assert [p['tie'] for p in res['players']] == [1, 1]
+    assert [p['equity'] for p in res['players']] == [0.5, 0.5]
+
+
+def test_monte_carlo_preflop_is_close_to_exact():
+    res = equity_str(['AhAd', 'KsKc'], samples=200000, seed=1)
+    assert not res['exhaustive']
+    assert res['runouts'] == 200000
+    assert res['players'][0]['equity'] == pytest.approx(0.8126, abs=0.005)
+
+
+def test_monte_carlo_is_seedable():
+    hands = [cards_from_str('7c8c'), cards_from_str('AsKd'), cards_from_str('2h2d')]
+    assert equity(hands, samples=1000, seed=3) == equity(hands, samples=1000, seed=3)
+
+
+def test_rejects_repeated_cards():
+    with pytest.raises(ValueError):
+        equity_str(['AhAd', 'AhKc'])
@@ -0,0 +1,75 @@
+import random
+from itertools import combinations
+from poker.model.cards import *
+from poker.model.evaluator import *
+from poker.model.poker_model import Game
+
+
+def test_evaluate_orders_categories():
+    assert evaluate_str('AhKhQhJhTh') == 1
+    assert evaluate_str('7d5c4h3s2d') == WORST_HAND
+    assert hand_category(evaluate_str('5d4d3d2dAd')) == 'straight_flush'
+    assert hand_category(evaluate_str('5d4c3d2dAd')) == 'straight'
+    assert hand_category(evaluate_str('2d2c2h3s3d9cJc')) == 'full_house'
+    assert hand_category(evaluate_str('2d2c2h2s3d9cJc')) == 'four_of_a_kind'
+    assert evaluate_str('AdAcKhKs2d') < evaluate_str('AdAcQhQsKd')
+    assert evaluate_mask(cards_mask(cards_from_str('9s8s7s6s5s4d4c'))) == 6
+
+
+def test_evaluate_matches_best_five_card_subset():
+    rng = random.Random(1)
+    deck = list(range(52))
+    for n in (6, 7):
+        for _ in range(2000):
+            cards = rng.sample(deck, n)
+            assert evaluate(cards) == min(evaluate(c)
+                                          for c in combinations(cards, 5))
+
+
+def make_river_game(players):
+    game = Game({'game_id': 'g', 'state_cd': 'RIVER', 'pot_amt': 0,
+                 'board': 'AdKd7c4s2h', 'small_blind': 25, 'big_blind': 50},
+                [{'game_id': 'g', 'seat_num': i+1, 'sitting_out': False,
+                  'has_folded': False, 'has_acted': True, 'is_active': False,
+                  'bet_amt': 0, **p}
+                 for i, p in enumerate(players)])
+    game.collect_bets()
+    return game
+
+
+def test_showdown_side_pots():
+    game = make_river_game([
+        dict(user_id='short', hand='AhAs', stack=0, amt_in_pot=100),
+        dict(user_id='deep', hand='KhKs', stack=0, amt_in_pot=300),
+        dict(user_id='caller', hand='QhQs', stack=0, amt_in_pot=300)])
+    game.pot_amt = 700
+    results = game.showdown()
+    assert results == [{'amount': 300, 'winners': ['short']},
+                       {'amount': 400, 'winners': ['deep']}]
+    stacks = {p.user_id: p.stack for p in game.players.players}
+    assert stacks == {'short': 300, 'deep': 400, 'caller': 0}
+    assert game.pot_amt == 0
+
+
+def test_showdown_split_pot_and_folded_player():
+    game = make_river_game([
+        dict(user_id='a', hand='3h3s', stack=0, amt_in_pot=101),
+        dict(user_id='b', hand='3d3c', stack=0, amt_in_pot=101),
+        dict(user_id='c', hand='AhAs', stack=0, amt_in_pot=50,
+             has_folded=True)])
+    game.pot_amt = 252
+    results = game.showdown()
+    assert results == [{'amount': 252, 'winners': ['a', 'b']}]
+    assert [p.stack for p in game.players.players] == [126, 126, 0]
+
+
+def test_card_strings_round_trip():
+    assert cards_to_str(cards_from_str('Ad2cTsKh')) == 'Ad2cTsKh'
+    assert mask_to_cards(cards_mask([0, 51, 13])) == [0, 13, 51]
+    deck = Deck()
+    deck.shuffle(random.Random(3))
+    hand = deck.deal(2)
+    assert len(deck) == 50
+    restored = Deck.from_str(deck.to_str())
+    assert bytes(restored.cards) == bytes(deck.cards[2:])
+    assert hand[0] not in restored.cards and hand[1] not in restored.cards
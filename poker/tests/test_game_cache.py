@@ -0,0 +1,36 @@
+import dataset
+from poker.repo.poker_repo import *
+from poker.service.game_cache import GameCache
+
+
+def make_db(num_games):
+    db = dataset.connect('sqlite://')
+    for i in range(num_games):
+        insert_game(db, {'game_id': str(i), 'game_type': 'texas_holdem',
+                         'num_seats': 2, 'big_blind': 50, 'small_blind': 25,
+                         'min_buyin': 100, 'max_buyin': 1000,
+                         'table_name': 'T'})
+    return db
+
+
+def test_cache_serves_same_game_until_version_changes():
+    db = make_db(1)
+    cache = GameCache()
+    game = cache.get(db, '0')
+    assert cache.get(db, '0') is game
+    game.update_db(db)
+    assert cache.get(db, '0') is game
+    update_game(db, {'game_id': '0', 'version': game.version + 1})
+    assert cache.get(db, '0') is not game
+
+
+def test_cache_evicts_least_recently_used_and_idle_games():
+    db = make_db(3)
+    cache = GameCache(max_size=2, idle_seconds=60)
+    cache.get(db, '0')
+    cache.get(db, '1')
+    cache.get(db, '0')
+    cache.get(db, '2')
+    assert list(cache.games) == ['0', '2']
+    cache.evict_idle(cache.games['2'][1] + 60)
+    assert len(cache) == 0
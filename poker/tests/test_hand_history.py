@@ -0,0 +1,97 @@
+import dataset
+import datetime
+import gzip
+import json
+from poker import create_app
+from poker.repo.poker_repo import get_actions
+from poker.repo.schema import create_archive_schema, create_schema
+from poker.service.archive import archive_table
+from poker.service.export_hands import store_hands
+from poker.service.hand_history import FORMATS, gzip_chunks, hand_key, iter_hands
+from poker.service.simulator import DatabaseSink, play_table
+
+
+def played_db(num_hands=30, game_id='g', seed=9):
+    db = dataset.connect('sqlite://')
+    create_schema(db)
+    play_table(num_hands, ['random', 'aggressive', 'tight'], seed=seed,
+               sink=DatabaseSink(db), game_id=game_id)
+    return db
+
+
+def test_completed_hands_are_recorded():
+    db = played_db()
+    hands = list(iter_hands(db))
+    assert [h['hand_num'] for h in hands] == list(range(1, len(hands) + 1))
+    assert len(hands) == db['games'].find_one(game_id='g')['hands_played']
+    for h in hands:
+        assert sum(p['won'] for p in h['players']) == h['pot']
+        assert sum(p['amt_in_pot'] for p in h['players']) == h['pot']
+        assert all(len(p['hand']) == 4 for p in h['players'])
+        # Blinds that put everyone all in deal the hand out with no actions.
+        assert h['end_seq'] == (h['actions'][-1]['seq'] if h['actions'] else h['start_seq'])
+        assert all(h['start_seq'] < a['seq'] <= h['end_seq'] for a in h['actions'])
+    assert sum(len(h['actions']) for h in hands) <= len(get_actions(db, 'g'))
+
+
+def test_export_pages_through_hands_and_filters_by_user():
+    db = played_db()
+    everything = list(iter_hands(db))
+    paged = list(iter_hands(db, page_size=7))
+    assert [(h['game_id'], h['hand_num']) for h in paged] == \
+        [(h['game_id'], h['hand_num']) for h in everything]
+    user_id = everything[0]['players'][0]['user_id']
+    mine = list(iter_hands(db, user_id=user_id, page_size=3))
+    assert mine and all(user_id in [p['user_id'] for p in h['players']] for h in mine)
+    assert len(mine) == sum(user_id in [p['user_id'] for p in h['players']] for h in everything)
+    assert list(iter_hands(db, start=everything[-1]['ended_at'].replace(year=2100))) == []
+
+
+def test_export_formats_are_gzipped_streams():
+    db = played_db(10)
+    ndjson = gzip_chunks(FORMATS['ndjson'](iter_hands(db)))
+    lines = gzip.decompress(b''.join(ndjson)).decode().splitlines()
+    assert len(lines) == 10 and json.loads(lines[0])['hand_num'] == 1
+    text = gzip.decompress(b''.join(gzip_chunks(FORMATS['text'](iter_hands(db))))).decode()
+    assert text.count('*** HOLE CARDS ***') == 10 and 'Total pot' in text
+    chunks = list(gzip_chunks(('x' * 100 + '\n' for _ in range(10000)), chunk_size=1000))
+    assert len(chunks) > 1 and gzip.decompress(b''.join(chunks)) == (b'x' * 100 + b'\n') * 10000
+
+
+def test_command_line_export_merges_shards_and_archive():
+    db, shard, archived = played_db(6, 'g1', 1), played_db(6, 'g2', 2), played_db(6, 'g3', 3)
+    archive = dataset.connect('sqlite://')
+    create_archive_schema(archive)
+    later = datetime.datetime.now() + datetime.timedelta(days=2)
+    assert archive_table(archived, archive, 'g3', later, later)
+    assert len(list(store_hands(db, [shard]))) == 12
+    hands = list(store_hands(db, [shard], archive))
+    assert len(hands) == 18 and {h['game_id'] for h in hands} == {'g1', 'g2', 'g3'}
+    assert [hand_key(h) for h in hands] == sorted(hand_key(h) for h in hands)
+    assert all(h['actions'] or h['start_seq'] == h['end_seq'] for h in hands)
+
+
+def test_history_endpoint_only_exports_own_hands(tmp_path):
+    app = create_app({'ENV': 'UNITTEST', 'DBCONN': 'sqlite:///{}'.format(tmp_path / 'p.db')})
+    client = app.test_client()
+    headers = []
+    for name in ('hh1', 'hh2', 'hh3'):
+        client.post('api/user/register', json={'username': name, 'password': name,
+                                               'email': name + '@test.com'})
+        rv = client.post('api/user/login', json={'username': name, 'password': name})
+        headers.append({'x-access-token': rv.json['auth_token']})
+    game_id = client.post('api/poker/', headers=headers[0],
+                          json={'game_type': 'texas_holdem', 'num_seats': 2, 'big_blind': 50,
+                                'small_blind': 25, 'min_buyin': 100, 'max_buyin': 1000,
+                                'table_name': 't'}).json['game_id']
+    for seat_num, h in enumerate(headers[:2], 1):
+        client.post('api/poker/{}/player/'.format(game_id), headers=h,
+                    json={'seat_num': seat_num, 'buyin': 1000})
+    for h in headers[:2]:
+        client.get('api/poker/{}/player/check_fold'.format(game_id), headers=h)
+    rv = client.get('api/poker/history', headers=headers[0])
+    assert rv.status_code == 200 and rv.mimetype == 'application/gzip'
+    hand, = [json.loads(line) for line in gzip.decompress(rv.data).decode().splitlines()]
+    assert hand['game_id'] == game_id and hand['pot'] == 75
+    rv = client.get('api/poker/history?format=text', headers=headers[2])
+    assert gzip.decompress(rv.data) == b''
@@ -0,0 +1,95 @@
+import dataset
+from sqlalchemy import event
+from poker import create_app
+from poker.model.poker_model import *
+from poker.repo.poker_repo import get_games, insert_game
+from poker.repo.schema import create_schema
+from poker.service.lobby_cache import LobbyCache
+from poker.service.simulator import DatabaseSink, play_table
+
+
+def login(client, name):
+    client.post('api/user/register', json={'username': name, 'password': name,
+                                           'email': name + '@test.com'})
+    rv = client.post('api/user/login', json={'username': name, 'password': name})
+    return {'x-access-token': rv.json['auth_token']}
+
+
+def test_game_keeps_lobby_summary_up_to_date():
+    db = dataset.connect('sqlite://')
+    create_schema(db)
+    play_table(20, ['random', 'aggressive', 'calling_station'], seed=2,
+               sink=DatabaseSink(db), game_id='g')
+    row = db['games'].find_one(game_id='g')
+    assert row['seated'] == 3
+    assert row['hands_played'] >= 20 and row['pot_total'] >= 20 * 75
+    game = Game(row, list(db['players'].find(game_id='g')))
+    while game.state_cd != State.STARTING:
+        game.apply('check_fold', game.players.get_live_players()[0].user_id)
+    game.leave(game.players.players[0].user_id)
+    assert game.seated == 2
+
+
+def test_lobby_query_only_reads_games():
+    db = dataset.connect('sqlite://')
+    create_schema(db)
+    for i, big_blind in enumerate((10, 50, 100, 200)):
+        insert_game(db, {'game_id': 'g{}'.format(i), 'game_type': 'texas_holdem',
+                         'num_seats': 6, 'big_blind': big_blind, 'small_blind': big_blind // 2,
+                         'min_buyin': 100, 'max_buyin': 1000, 'table_name': 't'})
+    db['games'].update({'game_id': 'g2', 'seated': 5}, ['game_id'])
+    statements = []
+    event.listen(db.executable, 'before_cursor_execute',
+                 lambda *args: statements.append(args[2]))
+    page = get_games(db, 2, min_big_blind=50)
+    assert [g['game_id'] for g in page] == ['g1', 'g2']
+    assert [g['game_id'] for g in get_games(db, 2, after='g2', min_big_blind=50)] == ['g3']
+    assert [g['game_id'] for g in get_games(db, min_free_seats=2)] == ['g0', 'g1', 'g3']
+    assert statements and not any('players' in s for s in statements)
+
+
+def test_lobby_cache_expires_pages():
+    cache = LobbyCache(ttl=1.0, max_size=2)
+    cache.put('a', 1, now=0)
+    assert cache.get('a', now=0.5) == 1
+    assert cache.get('a', now=1.0) is None
+    cache.put('b', 2, now=0)
+    cache.put('c', 3, now=0)
+    assert len(cache) == 2
+
+
+def test_lobby_api_paginates_and_filters(tmp_path):
+    app = create_app({'ENV': 'UNITTEST', 'DBCONN': 'sqlite:///{}'.format(tmp_path / 'p.db'),
+                      'LOBBY_CACHE_SECONDS': 0})
+    client = app.test_client()
+    headers = login(client, 'lobby1')
+    game_ids = []
+    for big_blind in (10, 20, 50, 100, 200):
+        rv = client.post('api/poker/', headers=headers,
+                         json={'game_type': 'texas_holdem', 'num_seats': 2,
+                               'big_blind': big_blind, 'small_blind': big_blind // 2,
+                               'min_buyin': 100, 'max_buyin': 10000, 'table_name': 't'})
+        game_ids.append(rv.json['game_id'])
+    seen = []
+    cursor = None
+    while True:
+        url = 'api/poker/?limit=2' + ('&cursor=' + cursor if cursor else '')
+        rv = client.get(url)
+        assert rv.status_code == 200 and len(rv.json['games']) <= 2
+        seen += [g['game_id'] for g in rv.json['games']]
+        cursor = rv.json['next_cursor']
+        if cursor is None:
+            break
+    assert seen == sorted(game_ids)
+    rv = client.get('api/poker/?min_big_blind=50&max_big_blind=100')
+    assert sorted(g['big_blind'] for g in rv.json['games']) == [50, 100]
+    client.post('api/poker/{}/player/'.format(game_ids[0]), headers=headers,
+                json={'seat_num': 1, 'buyin': 1000})
+    client.post('api/poker/{}/player/'.format(game_ids[0]), headers=login(client, 'lobby2'),
+                json={'seat_num': 2, 'buyin': 1000})
+    rv = client.get('api/poker/?min_free_seats=1')
+    assert game_ids[0] not in [g['game_id'] for g in rv.json['games']]
+    rv = client.get('api/poker/?max_big_blind=10')
+    entry, = rv.json['games']
+    assert entry['seated'] == 2 and entry['free_seats'] == 0
+    assert entry['state_cd'] == 'PREFLOP'
@@ -0,0 +1,68 @@
+import json
+import logging
+import queue
+from poker import create_app, log
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.addFilter(log.ContextFilter())
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def test_json_formatter_includes_context_and_extra():
+    token = log.game_id.set('g1')
+    try:
+        record = logging.makeLogRecord({'name': 'poker.test', 'levelname': 'INFO',
+                                        'msg': 'hello %s', 'args': ('world',),
+                                        'state': 'FLOP'})
+        log.ContextFilter().filter(record)
+    finally:
+        log.game_id.reset(token)
+    entry = json.loads(log.JsonFormatter().format(record))
+    assert entry['message'] == 'hello world'
+    assert entry['game_id'] == 'g1'
+    assert entry['state'] == 'FLOP'
+    assert 'user_id' not in entry
+
+
+def test_engine_logs_carry_request_correlation_ids(tmp_path):
+    app = create_app({'ENV': 'UNITTEST',
+                      'DBCONN': 'sqlite:///{}'.format(tmp_path / 'log.db'),
+                      'LOG_LEVELS': {'poker.model.poker_model': 'DEBUG'}})
+    handler = ListHandler()
+    logging.getLogger('poker').addHandler(handler)
+    try:
+        client = app.test_client()
+        headers = []
+        for name in ('a', 'b'):
+            client.post('api/user/register', json=dict(username=name, password=name, email=name))
+            rv = client.post('api/user/login', json=dict(username=name, password=name))
+            headers.append({'x-access-token': rv.json['auth_token']})
+        game_id = client.post('api/poker/', headers=headers[0], json={
+            'game_type': 'texas_holdem', 'num_seats': 2, 'big_blind': 50,
+            'small_blind': 25, 'min_buyin': 100, 'max_buyin': 1000,
+            'table_name': 'T'}).json['game_id']
+        for seat_num, h in enumerate(headers, 1):
+            client.post('api/poker/{}/player/'.format(game_id), headers=h,
+                        json={'seat_num': seat_num, 'buyin': 500})
+    finally:
+        logging.getLogger('poker').removeHandler(handler)
+        logging.getLogger('poker.model.poker_model').setLevel(logging.NOTSET)
+    rounds = [r for r in handler.records if r.msg == 'starting round']
+    assert len(rounds) == 1
+    assert rounds[0].game_id == game_id
+    assert rounds[0].user_id is not None
+    assert rounds[0].request_id is not None
+
+
+def test_full_queue_drops_and_counts_records(capsys):
+    handler = log.DroppingQueueHandler(queue.Queue(1))
+    for i in range(3):
+        handler.handle(logging.makeLogRecord({'msg': 'record %s', 'args': (i,)}))
+    assert handler.queue.qsize() == 1 and handler.dropped == 2
+    assert capsys.readouterr().err == ''
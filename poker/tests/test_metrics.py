@@ -0,0 +1,49 @@
+import re
+from poker import create_app
+
+
+def make_client(tmp_path, **config):
+    dbconn = 'sqlite:///{}'.format(tmp_path / 'metrics.db')
+    return create_app(dict({'ENV': 'UNITTEST', 'DBCONN': dbconn}, **config)).test_client()
+
+
+def sample(text, name, **labels):
+    label_re = ','.join('{}="{}"'.format(k, re.escape(v)) for k, v in labels.items())
+    match = re.search(r'^{}\{{{}[^}}]*\}} (\S+)$'.format(name, label_re), text, re.M)
+    return float(match.group(1)) if match else None
+
+
+def test_metrics_count_requests_and_queries(tmp_path):
+    client = make_client(tmp_path, METRICS_ENABLED=True)
+    client.post('api/user/register', json=dict(
+        username='m', password='password', email='m@test.com'))
+    rv = client.post('api/user/login', json=dict(username='m', password='password'))
+    client.get('api/user/testauth', headers={'x-access-token': rv.json['auth_token']})
+    client.get('api/user/testauth', headers={'x-access-token': 'bad'})
+    rv = client.get('api/metrics/')
+    assert rv.mimetype == 'text/plain'
+    text = rv.data.decode()
+    assert sample(text, 'poker_requests_total', endpoint='/api/user/testauth',
+                  method='GET', status='200') == 1
+    assert sample(text, 'poker_requests_total', endpoint='/api/user/testauth',
+                  method='GET', status='401') == 1
+    assert sample(text, 'poker_request_duration_seconds_count',
+                  endpoint='/api/user/login', method='POST') == 1
+    assert sample(text, 'poker_request_duration_seconds_bucket',
+                  endpoint='/api/user/login', method='POST', le='+Inf') == 1
+    assert sample(text, 'poker_request_db_queries_sum',
+                  endpoint='/api/user/register', method='POST') > 0
+
+
+def test_slow_requests_are_profiled(tmp_path):
+    client = make_client(tmp_path, METRICS_ENABLED=True,
+                         METRICS_PROFILE_DIR=str(tmp_path / 'profiles'),
+                         METRICS_PROFILE_SAMPLE_RATE=1,
+                         METRICS_SLOW_REQUEST_SECONDS=0)
+    client.post('api/user/register', json=dict(
+        username='m', password='password', email='m@test.com'))
+    assert len(list((tmp_path / 'profiles').glob('*.prof'))) == 1
+
+
+def test_metrics_are_opt_in(tmp_path):
+    assert make_client(tmp_path).get('api/metrics/')._status_code == 404
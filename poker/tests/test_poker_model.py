@@ -0,0 +1,108 @@
+import dataset
+import random
+from sqlalchemy import event
+from poker.model.poker_model import *
+from poker.repo.poker_repo import *
+from poker.service.action_log import replay_game
+
+
+def make_game(db, num_players):
+    insert_game(db, {'game_id': 'g', 'game_type': 'texas_holdem',
+                     'num_seats': 9, 'big_blind': 50, 'small_blind': 25,
+                     'min_buyin': 100, 'max_buyin': 1000, 'table_name': 'T'})
+    for i in range(num_players):
+        add_player(db, {'game_id': 'g', 'user_id': str(i), 'seat_num': i+1,
+                        'buyin': 1000, 'stack': 1000, 'bet_amt': 0,
+                        'sitting_out': False, 'is_active': False,
+                        'has_acted': False, 'has_folded': False,
+                        'amt_in_pot': 0, 'hand': ''})
+    return Game(get_game(db, 'g'), get_players(db, 'g'))
+
+
+def count_statements(db):
+    statements = []
+    event.listen(db.executable, 'before_cursor_execute',
+                 lambda *args: statements.append(args[2]))
+    return statements
+
+
+def test_update_db_writes_only_changed_rows():
+    db = dataset.connect('sqlite://')
+    game = make_game(db, 9)
+    game.update_db(db)
+    statements = count_statements(db)
+    game.update_db(db)
+    assert statements == []
+    game.players.get_player('3').bet(100)
+    game.update_db(db)
+    updates = [s for s in statements if s.startswith('UPDATE')]
+    assert len(updates) == 2
+    assert 'stack' in updates[0] and 'hand' not in updates[0]
+    players = {p['user_id']: p for p in get_players(db, 'g')}
+    assert players['3']['stack'] == 900 and players['3']['bet_amt'] == 100
+    assert players['4']['stack'] == 1000
+
+
+def test_update_db_batches_players_with_same_changes():
+    db = dataset.connect('sqlite://')
+    game = make_game(db, 9)
+    game.update_state(db)
+    statements = count_statements(db)
+    for p in game.players.players:
+        p.has_acted = True
+    game.update_db(db)
+    assert len([s for s in statements if s.startswith('UPDATE players')]) == 1
+    assert all(p['has_acted'] for p in get_players(db, 'g'))
+
+
+def strip_ids(snapshot):
+    return {'game': {k: v for k, v in snapshot['game'].items()
+                     if k not in ('id', 'version')},
+            'players': [{k: v for k, v in p.items() if k != 'id'}
+                        for p in snapshot['players']]}
+
+
+def test_replay_reconstructs_game_from_action_log(monkeypatch):
+    monkeypatch.setattr('poker.model.poker_model.SNAPSHOT_INTERVAL', 7)
+    db = dataset.connect('sqlite://')
+    game = make_game(db, 0)
+    for i in range(3):
+        game.join(new_player('g', str(i), i+1, 1000))
+        game.update_db(db)
+    rng = random.Random(5)
+    history = {}
+    for _ in range(40):
+        user_id = rng.choice(['0', '1', '2'])
+        if game.players.get_player(user_id).has_folded:
+            continue
+        action_cd = rng.choice(['check_call', 'check_call', 'check_fold', 'bet'])
+        game.act(db, action_cd, user_id, bet_amt=10)
+        history[game.action_seq] = strip_ids(game.get_snapshot())
+    assert game.action_seq > 20
+    assert len(get_actions(db, 'g')) == game.action_seq
+    assert get_latest_snapshot(db, 'g')['seq'] % 7 == 0
+    replayed = replay_game(db, 'g')
+    assert strip_ids(replayed.get_snapshot()) == history[game.action_seq]
+    assert strip_ids(replay_game(db, 'g', 12).get_snapshot()) == history[12]
+
+
+def test_rows_round_trip_without_aliasing():
+    player_row = new_player('g', 'u', 1, 500)
+    player_row['hand'] = 'AhKd'
+    game_row = {'game_id': 'g', 'game_type': 'texas_holdem', 'num_seats': 2,
+                'big_blind': 50, 'small_blind': 25, 'min_buyin': 100,
+                'max_buyin': 1000, 'table_name': 'T', 'state_cd': 'FLOP',
+                'pot_amt': 100, 'board': '2c3d4h', 'deck': '5s6s',
+                'deck_seed': 7, 'action_seq': 3, 'version': 2,
+                'tournament_id': None, 'seated': 1, 'hands_played': 4,
+                'pot_total': 400, 'hand_start_seq': 1}
+    game = Game.from_row(game_row, [player_row])
+    assert game.to_row() == game_row
+    player = game.players.players[0]
+    assert player.to_row() == dict(player_row, position=None)
+    assert not hasattr(game, '__dict__') and not hasattr(player, '__dict__')
+    row = game.to_row()
+    del row['game_id']
+    game_row['pot_amt'] = 0
+    assert game.game_id == 'g' and game.pot_amt == 100
+    assert game.to_row()['game_id'] == 'g'
@@ -0,0 +1,47 @@
+import os
+import dataset
+import pytest
+from alembic import command
+from alembic.config import Config
+from poker.repo.schema import create_schema
+
+ALEMBIC_INI = os.path.join(os.path.dirname(__file__), '..', '..', 'alembic.ini')
+
+
+def query_plan(db, sql):
+    return ' '.join(row['detail'] for row in db.query('EXPLAIN QUERY PLAN ' + sql))
+
+
+def test_hot_lookups_use_indexes():
+    db = dataset.connect('sqlite://')
+    create_schema(db)
+    assert 'INDEX' in query_plan(db, "SELECT * FROM players WHERE game_id = 'g'")
+    assert 'INDEX' in query_plan(db, "SELECT * FROM games WHERE game_id = 'g'")
+    assert 'INDEX' in query_plan(db, "SELECT * FROM tokens WHERE auth_token = 't'")
+    assert 'INDEX' in query_plan(db, "SELECT * FROM users WHERE username = 'u'")
+    assert 'INDEX' in query_plan(db, "SELECT * FROM users WHERE email = 'e'")
+
+
+def test_migration_upgrades_tables_created_by_dataset(tmp_path, monkeypatch):
+    dbconn = 'sqlite:///{}'.format(tmp_path / 'legacy.db')
+    legacy = dataset.connect(dbconn)
+    legacy['users'].insert({'username': 'old', 'password': 'pw'})
+    legacy['tokens'].insert({'user_id': 'u', 'auth_token': 't'})
+    monkeypatch.setenv('DBCONN', dbconn)
+    command.upgrade(Config(ALEMBIC_INI), 'head')
+    db = dataset.connect(dbconn)
+    assert {'games', 'players', 'actions', 'snapshots'} <= set(db.tables)
+    assert db['users'].has_column('user_id')
+    assert db['users'].find_one(username='old')['password'] == 'pw'
+    assert db['users'].find_one(username='old')['user_id']
+    assert 'INDEX' in query_plan(db, "SELECT * FROM users WHERE username = 'u'")
+
+
+def test_migration_stops_on_duplicate_usernames(tmp_path, monkeypatch):
+    dbconn = 'sqlite:///{}'.format(tmp_path / 'legacy.db')
+    legacy = dataset.connect(dbconn)
+    legacy['users'].insert_many([{'username': 'old', 'email': 'a@test.com'},
+                                 {'username': 'old', 'email': 'b@test.com'}])
+    monkeypatch.setenv('DBCONN', dbconn)
+    with pytest.raises(RuntimeError, match=r"users has duplicate \(username\) values"):
+        command.upgrade(Config(ALEMBIC_INI), 'head')
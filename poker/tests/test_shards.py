@@ -0,0 +1,100 @@
+import dataset
+import gzip
+import json
+from poker import create_app
+from poker.model.poker_model import Game
+from poker.repo.poker_repo import get_game, get_players
+from poker.repo.schema import create_schema
+from poker.service.shards import export_table, import_table, shard_for
+from poker.service.simulator import DatabaseSink, next_to_act, play_table
+
+
+def test_export_and_import_move_a_table_between_stores():
+    source = dataset.connect('sqlite://')
+    target = dataset.connect('sqlite://')
+    for db in (source, target):
+        create_schema(db)
+    play_table(5, ['random', 'aggressive', 'tight'], seed=4, sink=DatabaseSink(source),
+               game_id='g')
+    before = Game(get_game(source, 'g'), get_players(source, 'g')).get_state()
+    counts = {name: source[name].count(game_id='g') for name in ('actions', 'hands')}
+    import_table(target, export_table(source, 'g'))
+    assert get_game(source, 'g') is None and source['actions'].count(game_id='g') == 0
+    assert Game(get_game(target, 'g'), get_players(target, 'g')).get_state() == before
+    assert {name: target[name].count(game_id='g') for name in counts} == counts
+
+
+def test_sharded_tables_are_served_by_their_shard(tmp_path):
+    app = create_app({'ENV': 'UNITTEST', 'DBCONN': 'sqlite:///{}'.format(tmp_path / 'main.db'),
+                      'SHARDS': 2, 'SHARD_DBCONN': 'sqlite:///{}'.format(tmp_path / 'shard{}.db'),
+                      'PASSWORD_SCRYPT_N': 2 ** 8, 'SSE_KEEPALIVE_SECONDS': 0.1,
+                      'LOBBY_CACHE_SECONDS': 0})
+    client = app.test_client()
+    main = dataset.connect(app.config['DBCONN'])
+    shards = [dataset.connect(app.config['SHARD_DBCONN'].format(i)) for i in range(2)]
+    headers = []
+    for name in ('s1', 's2'):
+        client.post('api/user/register', json={'username': name, 'password': name,
+                                               'email': name + '@test.com'})
+        rv = client.post('api/user/login', json={'username': name, 'password': name})
+        headers.append({'x-access-token': rv.json['auth_token']})
+    main['users'].update({'username': 's1', 'role': 'ADMIN'}, ['username'])
+    try:
+        game_ids = []
+        for _ in range(4):
+            rv = client.post('api/poker/', headers=headers[0],
+                             json={'game_type': 'texas_holdem', 'num_seats': 2, 'big_blind': 50,
+                                   'small_blind': 25, 'min_buyin': 100, 'max_buyin': 1000,
+                                   'table_name': 't'})
+            game_ids.append(rv.json['game_id'])
+        for game_id in game_ids:
+            assert get_game(shards[shard_for(game_id, 2)], game_id) is not None
+            assert get_game(main, game_id) is None
+        assert [g['game_id'] for g in client.get('api/poker/?limit=3').json['games']] == \
+            sorted(game_ids)[:3]
+
+        game_id = game_ids[0]
+        shard = shard_for(game_id, 2)
+        users = {}
+        for seat_num, h in enumerate(headers, 1):
+            rv = client.post('api/poker/{}/player/'.format(game_id), headers=h,
+                             json={'seat_num': seat_num, 'buyin': 1000})
+            users[rv.json['user_id']] = h
+        stream = client.get('api/poker/{}/stream'.format(game_id), headers=headers[0])
+        chunks = iter(stream.response)
+        assert next(chunks).startswith(b'event: state')
+
+        def act(store, action):
+            game = Game(get_game(store, game_id), get_players(store, game_id))
+            rv = client.get('api/poker/{}/player/{}'.format(game_id, action),
+                            headers=users[next_to_act(game).user_id])
+            assert rv.status_code == 200
+
+        def next_message():
+            return next(chunk for chunk in chunks if chunk.startswith(b'data: '))
+
+        act(shards[shard], 'check_call')
+        assert next_message()
+        rv = client.put('api/poker/{}/shard'.format(game_id), headers=headers[1],
+                        json={'shard': 1 - shard})
+        assert rv.status_code == 403
+        rv = client.put('api/poker/{}/shard'.format(game_id), headers=headers[0],
+                        json={'shard': 1 - shard})
+        assert rv.status_code == 200
+        assert get_game(shards[shard], game_id) is None
+        act(shards[1 - shard], 'check_call')
+        assert next_message()
+        rv = client.put('api/poker/{}/shard'.format(game_id), headers=headers[0],
+                        json={'shard': None})
+        assert rv.status_code == 200 and main['table_shards'].count() == 3
+        act(main, 'check_call')
+        assert next_message()
+        stream.close()
+        while not get_game(main, game_id)['hands_played']:
+            act(main, 'check_call')
+
+        rv = client.get('api/poker/history', headers=headers[0])
+        hand, = [json.loads(line) for line in gzip.decompress(rv.data).decode().splitlines()]
+        assert hand['game_id'] == game_id and len(hand['actions']) >= 3
+    finally:
+        app.extensions['shard_router'].shutdown()
@@ -0,0 +1,53 @@
+import dataset
+import multiprocessing
+import random
+from poker.model.cards import Deck, cards_from_str, shuffled_deck
+from poker.repo.schema import create_schema
+from poker.service.hand_history import iter_hands
+from poker.service.shuffle import DeckPool, decks
+from poker.service.simulator import DatabaseSink, play_table
+
+
+def test_shuffled_deck_is_the_seeded_shuffle():
+    for seed in (0, 1, 2 ** 62 + 12345, 7 ** 20):
+        deck = Deck()
+        deck.shuffle(random.Random(seed))
+        assert shuffled_deck(seed) == deck.cards
+
+
+def test_pool_deals_decks_from_their_seeds():
+    pool = DeckPool(batch_size=8)
+    dealt = [pool.take() for _ in range(20)]
+    assert len({seed for seed, _ in dealt}) == 20
+    for seed, cards in dealt:
+        assert 0 <= seed < 2 ** 63 and cards == shuffled_deck(seed)
+    pool.fill()
+    assert len(pool) >= 8
+
+
+def pool_state(conn):
+    conn.send((len(decks), decks.thread is None))
+
+
+def test_forked_child_starts_with_an_empty_pool():
+    decks.take()
+    decks.fill()
+    context = multiprocessing.get_context('fork')
+    parent, child = context.Pipe()
+    process = context.Process(target=pool_state, args=(child,))
+    process.start()
+    assert parent.recv() == (0, True)
+    process.join()
+    assert len(decks) and decks.thread is not None
+
+
+def test_recorded_hands_are_dealt_from_their_seed():
+    db = dataset.connect('sqlite://')
+    create_schema(db)
+    play_table(10, ['random', 'aggressive', 'tight'], seed=2, sink=DatabaseSink(db))
+    for hand in iter_hands(db):
+        deck = bytes(shuffled_deck(hand['deck_seed']))
+        dealt = 2 * len(hand['players'])
+        assert sorted(cards_from_str(p['hand']) for p in hand['players']) == \
+            sorted(deck[i:i + 2] for i in range(0, dealt, 2))
+        assert cards_from_str(hand['board']) == deck[dealt:dealt + len(hand['board']) // 2]
@@ -0,0 +1,46 @@
+import pytest
+import dataset
+from poker import create_app
+
+
+@pytest.fixture
+def signed_client(tmp_path):
+    dbconn = 'sqlite:///{}'.format(tmp_path / 'signed.db')
+    app = create_app({'ENV': 'UNITTEST', 'DBCONN': dbconn,
+                      'AUTH_MODE': 'signed', 'SECRET_KEY': 'test-secret'})
+    yield app.test_client(), dataset.connect(dbconn)
+
+
+def login(client):
+    client.post('api/user/register', json=dict(
+        username='signed', password='password', email='signed@test.com'))
+    rv = client.post('api/user/login', json=dict(
+        username='signed', password='password'))
+    return rv.json['auth_token']
+
+
+def test_signed_token_is_verified_without_token_table(signed_client):
+    client, db = signed_client
+    token = login(client)
+    rv = client.get('api/user/testauth', headers={'x-access-token': token})
+    assert rv._status_code == 200
+    assert len(db['tokens']) == 0
+
+
+def test_tampered_signed_token_is_rejected(signed_client):
+    client, db = signed_client
+    token = login(client)
+    rv = client.get('api/user/testauth',
+                    headers={'x-access-token': token[:-2] + 'xx'})
+    assert rv._status_code == 401
+    assert rv.json['message'] == 'Invalid token.'
+
+
+def test_logout_revokes_signed_token(signed_client):
+    client, db = signed_client
+    token = login(client)
+    rv = client.post('api/user/logout', headers={'x-access-token': token})
+    assert rv._status_code == 200
+    rv = client.get('api/user/testauth', headers={'x-access-token': token})
+    assert rv._status_code == 401
+    assert rv.json['message'] == 'Token has been revoked.'
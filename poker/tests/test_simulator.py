@@ -0,0 +1,55 @@
+import dataset
+import random
+from poker.model.poker_model import *
+from poker.repo.poker_repo import get_game, get_players
+from poker.repo.schema import create_schema
+from poker.service.action_log import replay_game
+from poker.service.simulator import (DatabaseSink, MemorySink, new_sim_game,
+                                     play_table, simulate)
+
+
+def test_bots_play_complete_hands_without_a_database():
+    stats = play_table(300, ['random', 'aggressive', 'tight', 'calling_station'], seed=1)
+    assert stats['hands'] == 300
+    assert stats['actions'] > 300
+
+
+def test_simulation_is_deterministic_for_a_seed():
+    sink1, sink2 = MemorySink(), MemorySink()
+    play_table(50, ['random', 'random', 'random'], seed=7, sink=sink1)
+    play_table(50, ['random', 'random', 'random'], seed=7, sink=sink2)
+    assert sink1.actions == sink2.actions
+
+
+def test_simulate_across_processes():
+    stats = simulate(2, 20, ['random', 'aggressive'], seed=3, workers=2)
+    assert stats['hands'] == 40
+
+
+def test_database_sink_can_be_replayed():
+    db = dataset.connect('sqlite://')
+    create_schema(db)
+    play_table(100, ['random', 'aggressive', 'tight'], seed=5,
+               sink=DatabaseSink(db), game_id='g')
+    game = Game(get_game(db, 'g'), get_players(db, 'g'))
+    replayed = replay_game(db, 'g')
+    assert replayed.get_snapshot()['players'] == game.get_snapshot()['players']
+
+
+def test_player_joining_mid_hand_waits_for_next_hand():
+    game = new_sim_game('g', 50, 3, random.Random(1))
+    game.join(new_player('g', 'a', 1, 1000))
+    game.join(new_player('g', 'b', 2, 1000))
+    game.join(new_player('g', 'c', 3, 1000))
+    assert game.state_cd == State.PREFLOP
+    assert [p.user_id for p in game.players.get_live_players()] == ['a', 'b']
+
+
+def test_call_all_in_for_less_deals_the_hand_out():
+    game = new_sim_game('g', 50, 2, random.Random(1))
+    game.join(new_player('g', 'a', 1, 1000))
+    game.join(new_player('g', 'b', 2, 300))
+    game.apply('bet', 'a', bet_amt=975)
+    game.apply('check_call', 'b')
+    assert game.hands_played == 1
+    assert sum(p.stack + p.bet_amt for p in game.players.players) == 1300
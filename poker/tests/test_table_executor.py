@@ -0,0 +1,78 @@
+import threading
+import time
+import dataset
+import pytest
+from werkzeug.exceptions import HTTPException
+from poker import create_app
+from poker.api.poker_api import run_on_table
+from poker.model.poker_model import Game
+from poker.repo.poker_repo import *
+from poker.service.table_executor import TableExecutor, get_table_executor
+
+
+def test_actions_on_one_table_run_in_order():
+    executor = TableExecutor(num_workers=4)
+    seen = []
+    lock = threading.Lock()
+
+    def record(game_id, i):
+        time.sleep(0.001 * (i % 3))
+        with lock:
+            seen.append((game_id, i))
+
+    futures = [executor.submit(game_id, record, game_id, i)
+               for i in range(20) for game_id in ('a', 'b', 'c')]
+    for f in futures:
+        f.result(5)
+    for game_id in ('a', 'b', 'c'):
+        assert [i for g, i in seen if g == game_id] == list(range(20))
+    executor.shutdown()
+
+
+def test_errors_are_returned_to_the_caller():
+    executor = TableExecutor(num_workers=1)
+    with pytest.raises(ZeroDivisionError):
+        executor.submit('a', lambda: 1 / 0).result(5)
+    assert executor.submit('a', lambda: 'ok').result(5) == 'ok'
+    executor.shutdown()
+
+
+def test_stale_write_is_rejected():
+    db = dataset.connect('sqlite://')
+    insert_game(db, {'game_id': 'g', 'game_type': 'texas_holdem',
+                     'num_seats': 2, 'big_blind': 50, 'small_blind': 25,
+                     'min_buyin': 100, 'max_buyin': 1000, 'table_name': 'T'})
+    marks = db.create_table('marks')
+    first = Game(get_game(db, 'g'), [])
+    second = Game(get_game(db, 'g'), [])
+    first.pot_amt = 10
+    saved = []
+    first.defer_write(lambda db: db['marks'].insert({'game': 'first'}))
+    first.after_save(lambda: saved.append('first'))
+    first.update_db(db)
+    second.pot_amt = 20
+    second.defer_write(lambda db: db['marks'].insert({'game': 'second'}))
+    second.after_save(lambda: saved.append('second'))
+    with pytest.raises(StaleGameError):
+        second.update_db(db)
+    assert second.version == 0
+    assert get_game(db, 'g')['pot_amt'] == 10
+    assert [r['game'] for r in marks.all()] == ['first'] and saved == ['first']
+
+
+def test_timed_out_call_is_cancelled_and_reported_busy(tmp_path):
+    app = create_app({'ENV': 'UNITTEST', 'DBCONN': 'sqlite:///{}'.format(tmp_path / 'main.db'),
+                      'ACTION_TIMEOUT_SECONDS': 0.05, 'TABLE_WORKERS': 1})
+    with app.app_context():
+        executor = get_table_executor()
+    release = threading.Event()
+    executor.submit('g', release.wait)
+    ran = []
+    try:
+        with app.test_request_context(), pytest.raises(HTTPException) as e:
+            run_on_table('g', ran.append)
+        assert e.value.code == 503 and 'please retry' in e.value.data['message']
+    finally:
+        release.set()
+        executor.shutdown()
+    assert not ran
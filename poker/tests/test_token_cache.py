@@ -0,0 +1,33 @@
+import datetime
+from poker.service.token_cache import TokenCache
+
+NOW = datetime.datetime(2021, 7, 1, 12)
+
+
+def minutes(n):
+    return datetime.timedelta(minutes=n)
+
+
+def test_cached_token_expires_from_cache_after_ttl():
+    cache = TokenCache(ttl=60)
+    cache.put({'auth_token': 't', 'user_id': 'u',
+               'token_expiry_dttm': NOW + minutes(60)}, NOW)
+    assert cache.get('t', NOW + minutes(0.5))['user_id'] == 'u'
+    assert cache.get('t', NOW + minutes(1)) is None
+
+
+def test_sliding_expiry_is_persisted_lazily():
+    cache = TokenCache(lifetime=3600, refresh_fraction=0.25)
+    entry = cache.put({'auth_token': 't', 'user_id': 'u',
+                       'token_expiry_dttm': NOW + minutes(60)}, NOW)
+    assert not cache.refresh(entry, NOW + minutes(10))
+    assert entry['token_expiry_dttm'] == NOW + minutes(70)
+    assert cache.refresh(entry, NOW + minutes(15))
+    assert not cache.refresh(entry, NOW + minutes(20))
+
+
+def test_sweep_runs_once_per_interval():
+    cache = TokenCache(sweep_seconds=300)
+    assert cache.sweep_due(NOW)
+    assert not cache.sweep_due(NOW + minutes(4))
+    assert cache.sweep_due(NOW + minutes(5))
@@ -0,0 +1,211 @@
+import dataset
+import random
+from collections import Counter
+from poker import create_app
+from poker.model.poker_model import *
+from poker.model.tournament_model import Tournament, new_tournament, seat_table
+from poker.repo.poker_repo import get_game, get_players
+from poker.repo.schema import create_schema
+from poker.repo.tournament_repo import get_entrants, get_tournament, save_tournament
+from poker.service.action_log import replay_game
+from poker.service.simulator import DatabaseSink, next_to_act, play_tournament
+from poker.service.tournament_service import TournamentScheduler
+
+
+def start_tables(num_entrants, table_size, sink=None):
+    tournament = Tournament(new_tournament('t', table_size, 1000))
+    for i in range(num_entrants):
+        tournament.register(str(i))
+    games = {}
+    moved = []
+
+    def hand_finished(game):
+        # Moved players are seated once the action that moved them is done,
+        # as the service does on their new table's worker.
+        moved.extend(tournament.hand_finished(game))
+
+    def seat_moved():
+        while moved:
+            move = moved.pop(0)
+            tournament.seat_moved_player(games[move.to_game_id], move)
+
+    for game_row, players in tournament.start(0, random.Random(1)):
+        game = Game(game_row, [], rng=random.Random(2))
+        if sink:
+            sink.save(game)
+        game.on_hand_end = hand_finished
+        seat_table(game, players)
+        games[game.game_id] = game
+    seat_moved()
+    return tournament, games, seat_moved
+
+
+def bust(game, count, seat_moved):
+    # Ends the hand with the first count players out of chips.
+    for p in game.players.players[:count]:
+        p.stack = 0
+    game.end_hand()
+    seat_moved()
+
+
+def test_bots_play_a_tournament_to_one_winner():
+    stats = play_tournament(40, ['random', 'aggressive', 'tight', 'calling_station'],
+                            seed=3, table_size=6)
+    places = Counter(stats['places'].values())
+    assert places[1] == 1 and None not in places
+    assert stats['tables'] == 7 and stats['moves'] > 0 and stats['level'] > 0
+
+
+def test_start_deals_entrants_evenly_across_tables():
+    tournament, games, seat_moved = start_tables(20, 9)
+    assert sorted(len(g.players.players) for g in games.values()) == [6, 7, 7]
+    assert all(g.state_cd == State.PREFLOP for g in games.values())
+    for g in games.values():
+        assert tournament.seats[g.game_id] == {p.seat_num: p.user_id for p in g.players.players}
+
+
+def test_tables_are_balanced_and_broken_as_players_bust():
+    tournament, games, seat_moved = start_tables(10, 5)
+    a, b = games.values()
+    bust(a, 3, seat_moved)
+    assert tournament.remaining == 7
+    assert len(a.players.players) == 2 and len(b.players.players) == 5
+    bust(b, 0, seat_moved)
+    assert len(a.players.players) == 3 and len(b.players.players) == 4
+    bust(b, 3, seat_moved)
+    # Four players fit at one table, so the shorter one is broken up.
+    assert tournament.remaining == 4
+    assert len(a.players.players) == 4 and not b.players.players
+    assert list(tournament.seats) == [a.game_id]
+    assert tournament.seats[a.game_id] == {p.seat_num: p.user_id for p in a.players.players}
+
+
+def test_blind_levels_apply_from_the_next_hand():
+    tournament, games, seat_moved = start_tables(4, 9)
+    game, = games.values()
+    tournament.advance_level(600)
+    assert game.big_blind == 50
+    bust(game, 0, seat_moved)
+    assert (game.small_blind, game.big_blind) == (50, 100)
+    assert tournament.next_level_at() == 1200
+
+
+def test_tournament_tables_replay_from_the_action_log():
+    db = dataset.connect('sqlite://')
+    create_schema(db)
+    sink = DatabaseSink(db)
+    tournament, games, seat_moved = start_tables(8, 4, sink)
+    rng = random.Random(4)
+    for _ in range(400):
+        if tournament.state_cd != 'RUNNING':
+            break
+        tournament.advance_level(0)
+        for game in games.values():
+            if game.state_cd != State.STARTING:
+                player = next_to_act(game)
+                game.apply(rng.choice(['check_call', 'check_call', 'check_fold']), player.user_id)
+            seat_moved()
+            sink.save(game)
+    for game_id, game in games.items():
+        replayed = replay_game(db, game_id)
+        assert replayed.get_snapshot()['players'] == game.get_snapshot()['players']
+        assert replayed.big_blind == game.big_blind
+        assert Game(get_game(db, game_id), get_players(db, game_id)).get_snapshot() == game.get_snapshot()
+
+
+def test_hand_ended_again_after_a_failed_save_is_not_counted_twice():
+    tournament, games, seat_moved = start_tables(10, 5)
+    short, full = games.values()
+    bust(short, 3, seat_moved)
+    # The save of full fails, so its hand ends again on the game as reloaded.
+    reloaded = Game(full.to_row(), [p.to_row() for p in full.players.players])
+    busted = full.players.players[0].user_id
+    ended = []
+    for game in (full, reloaded):
+        game.on_hand_end = lambda game: ended.append(tournament.hand_finished(game))
+        game.players.get_player(busted).stack = 0
+        game.end_hand()
+        if game is full:
+            places = {u: e['place'] for u, e in tournament.entrants.items()}
+    moves, again = ended
+    assert len(moves) == 1 and again == moves
+    assert tournament.remaining == 6 and tournament.entrants[busted]['place'] == 7
+    assert {u: e['place'] for u, e in tournament.entrants.items()} == places
+    assert {p.user_id for p in reloaded.players.players} == \
+        {p.user_id for p in full.players.players}
+    tournament.seat_moved_player(games[moves[0].to_game_id], moves[0])
+    assert sorted(len(seats) for seats in tournament.seats.values()) == [3, 3]
+
+
+def test_changes_stay_pending_until_they_are_marked_saved():
+    tournament, games, seat_moved = start_tables(10, 5)
+    first, second = games.values()
+    bust(first, 2, seat_moved)
+    changes = tournament.get_changes()
+    # As if the transaction they were written in had rolled back.
+    assert tournament.get_changes() == changes
+    written = {u: dict(e) for u, e in tournament.entrants.items()}
+    bust(second, 1, seat_moved)
+    tournament.mark_saved(changes)
+    pending = tournament.get_changes()
+    assert pending['tournament'] == {} and pending['new_entrants'] == []
+    assert {e['user_id'] for e in pending['changed_entrants']} == \
+        {u for u, e in tournament.entrants.items() if e != written[u]} != set()
+    tournament.mark_saved(pending)
+    assert not any(tournament.get_changes().values())
+
+
+def test_tournament_round_trips_through_the_db():
+    db = dataset.connect('sqlite://')
+    create_schema(db)
+    tournament, games, seat_moved = start_tables(10, 5)
+    db['tournaments'].insert(new_tournament('t'))
+    tournament.tournament_id = db['tournaments'].find_one()['tournament_id']
+    for e in tournament.entrants.values():
+        e['tournament_id'] = tournament.tournament_id
+    bust(next(iter(games.values())), 2, seat_moved)
+    save_tournament(db, tournament.tournament_id, tournament.get_changes())
+    loaded = Tournament(get_tournament(db, tournament.tournament_id),
+                        get_entrants(db, tournament.tournament_id))
+    assert loaded.state_cd == 'RUNNING' and loaded.remaining == 8
+    assert loaded.seats == tournament.seats
+    assert loaded.entrants == tournament.entrants
+
+
+def test_scheduler_only_pops_due_events():
+    scheduler = TournamentScheduler()
+    scheduler.schedule(30, 'a', 'level', 1)
+    scheduler.schedule(10, 'b', 'start')
+    scheduler.schedule(20, 'a', 'level', 0)
+    assert scheduler.pop_due(5) == []
+    assert scheduler.pop_due(20) == [(10, 'b', 'start', None), (20, 'a', 'level', 0)]
+    assert scheduler.next_due() == 30 and len(scheduler) == 1
+
+
+def test_tournament_api(tmp_path):
+    app = create_app({'ENV': 'UNITTEST', 'DBCONN': 'sqlite:///{}'.format(tmp_path / 'p.db')})
+    client = app.test_client()
+    headers = []
+    for name in ('t1', 't2', 't3'):
+        client.post('api/user/register', json={'username': name, 'password': name,
+                                               'email': name + '@test.com'})
+        rv = client.post('api/user/login', json={'username': name, 'password': name})
+        headers.append({'x-access-token': rv.json['auth_token']})
+    rv = client.post('api/tournament/', headers=headers[0],
+                     json={'name': 'sunday', 'table_size': 2, 'starting_stack': 500})
+    assert rv.status_code == 201 and rv.json['state_cd'] == 'REGISTERING'
+    tournament_id = rv.json['tournament_id']
+    for h in headers:
+        assert client.post('api/tournament/{}/entrant/'.format(tournament_id),
+                           headers=h).status_code == 200
+    rv = client.post('api/tournament/{}/entrant/'.format(tournament_id), headers=headers[0])
+    assert rv.status_code == 400
+    rv = client.post('api/tournament/{}/start'.format(tournament_id), headers=headers[1])
+    assert rv.status_code == 403
+    rv = client.post('api/tournament/{}/start'.format(tournament_id), headers=headers[0])
+    assert rv.status_code == 200 and rv.json['state_cd'] == 'RUNNING'
+    assert len(rv.json['tables']) == 2 and rv.json['remaining'] == 3
+    rv = client.post('api/poker/{}/player/'.format(rv.json['tables'][0]), headers=headers[0],
+                     json={'seat_num': 2, 'buyin': 500})
+    assert rv.status_code == 400
+    assert client.get('api/tournament/missing').status_code == 404